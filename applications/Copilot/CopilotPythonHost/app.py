@@ -6,14 +6,16 @@ import multiprocessing
 from threading import Thread
 import datetime
 
-# Get access to shared libs one level up (See dockfile)
-if __name__ == '__main__': 
-    sys.path.append(os.path.dirname(os.path.abspath(__file__ + '/../')))
+# Get access to shared libs one level up (See dockfile) - also when imported by main.py
+sys.path.append(os.path.dirname(os.path.abspath(__file__ + '/../')))
 
 from CopilotPythonHost.libs.models import ChatResponse
 from CopilotPythonHost.libs.models.GetIndexDocumentInfo import GetIndexDocumentInfoRequest, GetIndexDocumentInfoResponse
 from shared.indexing.Indexer import PyPdfIndexProcessor
-from shared.indexing.IndexOps import AzureAiIndexOps
+from shared.indexing.IndexOps import AzureAiIndexOps, DefaultIndexDocsPageSize
+from shared.indexing.AsyncIndexOps import SyncIndexOpsFacade
+from shared.indexing.RebuildJobs import get_rebuild_job_store
+from shared.indexing.IndexingStats import get_indexing_stats
 
 # Add access to shared packages from Copilot project root
 sys.path.append(os.path.dirname(os.path.abspath(__file__ + '/../')))
@@ -26,7 +28,7 @@ from flasgger import Swagger, swag_from
 from langsmith import Client
 
 from libs.openai.RAG import RAG
-from shared.ServicesWrapper import ServicesWrapper
+from shared.ServicesWrapper import ServicesWrapper, get_services_wrapper
 from shared.HealthCheck import CopilotHealthChecks
 from shared.Utils import fix_request_date_timestamp, timed, default, DebugMode, fix_request_date
 from libs.models.ChatRequest import ChatRequest
@@ -37,6 +39,7 @@ from libs.models.IndexRebuldRequest import IndexRebuildRequest
 from libs.models.DeleteDocumentRequest import DeleteDocumentRequest
 from libs.models.FindIndexDocuments import FindIndexDocumentsRequest, FindIndexDocumentsResponse, FindIndexDocumentsDocument
 from CopilotPythonHost.libs.models.IndexRebuildResponse import IndexRebuildResponse
+from libs.models.IndexRebuildJob import IndexRebuildJobRequest, IndexRebuildJobStatusResponse, IndexRebuildJobCancelResponse
 from libs.models.DeleteDocumentResponse import DeleteDocumentResponse
 
 from shared.OpenTelemetry import (
@@ -56,6 +59,7 @@ LangsmithEnabled = True
 LangsmithClient = None
 DefaultHost = '0.0.0.0'
 DefaultPort = 8080
+IncrementalSyncOnStartup = (os.environ.get("COPILOT_INCREMENTAL_SYNC_ON_STARTUP") or "true").lower() == "true"
 
 os.environ["COPILOT_SERVER_HOST"] = "0.0.0.0"
 os.environ["OPENAI_API_VERSION"] = "2023-05-15"
@@ -77,19 +81,17 @@ if DebugMode:
 
 # TODO: Move from env vars to passing in index config
 
-if __name__ == '__main__':
-
-    # These need to be set *before* the langchain module is imported to take effect -
-    #   the others above can be set anytime before the dependencies are used.
-    # (Shouldn't be a problem now that we're not setting os.environ at runtime)
-    # https://github.com/langchain-ai/langchain/issues/7813
-    # TODO: pass the schema into the c'tor instead of using env vars
-    # "AZURESEARCH_FIELDS_ID", "AZURESEARCH_FIELDS_CONTENT",
-    # "AZURESEARCH_FIELDS_CONTENT_VECTOR"
+# These need to be set *before* the langchain module is imported to take effect -
+#   the others above can be set anytime before the dependencies are used.
+# (Shouldn't be a problem now that we're not setting os.environ at runtime)
+# https://github.com/langchain-ai/langchain/issues/7813
+# TODO: pass the schema into the c'tor instead of using env vars
+# "AZURESEARCH_FIELDS_ID", "AZURESEARCH_FIELDS_CONTENT",
+# "AZURESEARCH_FIELDS_CONTENT_VECTOR"
 
-    def print_env():
-        for key in os.environ.keys():
-            log_debug(f"{key} = '{os.environ.get(key)}'")
+def print_env():
+    for key in os.environ.keys():
+        log_debug(f"{key} = '{os.environ.get(key)}'")
 
 
 # TODO: Comprare flask-resful (used here) w/plain flask and flask-restx (which also does swagger but differently)
@@ -145,14 +147,14 @@ class HealthzApi(Resource):
 
 # @app.route('/hellopage') def hello(): return "Hello from copilot"
 
-def run_in_background_if_needed(func, id, run_in_background: bool) -> tuple[str, str|None, Any]:
+def run_in_background_if_needed(func, id, run_in_background: bool, job_id: str|None = None) -> tuple[str, str|None, Any]:
     if run_in_background:
-        thread = Thread(target = func, name = id, args=[])
+        thread = Thread(target = func, name = job_id or id, args=[])
         # At this point assume that the appsettings are correct
         thread.start()
-        log_info(f"Started background thread {thread.native_id} for {id}")
+        log_info(f"Started background thread {thread.native_id} for {job_id or id}")
         # TODO: use twinsapi SQL-based jobs api when avail and return job id
-        job_id = f"{id}-{thread.native_id}"
+        job_id = job_id or f"{id}-{thread.native_id}"
         return "Started", job_id, None
     else:
         log_debug(f"Running synchronously: {id}")
@@ -259,14 +261,12 @@ class GetIndexDocumentInfoApi(Resource):
 
             index_name = getinfo_request.index_name or ServicesWrapper.get_default_read_index_name()
             index_ops = AzureAiIndexOps(index_name)
-            response = []
-            for blob_file in getinfo_request.blob_files:
-                # Telemetry metric emitted in get_document_info
-                doc_info = index_ops.get_document_info(blob_file)
+            # Telemetry metric emitted in get_documents_info
+            response = index_ops.get_documents_info(getinfo_request.blob_files)
+            for blob_file, doc_info in zip(getinfo_request.blob_files, response):
                 if not doc_info:
                     msg = f"GetIndexDocumentInfo: '{blob_file}' not found in index" 
                     log_warning(msg)
-                response.append(doc_info)
 
             return jsonify(response)
 
@@ -293,16 +293,42 @@ class FindIndexDocumentsApi(Resource):
 
             index_name = find_request.index_name or ServicesWrapper.get_default_read_index_name()
             index_ops = AzureAiIndexOps(index_name)
-            # Hack: Polymorphic return: return_total_count:true will return (count,docs) - all other callers don't need this and will return docs only
-            total_count, docs = index_ops.find_index_docs(
-                uri = None,
-                copilot_enabled_only = False,
-                update_time = find_request.last_updated_time,
-                doc_type = find_request.document_type,
-                page_size = find_request.page_size,
-                page_number = find_request.page_number,
-                return_total_count = True
-            )
+            # Only the fields of the response - content and metadata only if asked for
+            select_fields = [FieldName_Uri, FieldName_ItemType, FieldName_TotalDocumentLength, FieldName_IndexUpdateTime]
+            if find_request.include_content:
+                select_fields.append(FieldName_Content)
+            if find_request.include_metadata:
+                select_fields.append(FieldName_DocUnstructuredMetadata)
+            continuation_token = None
+            if find_request.continuation_token or (find_request.page_size and find_request.page_number is None):
+                # Keyset paging - later pages cost the same as the first and aren't limited by the max skip
+                try:
+                    # On the shared async index loop - concurrent requests share its connection pool
+                    page = SyncIndexOpsFacade(index_name).find_index_docs_page(
+                        uri = None,
+                        copilot_enabled_only = False,
+                        update_time = find_request.last_updated_time,
+                        doc_type = find_request.document_type,
+                        page_size = find_request.page_size or DefaultIndexDocsPageSize,
+                        continuation_token = find_request.continuation_token,
+                        select_extra_fields = select_fields,
+                        return_total_count = True
+                    )
+                except ValueError as ex:
+                    return f"Invalid request: {ex}", 500
+                total_count, docs, continuation_token = page.total_count, page.docs, page.continuation_token
+            else:
+                # Hack: Polymorphic return: return_total_count:true will return (count,docs) - all other callers don't need this and will return docs only
+                total_count, docs = index_ops.find_index_docs(
+                    uri = None,
+                    copilot_enabled_only = False,
+                    update_time = find_request.last_updated_time,
+                    doc_type = find_request.document_type,
+                    page_size = find_request.page_size,
+                    page_number = find_request.page_number,
+                    select_extra_fields = select_fields,
+                    return_total_count = True
+                )
             # TODO: Move/add metric to find_index_docs which would track internally usages as well?
             MetricFindIndexDocuments(True, nTotal=total_count, nPage=len(docs), 
                                      includeMeta=find_request.include_metadata, 
@@ -310,6 +336,7 @@ class FindIndexDocumentsApi(Resource):
 
             response = FindIndexDocumentsResponse(
                 total_count = total_count,
+                continuation_token = continuation_token,
                 index_documents = [
                     FindIndexDocumentsDocument(
                         id = doc[FieldName_Id],
@@ -352,10 +379,23 @@ class IndexRebuildApi(Resource):
 
             indexer = PyPdfIndexProcessor(index_name_override = index_name)
 
-            if indexer.is_rebuild_in_progress():
+            # Started before the thread so its id can be returned
+            job = indexer.start_rebuild_job(
+                delete_and_recreate_index = index_rebuild_request.delete_and_recreate_index, 
+                generate_summaries_mode = index_rebuild_request.generate_summaries_mode,
+                generate_index_mode = index_rebuild_request.generate_index_mode,
+                chunk_size = index_rebuild_request.chunk_size,
+                chunk_overlap = index_rebuild_request.chunk_overlap,
+                include_chunkdocs_for_copilot_disabled_files = index_rebuild_request.include_chunkdocs_for_copilot_disabled_files,
+                indexing_strategy = index_rebuild_request.indexing_strategy,
+                incremental_sync = default(index_rebuild_request.incremental_sync, False),
+                resume = default(index_rebuild_request.resume, True)
+            )
+            if job is None:
+                running = get_rebuild_job_store().get_running_job()
                 response = IndexRebuildResponse(
                     status = "AlreadyInProgress",
-                    job_id = "" 
+                    job_id = running.job_id if running else ""
                 )
                 return make_response(jsonify(response), 202)
 
@@ -369,12 +409,15 @@ class IndexRebuildApi(Resource):
                     chunk_size = index_rebuild_request.chunk_size,
                     chunk_overlap = index_rebuild_request.chunk_overlap,
                     include_chunkdocs_for_copilot_disabled_files = index_rebuild_request.include_chunkdocs_for_copilot_disabled_files,
-                    indexing_strategy = index_rebuild_request.indexing_strategy
+                    indexing_strategy = index_rebuild_request.indexing_strategy,
+                    incremental_sync = default(index_rebuild_request.incremental_sync, False),
+                    job = job
                 )
 
             status, job_id, _n_docs_processed = run_in_background_if_needed(exec, 
                                             "RebuildIndex",
-                                            default(index_rebuild_request.run_in_background, True))
+                                            default(index_rebuild_request.run_in_background, True),
+                                            job_id = job.job_id)
 
             response = IndexRebuildResponse(
                 status = status,
@@ -386,6 +429,81 @@ class IndexRebuildApi(Resource):
             log_exception(ex)
             return f"Error processing index rebuild: {ex}", 500
 
+class IndexRebuildStatusApi(Resource):
+
+    @swag_from('swagger/IndexRebuildStatus.yml')
+    def post(self):
+        """
+        Return the progress of an index rebuild job - the latest one if no job_id
+        """
+        try:
+            request_json = request.get_json(silent = True) or {}
+            schema_violations: Dict = IndexRebuildJobRequest.Schema().validate(request_json) # pylint: disable=no-member.
+            if len(schema_violations.keys()) > 0:
+                return f"Invalid request: {schema_violations}", 500
+            job_request: IndexRebuildJobRequest = IndexRebuildJobRequest.from_dict(request_json)
+
+            job_status = get_rebuild_job_store().get_job_status(job_request.job_id)
+            if job_status is None:
+                return f"Rebuild job not found: '{job_request.job_id or ''}'", 404
+
+            response = IndexRebuildJobStatusResponse(**job_status.__dict__)
+            return jsonify(response)
+
+        except Exception as ex:
+            log_exception(ex)
+            return f"Error getting index rebuild status: {ex}", 500
+
+class IndexRebuildCancelApi(Resource):
+
+    @swag_from('swagger/IndexRebuildCancel.yml')
+    def post(self):
+        """
+        Cancel the running index rebuild job
+        """
+        try:
+            request_json = request.get_json(silent = True) or {}
+            schema_violations: Dict = IndexRebuildJobRequest.Schema().validate(request_json) # pylint: disable=no-member.
+            if len(schema_violations.keys()) > 0:
+                return f"Invalid request: {schema_violations}", 500
+            job_request: IndexRebuildJobRequest = IndexRebuildJobRequest.from_dict(request_json)
+            log_info(f"IndexRebuildCancelRequest: {job_request}")
+
+            store = get_rebuild_job_store()
+            running = store.get_running_job()
+            cancelled = store.cancel_job(job_request.job_id)
+            response = IndexRebuildJobCancelResponse(
+                status = "Cancelling" if cancelled else "NotRunning",
+                job_id = running.job_id if cancelled else job_request.job_id
+            )
+            return jsonify(response)
+
+        except Exception as ex:
+            log_exception(ex)
+            return f"Error cancelling index rebuild: {ex}", 500
+
+class IndexProgressApi(Resource):
+
+    @swag_from('swagger/IndexProgress.yml')
+    def get(self):
+        """
+        Return the live throughput of indexing, where its time is going, and the slowest
+          documents in flight - plus the running rebuild job if any
+        """
+        try:
+            store = get_rebuild_job_store()
+            running = store.get_running_job()
+            job_status = store.get_job_status(running.job_id) if running else None
+            progress = {
+                "rebuild_job": job_status.__dict__ if job_status else None,
+                **get_indexing_stats().get_progress()
+            }
+            return jsonify(progress)
+
+        except Exception as ex:
+            log_exception(ex)
+            return f"Error getting index progress: {ex}", 500
+
 # TODO: Manage with new twinsapi jobs api
 def create_index_and_start_background_indexing(should_index:bool = True):
     
@@ -396,7 +514,9 @@ def create_index_and_start_background_indexing(should_index:bool = True):
             delete_and_recreate_index = False, 
             generate_summaries_mode = "ifNewer" if should_index else "off",
             generate_index_mode = "ifNewer" if should_index else "off",
-            include_chunkdocs_for_copilot_disabled_files = False
+            include_chunkdocs_for_copilot_disabled_files = False,
+            # Only the day's changes, after the first complete rebuild
+            incremental_sync = IncrementalSyncOnStartup
         )
 
     run_in_background_if_needed( 
@@ -442,7 +562,10 @@ def EnableLangSmith(enable: bool) -> bool:
 def page_not_found(e):
     return jsonify({"error": "Not found"}), 404
 
-if __name__ == '__main__':
+def main():
+    """ Run the app - from main.py, which keeps the main module light for the worker
+    processes that import it (see PdfPageExtractor) """
+    global wsgi_app
 
     try:
         MetricStartup()
@@ -458,6 +581,9 @@ if __name__ == '__main__':
         api.add_resource(HealthzApi,       '/healthz')
         api.add_resource(ChatResponseApi,  '/chat')
         api.add_resource(IndexRebuildApi,  '/index/rebuild')
+        api.add_resource(IndexRebuildStatusApi, '/index/rebuild/status')
+        api.add_resource(IndexRebuildCancelApi, '/index/rebuild/cancel')
+        api.add_resource(IndexProgressApi, '/index/progress')
         api.add_resource(IndexDocumentApi, '/index/add-doc')
         api.add_resource(GetIndexDocumentInfoApi, '/index/doc-info')
         api.add_resource(FindIndexDocumentsApi, '/index/find-index-docs')
@@ -476,6 +602,8 @@ if __name__ == '__main__':
             # If we're not reindex, still call create_or_update_index to make any incremental schema changes
             index_ops = AzureAiIndexOps()
             index_ops.create_or_update_index()
+        # Clients are shared by all requests - create them before the first one
+        get_services_wrapper().warm_up()
 
         if DebugMode:
             # See: https://stackoverflow.com/questions/1435415/python-memory-leaks
@@ -502,3 +630,7 @@ if __name__ == '__main__':
     except Exception as ex:
         MetricInitalized(False)
         log_critical(f"Copilot startup failure: Error in app run: {ex}", exc_info=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,8 @@ class FindIndexDocumentsRequest:
     index_name: Optional[str] = None
     page_size: Optional[int] = None
     page_number: Optional[int] = None
+    # From the previous response - continues after its last document (page_number is ignored)
+    continuation_token: Optional[str] = None
     include_metadata: Optional[bool] = False
     include_content: Optional[bool] = True
 
@@ -46,4 +48,6 @@ class FindIndexDocumentsDocument:
 @dataclass
 class FindIndexDocumentsResponse:
     total_count: int
-    index_documents: List[FindIndexDocumentsDocument]
\ No newline at end of file
+    index_documents: List[FindIndexDocumentsDocument]
+    # Pass in the next request for the following page - none after the last page
+    continuation_token: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,34 @@
+from typing import Optional
+
+#from dataclasses import dataclass
+from dataclasses_json import dataclass_json, LetterCase, Undefined, config
+from marshmallow_dataclass import dataclass
+
+UndefinedBehavior = Undefined.RAISE
+
+@dataclass_json(undefined=UndefinedBehavior)
+@dataclass
+class IndexRebuildJobRequest:
+    # The latest job if omitted
+    job_id: Optional[str] = None
+
+@dataclass_json(undefined=UndefinedBehavior)
+@dataclass
+class IndexRebuildJobStatusResponse:
+    job_id: str
+    index_name: str
+    status: str
+    created_time: str
+    updated_time: str
+    num_blobs: int
+    num_done: int
+    num_failed: int
+    num_remaining: int
+    eta_seconds: Optional[int] = None
+    error: Optional[str] = None
+
+@dataclass_json(undefined=UndefinedBehavior)
+@dataclass
+class IndexRebuildJobCancelResponse:
+    status: str
+    job_id: Optional[str] = None
@@ -20,3 +20,5 @@ class IndexRebuildRequest:
     chunk_overlap: Optional[int] = None
     include_chunkdocs_for_copilot_disabled_files: Optional[bool] = True
     indexing_strategy: Optional[str] = None
+    resume: Optional[bool] = True
+    incremental_sync: Optional[bool] = False
@@ -14,10 +14,12 @@ from langchain_core.documents import Document
 
 from shared.OpenTelemetry import log_debug, log_info, log_warning
 from shared.ServicesWrapper import ServicesWrapper
-from shared.indexing.SearchIndexConfig import FieldName_ContentTokenCount, FieldName_DocUnstructuredMetadata, FieldName_GroupId, FieldName_Id, FieldName_PageNumber, FieldName_Title, FieldName_Content, FieldName_TotalDocumentNumChunks
+from shared.indexing.SearchIndexConfig import FieldName_ChunkIndex, FieldName_ContentTokenCount, FieldName_DocUnstructuredMetadata, FieldName_GroupId, FieldName_Id, FieldName_PageNumber, FieldName_Title, FieldName_Content, FieldName_TotalDocumentNumChunks
 from shared.Utils import pluck, timed, get_num_tokens, DebugMode
+from shared.TokenCounter import estimate_num_tokens
 from shared.Prompts import DocumentChunkPrompt
 from shared.Metadata import Metadata
+from shared.indexing.IndexProjections import Projection_NoVector, get_projection
 
 from langchain.memory.chat_memory import BaseChatMemory
 
@@ -73,7 +75,9 @@ class CustomVectorStoreRetriever(BaseRetriever):
     chunk_id_regex = r"(docChunk-.+-)([0-9]+)$"
 
     def get_doc_chunk_index(self, doc: Document) -> int:
-        #TODO: May want to add chunk_index as index field
+        if doc.metadata.get(FieldName_ChunkIndex) is not None:
+            return int(doc.metadata[FieldName_ChunkIndex])
+        # Chunks indexed before ChunkIndex was added
         id = doc.metadata[FieldName_Id]
         chunk_index = -1 
         match = re.match(self.chunk_id_regex, id)
@@ -149,14 +153,15 @@ class CustomVectorStoreRetriever(BaseRetriever):
         log_info(f"CustomVectorStoreRetriever: extend_chunk: retreiving chunk {new_ci} for {doc.metadata[FieldName_Title]} (dir={direction})")
 
         try:
-            new_index_doc = search_client.get_document(new_id)
+            new_index_doc = search_client.get_document(new_id, selected_fields = get_projection(Projection_NoVector))
             content:str = new_index_doc[FieldName_Content]
             new_doc = Document(
                 page_content = content, 
                 metadata = new_index_doc)
             i = docs.index(doc)
             docs.insert(i+direction, new_doc)
-            n_tokens = get_num_tokens(content)
+            n_tokens = new_index_doc.get(FieldName_ContentTokenCount)
+            n_tokens = int(n_tokens) if n_tokens is not None else get_num_tokens(content)
             return n_tokens, docs
         except Exception as e:
             log_info(f"CustomVectorStoreRetriever: extend_chunk: failed to get chunk {new_ci} for {doc.metadata[FieldName_Title]}")
@@ -168,10 +173,6 @@ class CustomVectorStoreRetriever(BaseRetriever):
         k, search_type, filters = pluck(self.base_retriever.search_kwargs, 'k', 'search_type', 'filters')
         log_debug(f"CustomVectorStoreRetriever: (max_tokens:{self.max_tokens})  k: {k}, search_type: {search_type}, filters: '{filters}', query: '{query}'")
 
-        # NOTE HACK: This is to workaround an apparent recent LC bug where the search_kwargs are not 
-        #  being saved in the retriever we store them in the vectorstore and then copy them here.
-        self.base_retriever.search_kwargs = self.base_retriever.vectorstore.search_kwargs
-
         # TODO: Exactly filling the context with going over is hard - would need to take
         #   chat history and all prompts into account 
         # We could just truncate at the end of the llm chain, assuming we move the context to the end
@@ -198,7 +199,7 @@ class CustomVectorStoreRetriever(BaseRetriever):
             #doc_tokens = int(d.metadata[FieldName_ContentTokenCount])
             doc_tokens = int(d.metadata[FieldName_ContentTokenCount])  \
                         if d.metadata[FieldName_ContentTokenCount] is not None \
-                        else len(d.page_content) // 3
+                        else estimate_num_tokens(d.page_content)
             doc_type = d.metadata.get("ItemType") or "docChunk"
 
             log_debug(f"{doc_type} {i} '{d.metadata[FieldName_Title]}':, doc_tokens: {doc_tokens}, total_tokens_used: {total_tokens}")
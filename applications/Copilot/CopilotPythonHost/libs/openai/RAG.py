@@ -24,7 +24,7 @@ from libs.models.ChatResponse import ChatResponse, ChatResponseDebugInfo, ChatRe
 # Add access to shared packages from Copilot project root
 #sys.path.append(os.path.dirname(os.path.abspath(__file__ + '/../../../')))
 from shared.HealthCheck import CopilotHealthChecks
-from shared.ServicesWrapper import ServicesWrapper, TokenLimits
+from shared.ServicesWrapper import ServicesWrapper, TokenLimits, get_services_wrapper
 from shared.Utils import timed, DebugMode
 from shared.Citations import get_citations
 from shared.indexing.IndexOps import AzureAiIndexOps
@@ -71,7 +71,7 @@ class RAG:
         # Set this here after init so can use memory-injected IndexName runflag
         self._index_name = self._index_name or self._chat_request.get_options().get_index_name()
         if not self._service_wrapper:
-            self._service_wrapper = ServicesWrapper(index_name = self._index_name)
+            self._service_wrapper = get_services_wrapper(self._index_name)
         return self._service_wrapper
 
     def get_chat_response(self) -> ChatResponse: 
@@ -0,0 +1,10 @@
+"""Entry point of the Copilot host: python main.py
+
+Kept import-light - multiprocessing worker processes (the PdfPageExtractor pool) import
+the main module as __mp_main__, and running app.py as main would load Flask, langchain,
+the Azure SDKs and the telemetry config in every worker.
+"""
+
+if __name__ == '__main__':
+    from app import main
+    main()
@@ -0,0 +1,75 @@
+"""Compare TextChunker and OffsetTextChunker output and speed on synthetic documents.
+
+Run from the Copilot directory:
+    python Experiments/BenchmarkTextChunker.py [num_pages] [chars_per_page]
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.append( os.getcwd())
+from shared.indexing.TextChunker import (
+    TextChunker, OffsetTextChunker,
+    chunk_pages_simple_text_overlap, chunk_pages_page_with_overlap
+)
+
+
+def make_pages(num_pages: int, chars_per_page: int, seed: int = 42) -> list[str]:
+    rnd = random.Random(seed)
+    words = ["pump", "valve", "chiller", "  ", "maintenance", "\n", "temperature", "   ", "pressure", "schedule"]
+    pages = []
+    for _ in range(num_pages):
+        # Vary page length - real documents have near-empty and very dense pages
+        n = int(chars_per_page * rnd.uniform(0.05, 2.0))
+        text = []
+        length = 0
+        while length < n:
+            w = rnd.choice(words)
+            text.append(w)
+            length += len(w) + 1
+        pages.append(' '.join(text))
+    return pages
+
+
+def run(chunk_fn, pages, chunk_size, overlap, chunker_class) -> tuple[float, list]:
+    start = time.perf_counter()
+    chunks = list(chunk_fn(pages, chunk_size, overlap, chunker_class = chunker_class))
+    return time.perf_counter() - start, chunks
+
+
+def compare(pages: list[str], chunk_size: int, overlap: int) -> bool:
+    all_identical = True
+    for chunk_fn in [chunk_pages_simple_text_overlap, chunk_pages_page_with_overlap]:
+        t_old, old_chunks = run(chunk_fn, pages, chunk_size, overlap, TextChunker)
+        t_new, new_chunks = run(chunk_fn, pages, chunk_size, overlap, OffsetTextChunker)
+
+        identical = [(c.Content, c.Page) for c in old_chunks] == [(c.Content, c.Page) for c in new_chunks]
+        n_multi_page = sum(1 for c in new_chunks if c.LastPage != c.Page)
+        print(f"  {chunk_fn.__name__:34} size:{chunk_size:5} overlap:{overlap:4} chunks:{len(new_chunks):7} "
+              f"multi-page:{n_multi_page:6} TextChunker:{t_old:8.3f}s OffsetTextChunker:{t_new:8.3f}s "
+              f"speedup:{t_old/max(t_new, 1e-9):6.1f}x identical:{identical}")
+        all_identical = all_identical and identical
+    return all_identical
+
+
+if __name__ == '__main__':
+    num_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    chars_per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    documents = [
+        (f"{num_pages} pages of ~{chars_per_page} chars", make_pages(num_pages, chars_per_page)),
+        # e.g. text files or pdfs that come out as one very long page
+        ("4 pages of ~1M chars", make_pages(4, 1_000_000)),
+    ]
+
+    all_identical = True
+    for (name, pages) in documents:
+        print(f"{name}: {sum(len(p) for p in pages):,} chars")
+        # Indexer defaults first
+        for (chunk_size, overlap) in [(4000, 200), (1000, 100), (200, 50)]:
+            all_identical = compare(pages, chunk_size, overlap) and all_identical
+
+    if not all_identical:
+        print("Chunker output differs")
+        sys.exit(1)
@@ -0,0 +1,117 @@
+"""Compare peak memory of streaming one large document through embedding and upload with
+vectors as lists of python floats (the previous path) and as float32 numpy arrays.
+
+The embeddings service and the search service are replaced by local fakes - the upload
+fake serializes the request body the same way the SDK would send it, then discards it.
+
+Run from the Copilot directory:
+    python Experiments/BenchmarkVectorMemory.py [num_chunks] [dims]
+"""
+import os
+import sys
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.append( os.getcwd())
+# Measure the vector path, not the cache
+os.environ["COPILOT_EMBEDDING_CACHE_MAX_ROWS"] = "0"
+# The fake search client below is sync - upload on the calling thread
+os.environ["COPILOT_ASYNC_INDEX_IO"] = "false"
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+from azure.search.documents.models import IndexingResult
+from shared.indexing.SearchIndexConfig import FieldName_Content, FieldName_Vector, FieldName_Id
+from shared.indexing.IndexOps import AzureAiIndexOps, IndexDocumentInfo, IndexDocumentChunk
+
+
+class FakeServices:
+    _vector_index_name = "benchmark"
+
+    def __init__(self) -> None:
+        self.search_client = SearchClient("https://benchmark.search.windows.net", "benchmark", AzureKeyCredential("key"))
+        documents = self.search_client._client.documents
+        self.payload_bytes = 0
+
+        def index(batch, **kwargs):
+            if isinstance(batch, bytes):
+                payload = batch
+            else:
+                # What the generated client does with an IndexBatch model
+                payload = json.dumps(documents._serialize.body(batch, "IndexBatch")).encode('utf-8')
+            self.payload_bytes += len(payload)
+            ids = [d[FieldName_Id] for d in json.loads(payload)["value"]]
+            return type("IndexDocumentsResult", (), {
+                "results": [IndexingResult.deserialize({"key": id, "status": True, "statusCode": 201}) for id in ids]
+            })
+        documents.index = index
+
+    def get_search_client(self, index_name: str = None) -> SearchClient:
+        return self.search_client
+
+    def get_embeddings_deployment_name(self) -> str:
+        return "benchmark"
+
+
+class FloatListIndexOps(AzureAiIndexOps):
+    """ The previous vector path - each vector a list of python floats, serialized by the SDK """
+
+    def _add_embeddings(self, doc_dicts, file = None):
+        vector_embeddings = self._embed_documents([d[FieldName_Content] for d in doc_dicts])
+        for i in range(len(doc_dicts)):
+            doc_dicts[i][FieldName_Vector] = np.array(vector_embeddings[i], dtype = np.float32).tolist()
+
+    def upload_documents(self, docs):
+        response = self.services.get_search_client().upload_documents(docs)
+        if not all([r.succeeded for r in response]):
+            raise Exception(response)
+
+
+def make_chunks(num_chunks: int, chunk_chars: int = 1000, seed: int = 42) -> list[IndexDocumentChunk]:
+    rnd = random.Random(seed)
+    words = ["pump", "valve", "chiller", "maintenance", "temperature", "pressure", "schedule"]
+    chunks = []
+    for i in range(num_chunks):
+        text = ' '.join(rnd.choice(words) for _ in range(chunk_chars // 8))
+        chunks.append(IndexDocumentChunk(Content = text, PageNumber = i // 3 + 1,
+                                         ContentTokenCount = len(text) // 4, ContentLength = len(text)))
+    return chunks
+
+
+def run(index_ops_class, chunks: list[IndexDocumentChunk], dims: int) -> tuple[int, float, int]:
+    services = FakeServices()
+    index_ops = index_ops_class(services = services)
+    rng = np.random.default_rng(0)
+    # The embeddings service returns lists of python floats
+    index_ops._embed_documents = lambda texts: [rng.standard_normal(dims).tolist() for _ in texts]
+    doc_info = IndexDocumentInfo(Title = "manual.pdf", Uri = "https://benchmark/manual.pdf", RequestedChunkSize = 4000,
+                                 TotalDocumentNumChunks = len(chunks), TotalDocumentLength = sum(c.ContentLength for c in chunks),
+                                 DocLastUpdateTime = datetime.now(timezone.utc))
+
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    index_ops.add_doc_index_chunks_to_index(iter(chunks), doc_info, file = "manual.pdf")
+    seconds = time.perf_counter() - start
+    return tracemalloc.get_traced_memory()[1] - start_bytes, seconds, services.payload_bytes
+
+
+if __name__ == '__main__':
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    dims = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+
+    chunks = make_chunks(num_chunks)
+    print(f"Document of {num_chunks} chunks, {dims}-dim vectors")
+    tracemalloc.start()
+    results = {}
+    for name, index_ops_class in [("float lists", FloatListIndexOps), ("float32 arrays", AzureAiIndexOps)]:
+        peak, seconds, payload_bytes = run(index_ops_class, chunks, dims)
+        results[name] = peak
+        print(f"  {name:15} peak:{peak / 2**20:8.1f} MB  time:{seconds:7.2f}s  uploaded:{payload_bytes / 2**20:8.1f} MB")
+    tracemalloc.stop()
+    print(f"  peak memory reduced {results['float lists'] / max(results['float32 arrays'], 1):.1f}x")
@@ -0,0 +1,322 @@
+"""Behaviour tests of incremental sync (deleting the docs of deleted blobs, the sync watermark)
+and of resuming interrupted rebuild jobs.
+
+Search, embeddings and chat use the in-process local backend, the blob container is a fake
+listing and the PDF text is made up. Tokens are counted with a byte-level encoding built here
+rather than the cl100k download, so nothing needs the network.
+
+Run from the Copilot directory:
+    python Experiments/TestRebuildSync.py [test name ...]
+"""
+import io
+import os
+import sys
+import tempfile
+import traceback
+import urllib.parse
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import tiktoken
+
+sys.path.append( os.getcwd())
+os.environ["COPILOT_BACKEND"] = "local"
+os.environ["COPILOT_EMBEDDING_CACHE_MAX_ROWS"] = "0"
+os.environ["COPILOT_PAGE_TEXT_CACHE_MAX_MB"] = "0"
+os.environ.setdefault("VECTOR_INDEX_NAME", "test-rebuild-sync")
+os.environ.setdefault("BlobStorage__AccountName", "testaccount")
+os.environ.setdefault("BlobStorage__ContainerName", "testdocuments")
+
+import shared.indexing.Indexer as Indexer
+import shared.indexing.RebuildJobs as RebuildJobs
+from shared.indexing.BlobOps import BlobOps
+from shared.indexing.IndexOps import IndexDocumentChunk, IndexDocumentInfo
+from shared.indexing.RebuildJobs import JobStatus_Cancelled, JobStatus_Completed, JobStatus_Interrupted, RebuildJobStore
+from shared.TokenCounter import get_token_counter
+
+
+def get_offline_encoding() -> tiktoken.Encoding:
+    """ A byte-level encoding with the cl100k split pattern - counts are close enough for chunking """
+    ranks = {bytes([i]): i for i in range(256)}
+    pattern = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+    return tiktoken.Encoding("offline", pat_str = pattern, mergeable_ranks = ranks, special_tokens = {})
+
+get_token_counter()._encoding = get_offline_encoding()
+
+
+class Patches:
+    """ Attributes replaced for one test, and put back after it """
+
+    def __init__(self) -> None:
+        self._originals = []
+
+    def setattr(self, target, name: str, value) -> None:
+        self._originals.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    def setenv(self, name: str, value: str) -> None:
+        self._originals.append((os.environ, name, os.environ.get(name)))
+        os.environ[name] = value
+
+    def undo(self) -> None:
+        while self._originals:
+            target, name, value = self._originals.pop()
+            if target is not os.environ:
+                setattr(target, name, value)
+            elif value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+# The blobs of the fake container, by name
+blobs = {}
+# The blobs rebuild_index processed
+processed = []
+
+
+class FakeContentSettings(dict):
+    def __init__(self) -> None:
+        super().__init__(content_type = "application/pdf")
+        self.content_md5 = None
+
+
+def add_blob(name: str, size: int = 1000, modified: datetime|None = None) -> SimpleNamespace:
+    blobs[name] = SimpleNamespace(
+        name = name,
+        size = size,
+        last_modified = modified or datetime.now(timezone.utc) - timedelta(hours = 1),
+        metadata = {"documentTwinMetadata": '{"customProperties":{"copilot":{}}}'},
+        deleted = False,
+        etag = uuid.uuid4().hex,
+        content_settings = FakeContentSettings())
+    return blobs[name]
+
+
+class FakeBlobOps(BlobOps):
+    def __init__(self, file: str = None, container: str|None = None) -> None:
+        self.blob_name = file
+        self.container = container
+
+    def get_blob_properties(self):
+        return blobs[self.blob_name]
+
+    def file_looks_like(self, file_type, blob_props = None) -> bool:
+        return True
+
+    def get_blob_name(self) -> str:
+        return self.blob_name
+
+    def get_blob_list(self, include_metadata = False):
+        return list(blobs.values())
+
+    def get_blob_client(self):
+        return SimpleNamespace(exists = lambda: False, blob_name = self.blob_name)
+
+    def write_all(self, text) -> None:
+        pass
+
+    def get_blob_stream(self) -> io.BytesIO:
+        return io.BytesIO(b"%PDF")
+
+
+def get_fake_pages(self, blob_ops, strategy = None, blob_md5 = None, stream = None):
+    return [f"page one of {blob_ops.blob_name} about chillers " * 50, "page two about pumps " * 20]
+
+
+def new_processor(patches: Patches, jobs_path: str) -> Indexer.PyPdfIndexProcessor:
+    """ A processor of a new index, with the fake container and a jobs db of its own """
+    blobs.clear()
+    processed.clear()
+    patches.setattr(Indexer, "BlobOps", FakeBlobOps)
+    patches.setattr(Indexer.PyPdfIndexProcessor, "get_pages_from_pdf_blob", get_fake_pages)
+    # Blobs modified close to the watermark are checked again - see test_sync_rechecks_blobs_near_watermark
+    patches.setattr(Indexer, "SyncWatermarkOverlapSeconds", 0)
+    # rebuild_index processes each blob with a processor of its own
+    add_pdf_file_to_index = Indexer.PyPdfIndexProcessor.add_pdf_file_to_index
+    def add_and_record(self, file, *args, **kwargs):
+        processed.append(file)
+        return add_pdf_file_to_index(self, file, *args, **kwargs)
+    patches.setattr(Indexer.PyPdfIndexProcessor, "add_pdf_file_to_index", add_and_record)
+    patches.setattr(RebuildJobs, "_rebuild_job_store", RebuildJobStore(jobs_path))
+    processor = Indexer.PyPdfIndexProcessor(f"test-{uuid.uuid4().hex[:8]}")
+    processor.index_ops.create_or_update_index()
+    return processor
+
+
+def sync(processor: Indexer.PyPdfIndexProcessor) -> list:
+    processed.clear()
+    processor.rebuild_index(delete_and_recreate_index = False, num_threads = 1, incremental_sync = True)
+    return sorted(processed)
+
+
+def indexed_uris(processor: Indexer.PyPdfIndexProcessor) -> set:
+    docs = processor.index_ops.find_index_docs(None, copilot_enabled_only = False, select_extra_fields = ["Uri"])
+    return {d["Uri"] for d in docs}
+
+
+def uri(name: str) -> str:
+    return f"{BlobOps.file_prefix}/{name}"
+
+
+def test_sync_deletes_docs_of_deleted_blobs(processor, patches, jobs_path):
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        add_blob(name)
+    assert sync(processor) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert indexed_uris(processor) == {uri("a.pdf"), uri("b.pdf"), uri("c.pdf")}
+
+    del blobs["b.pdf"]
+    assert sync(processor) == []
+    assert indexed_uris(processor) == {uri("a.pdf"), uri("c.pdf")}
+
+
+def test_sync_replaces_docs_of_renamed_blob(processor, patches, jobs_path):
+    add_blob("manual.pdf")
+    add_blob("other.pdf")
+    sync(processor)
+
+    renamed = blobs.pop("manual.pdf")
+    renamed.name = "manual-v2.pdf"
+    blobs[renamed.name] = renamed
+    # Renaming doesn't change last_modified - the new name is synced as it's not in the index
+    assert sync(processor) == ["manual-v2.pdf"]
+    assert indexed_uris(processor) == {uri("manual-v2.pdf"), uri("other.pdf")}
+
+
+def test_sync_keeps_docs_of_url_encoded_names(processor, patches, jobs_path):
+    for name in ["Spaced Name (v2).pdf", "100%.pdf", "dir/sub dir/nested.pdf"]:
+        add_blob(name)
+    sync(processor)
+    # A doc of an existing blob added with its url-encoded uri, as the blob client's url has it
+    encoded_uri = f"{BlobOps.file_prefix}/{urllib.parse.quote('Spaced Name (v2).pdf')}"
+    info = IndexDocumentInfo(Title = "Spaced Name (v2).pdf", Uri = encoded_uri, RequestedChunkSize = 4000,
+                             TotalDocumentNumChunks = 1, TotalDocumentLength = 10, DocLastUpdateTime = datetime.now(timezone.utc))
+    processor.index_ops.add_doc_index_chunks_to_index(
+        iter([IndexDocumentChunk(Content = "encoded uri chunk", PageNumber = 1, ContentTokenCount = 3, ContentLength = 17)]),
+        info, file = encoded_uri)
+    uris = indexed_uris(processor)
+    assert encoded_uri in uris and uri("100%.pdf") in uris and uri("dir/sub dir/nested.pdf") in uris
+
+    assert sync(processor) == []
+    assert indexed_uris(processor) == uris
+
+
+def test_sync_deletes_nothing_when_container_listing_is_empty(processor, patches, jobs_path):
+    add_blob("a.pdf")
+    sync(processor)
+
+    blobs.clear()
+    sync(processor)
+    assert indexed_uris(processor) == {uri("a.pdf")}
+
+
+def test_sync_processes_blobs_changed_since_watermark(processor, patches, jobs_path):
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        add_blob(name)
+    assert sync(processor) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert sync(processor) == []
+
+    blobs["b.pdf"].last_modified = datetime.now(timezone.utc)
+    add_blob("d.pdf", modified = datetime.now(timezone.utc))
+    assert sync(processor) == ["b.pdf", "d.pdf"]
+
+
+def test_sync_processes_blobs_forced_by_config(processor, patches, jobs_path):
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        add_blob(name)
+    sync(processor)
+    assert sync(processor) == []
+
+    # Set after the docs were indexed - every blob is reindexed, once
+    patches.setenv("FORCE_REINDEX_LASTUPDATETIME", datetime.now(timezone.utc).isoformat())
+    assert sync(processor) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert sync(processor) == []
+
+    patches.setenv("FORCE_SUMMARY_LASTUPDATETIME", datetime.now(timezone.utc).isoformat())
+    assert sync(processor) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert sync(processor) == []
+
+
+def test_sync_rechecks_blobs_near_watermark(processor, patches, jobs_path):
+    now = datetime.now(timezone.utc)
+    add_blob("old.pdf", modified = now - timedelta(hours = 2))
+    add_blob("near.pdf", modified = now - timedelta(minutes = 2))
+    add_blob("newest.pdf", modified = now)
+    sync(processor)
+
+    # A blob written while the last sync listed the container can have an older last_modified
+    patches.setattr(Indexer, "SyncWatermarkOverlapSeconds", 300)
+    assert sync(processor) == ["near.pdf", "newest.pdf"]
+
+
+def test_rebuild_resumes_interrupted_job(processor, patches, jobs_path):
+    for name in ["a.pdf", "b.pdf", "c.pdf", "d.pdf", "e.pdf"]:
+        add_blob(name, size = 1000 + len(blobs))
+    store = RebuildJobs.get_rebuild_job_store()
+    add_and_record = Indexer.PyPdfIndexProcessor.add_pdf_file_to_index
+    def add_and_cancel(self, file, *args, **kwargs):
+        result = add_and_record(self, file, *args, **kwargs)
+        if len(processed) == 2:
+            store.cancel_job(None)
+        return result
+    patches.setattr(Indexer.PyPdfIndexProcessor, "add_pdf_file_to_index", add_and_cancel)
+
+    processor.rebuild_index(delete_and_recreate_index = False, num_threads = 1)
+    cancelled = store.get_job_status()
+    assert cancelled.status == JobStatus_Cancelled
+    assert (cancelled.num_done, cancelled.num_remaining) == (2, 3)
+    first_blobs = list(processed)
+
+    # A restart - the reopened store finds the job cancelled, and resumes it
+    patches.setattr(RebuildJobs, "_rebuild_job_store", RebuildJobStore(jobs_path))
+    patches.setattr(Indexer.PyPdfIndexProcessor, "add_pdf_file_to_index", add_and_record)
+    processed.clear()
+    blobs[first_blobs[0]].etag = "changed"
+    processor.rebuild_index(delete_and_recreate_index = False, num_threads = 1)
+
+    resumed = RebuildJobs.get_rebuild_job_store().get_job_status()
+    assert resumed.job_id == cancelled.job_id
+    assert resumed.status == JobStatus_Completed
+    assert (resumed.num_done, resumed.num_remaining) == (5, 0)
+    # Only the blobs not done - and the done one whose etag changed since
+    assert sorted(processed) == sorted(set(blobs) - set(first_blobs[1:]))
+
+
+def test_job_running_at_exit_is_interrupted_and_resumable(processor, patches, jobs_path):
+    path = jobs_path + ".other"
+    params = {"generate_index_mode": "ifNewer"}
+    job = RebuildJobStore(path).start_job("index", params)
+
+    # The process exits without ending the job
+    store = RebuildJobStore(path)
+    assert store.get_job_status(job.job_id).status == JobStatus_Interrupted
+
+    assert store.start_job("other-index", params).job_id != job.job_id
+    store.end_job(store.get_running_job())
+    assert store.start_job("index", {"generate_index_mode": "force"}).job_id != job.job_id
+    store.end_job(store.get_running_job())
+    resumed = store.start_job("index", params)
+    assert resumed.job_id == job.job_id and resumed.resumed
+    store.end_job(resumed)
+    assert store.start_job("index", params).job_id != job.job_id
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or [name for name in list(globals()) if name.startswith("test_")]
+    failed = []
+    for name in names:
+        patches = Patches()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            try:
+                jobs_path = os.path.join(temp_dir, "jobs.sqlite")
+                globals()[name](new_processor(patches, jobs_path), patches, jobs_path)
+                print(f"PASS {name}")
+            except Exception:
+                traceback.print_exc()
+                print(f"FAIL {name}")
+                failed.append(name)
+            finally:
+                patches.undo()
+    print(f"{len(names) - len(failed)} passed, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
@@ -22,6 +22,11 @@ setx FORCE_REINDEX_LASTUPDATETIME "2024-06-11T08:58:14.781066"
 setx FORCE_SUMMARY_LASTUPDATETIME "2024-06-11T08:58:14.781066"
 setx SUMMARY_GENERATION_ENABLED "true"
 setx INDEX_ON_STARTUP "false"
+# Startup indexing only processes the blobs changed since the last complete rebuild - its sync
+#  watermark, and the rebuild checkpoints, are kept in the COPILOT_REBUILD_JOBS_DB SQLite db
+#  (required for incremental sync - in memory if not set, so lost on restart)
+setx COPILOT_INCREMENTAL_SYNC_ON_STARTUP "true"
+setx COPILOT_REBUILD_JOBS_DB "$env:LOCALAPPDATA\copilot\rebuild-jobs.sqlite"
 
 setx AZURESEARCH_FIELDS_ID "Id"
 setx AZURESEARCH_FIELDS_CONTENT "Content"
@@ -70,14 +70,35 @@ MerticCounterInfo = [
     ("Copilot.GetDocumentInfoCount", "Count of document info requests"),
     ("Copilot.FindIndexDocumentsCount", "Count of find index document requests"),
     ("Copilot.IndexRebuildRequestCount", "Count of index rebuild requests"),
-    ("Copilot.CreateSummaryCount", "Count of summary creation")
+    ("Copilot.CreateSummaryCount", "Count of summary creation"),
+    ("Copilot.TokenCountCount", "Count of token count encode calls"),
+    ("Copilot.EmbeddingCacheHitCount", "Count of embedding vectors found in the local cache"),
+    ("Copilot.EmbeddingCacheMissCount", "Count of embedding vectors not found in the local cache"),
+    ("Copilot.EmbeddingRequestCount", "Count of embeddings requests"),
+    ("Copilot.IndexUploadBatchCount", "Count of index upload batches"),
+    ("Copilot.IndexUploadDocumentCount", "Count of documents sent in index upload batches"),
+    ("Copilot.IndexUploadByteCount", "Count of bytes sent in index upload batches"),
+    ("Copilot.IndexingByteCount", "Count of blob bytes downloaded for indexing"),
+    ("Copilot.IndexingPageCount", "Count of pdf pages extracted for indexing"),
+    ("Copilot.IndexingChunkCount", "Count of document chunks indexed"),
+    ("Copilot.IndexingDocumentCount", "Count of documents processed for indexing")
 ]
 
 MetricHistogramInfo = [
     ("Copilot.ChatRequestDuration", "Duration of succesful chat request", "ms"),
     ("Copilot.IndexDocumentDuration", "Duration of document indexing", "ms"),
     ("Copilot.IndexRebuildDuration", "Duration of index rebuild", "ms"),
-    ("Copilot.CreateSummaryDuration", "Duration of summary creation", "ms")
+    ("Copilot.CreateSummaryDuration", "Duration of summary creation", "ms"),
+    ("Copilot.TokenCountDuration", "Duration of encoding text to count tokens", "ms"),
+    ("Copilot.EmbeddingRequestDuration", "Duration of embeddings requests", "ms"),
+    ("Copilot.IndexUploadBatchDuration", "Duration of index upload batches", "ms"),
+    ("Copilot.RebuildDocumentPredictedDuration", "Predicted duration of indexing a document in a rebuild", "ms"),
+    ("Copilot.RebuildDocumentActualDuration", "Actual duration of indexing a document in a rebuild", "ms"),
+    ("Copilot.IndexingStageDuration", "Duration of a stage of indexing a document", "ms")
+]
+
+MetricUpDownCounterInfo = [
+    ("Copilot.IndexingStageInFlight", "Number of indexing stages running"),
 ]
 
 copilot_meter = None
@@ -111,7 +132,7 @@ def _configure_cloud_logger(base_logger):
     #    created before the actual instruments are.
     views = [
             View(instrument_name=info[0].lower(), name=info[0]) 
-        for info in MerticCounterInfo + MetricHistogramInfo
+        for info in MerticCounterInfo + MetricHistogramInfo + MetricUpDownCounterInfo
     ]
     metrics.set_meter_provider(MeterProvider(
         metric_readers=[reader], 
@@ -176,6 +197,7 @@ def log_critical(*args, **kwargs): logger.critical(*args, stacklevel=_stack_leve
 
 TeleCounters = {}
 TeleHistograms = {}
+TeleUpDownCounters = {}
 
 if copilot_meter:
 
@@ -192,8 +214,17 @@ if copilot_meter:
                                                 unit=unit) 
         for name, desc, unit in MetricHistogramInfo
     }
-    StatusOK = {"Status": "OK"}
-    StatusFailed = {"Status": "Failed"}
+    TeleUpDownCounters = {
+            name: copilot_meter.create_up_down_counter(name=name, 
+                                                      description=desc, 
+                                                      unit="count") 
+        for name, desc in MetricUpDownCounterInfo
+    }
+
+# Defined whether or not there's a meter - the wrappers build their dimensions before
+#  BumpCounter/RecordHistogram check for one
+StatusOK = {"Status": "OK"}
+StatusFailed = {"Status": "Failed"}
 
 
 # Create convenience fns for adding metadata to the instruments.
@@ -214,6 +245,10 @@ def RecordHistogram(name, value, extra_info: Dict[str,Any] = {}):
 def RecordHistogramStatus(name, value, ok = True): 
     RecordHistogram(name, value, Status(ok))
 
+def AddUpDownCounter(name, value, extra_info: Dict[str,Any] = {}): 
+    if not copilot_meter: return
+    TeleUpDownCounters[name].add(value, {**custom_dimensions, **extra_info})
+
 # Define wrappers for individual metrics
 
 def MetricInitalized(ok = True): 
@@ -276,6 +311,46 @@ def MetricCreateSummary(duration:int, ok:bool, summary_mode:str, from_cache:bool
                                })
 
 
+def MetricTokenCount(duration:int, n_texts:int, n_cached:int): 
+    BumpCounter("Copilot.TokenCountCount", { "TextCount": n_texts, "CachedCount": n_cached })
+    RecordHistogram("Copilot.TokenCountDuration", duration, { "Batch": n_texts > 1 })
+
+def MetricEmbeddingCache(n_hits:int, n_misses:int): 
+    if n_hits:
+        BumpCounter("Copilot.EmbeddingCacheHitCount", {}, n_hits)
+    if n_misses:
+        BumpCounter("Copilot.EmbeddingCacheMissCount", {}, n_misses)
+
+def MetricEmbeddingRequest(duration:int, ok:bool, n_texts:int, throttled:bool = False): 
+    BumpCounter("Copilot.EmbeddingRequestCount", { **Status(ok), "TextCount": n_texts, "Throttled": throttled })
+    RecordHistogram("Copilot.EmbeddingRequestDuration", duration, Status(ok))
+
+def MetricIndexUpload(duration:int, ok:bool, action:str, n_docs:int, n_bytes:int): 
+    BumpCounter("Copilot.IndexUploadBatchCount", { **Status(ok), "Action": action })
+    BumpCounter("Copilot.IndexUploadDocumentCount", { "Action": action }, n_docs)
+    BumpCounter("Copilot.IndexUploadByteCount", { "Action": action }, n_bytes)
+    RecordHistogram("Copilot.IndexUploadBatchDuration", duration, { **Status(ok), "Action": action })
+
+IndexingThroughputCounters = {
+    "bytes": "Copilot.IndexingByteCount",
+    "pages": "Copilot.IndexingPageCount",
+    "chunks": "Copilot.IndexingChunkCount",
+    "documents": "Copilot.IndexingDocumentCount",
+}
+
+def MetricIndexingStage(stage:str, duration:int): 
+    RecordHistogram("Copilot.IndexingStageDuration", duration, { "Stage": stage })
+
+def MetricIndexingInFlight(stage:str, delta:int): 
+    AddUpDownCounter("Copilot.IndexingStageInFlight", delta, { "Stage": stage })
+
+def MetricIndexingThroughput(name:str, count:int): 
+    BumpCounter(IndexingThroughputCounters[name], {}, count)
+
+def MetricRebuildDocumentCost(predicted:int, actual:int, needs_contents:bool): 
+    RecordHistogram("Copilot.RebuildDocumentPredictedDuration", predicted, { "NeedsContents": needs_contents })
+    RecordHistogram("Copilot.RebuildDocumentActualDuration", actual, { "NeedsContents": needs_contents })
+
 
 """
 # TODO: finish nested trace/context support
@@ -1,8 +1,9 @@
 # pylint: disable=broad-exception-caught.
-from typing import ( List, Optional )
+from typing import ( Dict, List, Optional )
 
 import os
 import re
+import threading
 from dataclasses import dataclass
 from urllib import response
 
@@ -24,11 +25,29 @@ from langchain.schema import HumanMessage
 from azure.search.documents import SearchClient
 
 from azure.search.documents.indexes import SearchIndexClient
-from shared.indexing.SearchIndexConfig import IndexFields
+from shared.indexing.SearchIndexConfig import IndexFields, FieldName_Content, FieldName_Vector
+from shared.indexing.IndexProjections import ProjectedAzureSearch
+from shared.local.LocalSearch import LocalSearchEndpoint, LocalSearchIndexClient, LocalVectorStore
+from shared.local.LocalEmbeddings import HashEmbeddings, LocalEmbeddingDimensions
+from shared.local.LocalChat import create_local_chat_model
 
 DefaultTemperatureModelSmall = 0.1 # default is 1.0 for GPT3.5
 DefaultTemperatureModelLarge = 0.2 # default is 0.7 for GPT4
 
+# Backends of the search, embeddings and chat services - local ones run in-process with no
+#  Azure services, for benchmarks, load tests and offline development (see shared/local)
+Backend_Azure = "azure"
+Backend_Local = "local"
+LocalChatDeploymentName = "local-chat"
+
+def get_backend(service: str) -> str:
+    """ The backend for service (SEARCH | EMBEDDINGS | CHAT) - from COPILOT_<service>_BACKEND, 
+    or COPILOT_BACKEND for all of them """
+    backend = (os.environ.get(f"COPILOT_{service}_BACKEND") or os.environ.get("COPILOT_BACKEND") or Backend_Azure).lower()
+    if backend not in (Backend_Azure, Backend_Local):
+        raise ValueError(f"Invalid backend for {service}: '{backend}' (must be {Backend_Azure} or {Backend_Local})")
+    return backend
+
 # Note: For langchain integration use azure.search.docuents==11.4.0b8
 # don't update to latest until missing Vector fixed:
 #   https://github.com/langchain-ai/langchain/discussions/13245
@@ -61,7 +80,14 @@ class ServicesWrapper:
         self._throw_exceptions = throw_exceptions
         self._in_startup = in_startup
 
-        self._chat_deployment_name = os.environ.get("CHAT_DEPLOYMENT_NAME")
+        self._search_backend = get_backend("SEARCH")
+        self._embeddings_backend = get_backend("EMBEDDINGS")
+        self._chat_backend = get_backend("CHAT")
+        if Backend_Local in (self._search_backend, self._embeddings_backend, self._chat_backend):
+            log_info(f"Backends - search: {self._search_backend}, embeddings: {self._embeddings_backend}, chat: {self._chat_backend}")
+
+        self._chat_deployment_name = os.environ.get("CHAT_DEPLOYMENT_NAME") \
+                or (LocalChatDeploymentName if self._chat_backend == Backend_Local else None)
         self._chat_deployment_name_small = \
             os.environ.get("CHAT_DEPLOYMENT_NAME_SMALL") or self._chat_deployment_name
         self._chat_deployment_name_large = \
@@ -71,10 +97,13 @@ class ServicesWrapper:
         if not self._chat_deployment_name_large:
             raise ValueError("CHAT_DEPLOYMENT_NAME(_LARGE) not set")
 
-        self._embeddings_deployment_name = os.environ["VECTOR_EMBEDDINGS_DEPLOYMENT_NAME"]
+        # Local embeddings get their own name so they're never mixed with real ones, e.g. in the EmbeddingCache
+        self._embeddings_deployment_name = os.environ["VECTOR_EMBEDDINGS_DEPLOYMENT_NAME"] \
+                if self._embeddings_backend == Backend_Azure else f"local-hash-{LocalEmbeddingDimensions}"
 
         self._vector_index_name = index_name or ServicesWrapper.get_default_read_index_name()
-        self._vector_store_address = os.environ["VECTOR_STORE_ADDRESS"]
+        self._vector_store_address = os.environ["VECTOR_STORE_ADDRESS"] \
+                if self._search_backend == Backend_Azure else LocalSearchEndpoint
         self._vector_store_name = os.environ.get("VECTOR_STORE_NAME") \
                 or re.search( r"https://(.*?)\.search\.windows\.net", \
                     self._vector_store_address).group(1)
@@ -84,12 +113,17 @@ class ServicesWrapper:
         #   VECTOR_STORE_APIKEY should be omitted when deployed
         self._vector_store_api_key = os.environ.get("VECTOR_STORE_APIKEY", None)
 
+        # Clients are created lazily and shared by all threads using the wrapper (see get_services_wrapper)
+        self._lock = threading.RLock()
         self._llm_small = None
         self._llm_large = None
+        # Copies of the chat models by (id of the shared model, temperature)
+        self._llms_with_temperature = {}
         self._embeddings = None
         self._vector_store = None
         self._document_retriever = None
         self._search_client = None
+        self._search_index_client = None
         self._credential = None
         self._search_token = None
 
@@ -121,6 +155,19 @@ class ServicesWrapper:
     def get_default_read_index_name() -> str:
         return os.environ["VECTOR_INDEX_NAME"]
 
+    def get_embeddings_deployment_name(self) -> str:
+        return self._embeddings_deployment_name
+
+    def get_vector_store_address(self) -> str:
+        return self._vector_store_address
+
+    def get_vector_store_api_key(self) -> str|None:
+        """ The search API key if one is configured (local testing) - otherwise use managed identity """
+        return self._vector_store_api_key
+
+    def is_local_search(self) -> bool:
+        return self._search_backend == Backend_Local
+
     # TODO: Enforcing ContextPercent and MemoryPercent only at the moment (most important)
     # TODO: pass in history and/or context value/percent and adjust other values accordingly
     def get_token_limits(self, 
@@ -194,18 +241,35 @@ class ServicesWrapper:
             log_info(f"ignoring exception: {ex}")
             return None
 
-    def get_llm_small(self, temperature:int = None):
+    def get_llm_small(self, temperature:float = None):
         if not self._llm_small:
-            self._llm_small = self._get_llm( self._chat_deployment_name_small) 
-        # Set temp afterward instead of c'tor in case we've cached the LLM already
-        self._llm_small.temperature = temperature or DefaultTemperatureModelSmall
-        return self._llm_small
+            with self._lock:
+                self._llm_small = self._llm_small or self._get_llm( self._chat_deployment_name_small) 
+        return self._get_llm_with_temperature(self._llm_small, temperature or DefaultTemperatureModelSmall)
 
-    def get_llm_large(self, temperature:int = None):
+    def get_llm_large(self, temperature:float = None):
         if not self._llm_large:
-            self._llm_large = self._get_llm( self._chat_deployment_name_large)
-        self._llm_large.temperature = temperature or DefaultTemperatureModelLarge
-        return self._llm_large
+            with self._lock:
+                self._llm_large = self._llm_large or self._get_llm( self._chat_deployment_name_large)
+        return self._get_llm_with_temperature(self._llm_large, temperature or DefaultTemperatureModelLarge)
+
+    def _get_llm_with_temperature(self, llm: AzureChatOpenAI | None, temperature: float) -> AzureChatOpenAI | None:
+        """ A copy of the shared chat model with the temperature - the copy shares its client and
+        connection pool, and setting the temperature on the shared model would change it for
+        concurrent requests """
+        if llm is None:
+            return None
+        key = (id(llm), temperature)
+        llm_copy = self._llms_with_temperature.get(key)
+        if llm_copy is None:
+            with self._lock:
+                llm_copy = self._llms_with_temperature.get(key)
+                if llm_copy is None:
+                    # Not llm.copy(update=...) - pydantic drops the fields marked exclude, such as the client
+                    llm_copy = type(llm).construct(_fields_set = llm.__fields_set__ | {"temperature"},
+                                                   **{**llm.__dict__, "temperature": temperature})
+                    self._llms_with_temperature[key] = llm_copy
+        return llm_copy
 
     def get_llm_max_tokens(self, is_large: bool) -> int:
         # There's no way to query the model for this... - if we're consistent with 
@@ -219,11 +283,15 @@ class ServicesWrapper:
     def _get_llm(self, deployment_name: str) -> AzureChatOpenAI | None:
 
         try:
-            log_info(f"Creating AzureChatOpenAI: {deployment_name}) ")
-            llm = AzureChatOpenAI( 
-                deployment_name = deployment_name,
-                # batchSize = 10 # got an unexpected keyword argument 'batchSize'
-            )
+            if self._chat_backend == Backend_Local:
+                log_info(f"Creating local ScriptedChatModel: {deployment_name}")
+                llm = create_local_chat_model(deployment_name)
+            else:
+                log_info(f"Creating AzureChatOpenAI: {deployment_name}) ")
+                llm = AzureChatOpenAI( 
+                    deployment_name = deployment_name,
+                    # batchSize = 10 # got an unexpected keyword argument 'batchSize'
+                )
             CopilotHealthChecks.healthcheck_openai.set_healthy( "Initalized")
 
             if self._in_startup:
@@ -241,12 +309,8 @@ class ServicesWrapper:
 
         if self._embeddings is None:
             try:
-                log_info("Creating AzureOpenAIEmbeddings")
-                self._embeddings: AzureOpenAIEmbeddings = AzureOpenAIEmbeddings(
-                    deployment = self._embeddings_deployment_name,
-                    chunk_size = 100,
-                    # azure_ad_token = 
-                )
+                with self._lock:
+                    self._embeddings: AzureOpenAIEmbeddings = self._embeddings or self.create_embeddings_service()
 
                 if self._in_startup:
                     # Make test call to generate vector embedding on init for health check
@@ -260,12 +324,37 @@ class ServicesWrapper:
         return self._embeddings
 
 
+    def create_embeddings_service(self, max_retries: int = 2) -> AzureOpenAIEmbeddings:
+        """ A new embeddings client - max_retries is the number of retries made by the 
+        openai client itself, 0 when the caller handles throttling, e.g. EmbeddingScheduler """
+        if self._embeddings_backend == Backend_Local:
+            log_info(f"Creating local HashEmbeddings ({LocalEmbeddingDimensions} dims)")
+            return HashEmbeddings()
+        log_info(f"Creating AzureOpenAIEmbeddings (max_retries: {max_retries})")
+        return AzureOpenAIEmbeddings(
+            deployment = self._embeddings_deployment_name,
+            chunk_size = 100,
+            max_retries = max_retries,
+            # azure_ad_token = 
+        )
+
+
     def get_vector_store(self, index_name: str = None) -> AzureSearch:
 
         if self._vector_store is not None:
             #log_debug("Using pre-initialized vector store.")    
             return self._vector_store
 
+        with self._lock:
+            if self._vector_store is not None:
+                return self._vector_store
+            return self._create_vector_store(index_name)
+
+    def _create_vector_store(self, index_name: str = None) -> AzureSearch:
+
+        if self._search_backend == Backend_Local:
+            return self._get_local_vector_store(index_name)
+
         # TODO: temporary code to test MI in deployed scenario and fallback to api key
         throw_exceptions = self._throw_exceptions
         try:
@@ -299,7 +388,8 @@ class ServicesWrapper:
             #  at startup, we could use the Search(Index)Client directly
             # NOTE: The above doesn't quite work anyway as LC insists on certain fieldnames
             #  like a generic "metadata" field. 
-            self._vector_store = AzureSearch(
+            # Selects all the fields but the vector for the retriever's searches
+            self._vector_store = ProjectedAzureSearch(
                 azure_search_endpoint = self._vector_store_address,
                 azure_search_key = key,
                 fields = IndexFields, # must pass in or bare/default index will be cerated
@@ -321,6 +411,19 @@ class ServicesWrapper:
             CopilotHealthChecks.healthcheck_azure_ai_search.set_failing( "vector store failed during init")
             return self._handle_exception(ex)
 
+    def _get_local_vector_store(self, index_name: str = None) -> LocalVectorStore:
+        index_name = index_name or self._vector_index_name
+        log_info(f"Creating LocalVectorStore on index '{index_name}'")
+        self._vector_store = LocalVectorStore(
+            index_name = index_name,
+            fields = IndexFields,
+            embedding_function = self.get_embeddings_service().embed_query,
+            content_field = FieldName_Content,
+            vector_field = FieldName_Vector,
+        )
+        CopilotHealthChecks.healthcheck_azure_ai_search.set_healthy( "Initalized")
+        return self._vector_store
+
     # Note: We don't use search_client directly at the moment as we call the vector_store thruough 
     #   langchain - using this to test managed idetity in deployed scenario
 
@@ -346,14 +449,33 @@ class ServicesWrapper:
 
     @timed()
     def get_search_index_client(self) -> SearchIndexClient:
+        if self._search_index_client is not None:
+            return self._search_index_client
+        if self._search_backend == Backend_Local:
+            return LocalSearchIndexClient()
         try:
-            log_info("Creating SearchIndexClient")
-            return SearchIndexClient(
-                endpoint = self._vector_store_address, 
-                credential = self._credential)
+            with self._lock:
+                if self._search_index_client is None:
+                    log_info("Creating SearchIndexClient")
+                    self._search_index_client = SearchIndexClient(
+                        endpoint = self._vector_store_address, 
+                        credential = self._credential)
+            return self._search_index_client
         except Exception as ex:
             return self._handle_exception(ex)
 
+    @timed()
+    def warm_up(self) -> None:
+        """ Create the shared clients and open a search connection ahead of the first request """
+        try:
+            self.get_llm_small()
+            self.get_llm_large()
+            self.get_embeddings_service()
+            n_docs = self.get_search_client().get_document_count()
+            log_info(f"Services warmed up - index '{self._vector_index_name}' has {n_docs} docs")
+        except Exception as ex:
+            log_warning(f"Services warm up failed: {ex}")
+
 
     """
     Retreiver should be generating a query like the one below.
@@ -382,11 +504,10 @@ class ServicesWrapper:
     """
 
     @timed()
-    # Takes ~0.5s - all in get_vector_store_document_retreiver
     def get_vector_store_document_retreiver(self, 
                                             top_k_docs: int = None, 
                                             search_type: str = None,
-                                            filters: Optional[str] = None) -> AzureSearchVectorStoreRetriever:
+                                            filters: Optional[str] = None) -> VectorStoreRetriever:
         log_info("Creating AzureSearch Retriever")
         vector_store = self.get_vector_store()
         if vector_store is None: return None
@@ -398,7 +519,12 @@ class ServicesWrapper:
             "filters": filters
         }
 
-        retriever = vector_store.as_retriever(
+        # AzureSearch.as_retriever returns an AzureSearchVectorStoreRetriever, which drops search_kwargs
+        #  (and is converted to a VectorStoreRetriever by CustomVectorStoreRetriever anyway) - create the
+        #  VectorStoreRetriever directly so the kwargs stay with the retriever of this request rather 
+        #  than on the vector store, which is shared by concurrent requests.
+        retriever = VectorStoreRetriever(
+            vectorstore = vector_store,
             # At this level we always want 'similarity', and use kwargs below to 
             #   pass in either 'similarity; or 'hybrid'. Note that 'keyword' isn't supported,
             #   so if we wanted to bypass the vector ranking all togther and do a 
@@ -410,11 +536,6 @@ class ServicesWrapper:
             search_kwargs = search_kwargs
         )
 
-        # NOTE HACK: This is to workaround an apparent recent LC bug where the search_kwargs are not 
-        #  being saved in the retriever we store them in the vectorstore and then copy them 
-        #  to the retriever during _get_related_documents in CustomVectorStoreRetriever
-        vector_store.search_kwargs = search_kwargs
-
         return retriever
 
     def get_acs_document_retreiver(self, key = None):
@@ -441,3 +562,19 @@ class ServicesWrapper:
 
         return self._document_retriever
 
+
+_services_wrappers: Dict[str, ServicesWrapper] = {}
+_services_wrappers_lock = threading.Lock()
+
+def get_services_wrapper(index_name: str = None) -> ServicesWrapper:
+    """ The process-wide ServicesWrapper of an index. Its clients are created once and shared by
+    every request - creating a wrapper per request re-creates the chat, embeddings and search
+    clients and their connections. """
+    index_name = index_name or ServicesWrapper.get_default_read_index_name()
+    services = _services_wrappers.get(index_name)
+    if services is None:
+        with _services_wrappers_lock:
+            services = _services_wrappers.get(index_name)
+            if services is None:
+                services = _services_wrappers[index_name] = ServicesWrapper(index_name = index_name)
+    return services
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+import tiktoken
+
+from shared.OpenTelemetry import log_info, log_debug, MetricTokenCount
+
+DefaultTokenEncodingName = "cl100k_base"
+
+# Number of token counts kept in the LRU cache
+TokenCountCacheSize = int(os.environ.get("COPILOT_TOKEN_COUNT_CACHE_SIZE") or 20000)
+# Short strings are cheaper to encode than to hash and look up
+MinCachedTextLength = 64
+# Threads used by tiktoken to encode a batch - encoding releases the GIL
+EncodeBatchNumThreads = 4
+
+# Characters per token used by the approximate counter until enough text has been
+#  counted exactly to calibrate it. cl100k is ~4 for English prose, PDF text tends lower.
+DefaultCharsPerToken = 3.5
+MinCalibrationTokens = 10000
+
+
+class TokenCounter:
+    """Count tokens for the chat and embedding models.
+
+    - The encoder is loaded on first use rather than at import.
+    - Lists of strings are encoded together with encode_ordinary_batch.
+    - Counts are cached by content hash, so repeated text (e.g. chunks fetched again by
+      the retriever, or whole docs re-added on rebuild) isn't re-encoded.
+    - estimate() gives a cheap approximate count for logging and fallbacks, using a
+      characters-per-token ratio calibrated from the exact counts made so far.
+    Text is encoded as ordinary text - special token markup such as <|endoftext|> in a
+      document is counted like any other text rather than raising.
+    """
+
+    def __init__(self,
+                 encoding_name: str = DefaultTokenEncodingName,
+                 cache_size: int = TokenCountCacheSize) -> None:
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding: tiktoken.Encoding|None = None
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+
+        # Stats - updated without the lock, only approximate under contention
+        self.num_encoded = 0
+        self.num_cache_hits = 0
+        self.encode_seconds = 0.0
+        self.calibration_chars = 0
+        self.calibration_tokens = 0
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    start = time.perf_counter()
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    log_info(f"TokenCounter: loaded '{self.encoding_name}' encoding in {time.perf_counter() - start:.2f}s")
+        return self._encoding
+
+    @staticmethod
+    def _get_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size = 16).digest()
+
+    def _get_cached(self, key: bytes) -> int|None:
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+        return n
+
+    def _set_cached(self, items: Iterable[tuple[bytes, int]]) -> None:
+        with self._lock:
+            for key, n in items:
+                self._cache[key] = n
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last = False)
+
+    def _record(self, texts: list[str], counts: list[int], seconds: float, n_cached: int) -> None:
+        self.num_encoded += len(texts)
+        self.num_cache_hits += n_cached
+        self.encode_seconds += seconds
+        self.calibration_chars += sum(len(t) for t in texts)
+        self.calibration_tokens += sum(counts)
+        MetricTokenCount(int(seconds * 1000), n_texts = len(texts), n_cached = n_cached)
+
+    def count(self, text: str) -> int:
+        """Exact number of tokens in text"""
+        if not text:
+            return 0
+
+        key = self._get_key(text) if len(text) >= MinCachedTextLength else None
+        if key:
+            n = self._get_cached(key)
+            if n is not None:
+                self.num_cache_hits += 1
+                return n
+
+        start = time.perf_counter()
+        n = len(self.encoding.encode_ordinary(text))
+        self._record([text], [n], time.perf_counter() - start, 0)
+
+        if key:
+            self._set_cached([(key, n)])
+        return n
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        """Exact number of tokens in each of the texts - cache misses are encoded in one batch"""
+        counts = [0] * len(texts)
+        # key -> indexes of texts with that content, so duplicates are only encoded once
+        to_encode: dict[bytes|str, list[int]] = {}
+        n_cached = 0
+
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            key = self._get_key(text) if len(text) >= MinCachedTextLength else text
+            n = self._get_cached(key) if isinstance(key, bytes) else None
+            if n is not None:
+                counts[i] = n
+                n_cached += 1
+            else:
+                to_encode.setdefault(key, []).append(i)
+
+        if not to_encode:
+            self.num_cache_hits += n_cached
+            return counts
+
+        batch = [texts[indexes[0]] for indexes in to_encode.values()]
+        start = time.perf_counter()
+        batch_counts = [len(tokens) for tokens in
+                            self.encoding.encode_ordinary_batch(batch, num_threads = EncodeBatchNumThreads)]
+        self._record(batch, batch_counts, time.perf_counter() - start, n_cached)
+
+        for indexes, n in zip(to_encode.values(), batch_counts):
+            for i in indexes:
+                counts[i] = n
+        self._set_cached((key, n) for key, n in zip(to_encode.keys(), batch_counts) if isinstance(key, bytes))
+        return counts
+
+    def get_chars_per_token(self) -> float:
+        if self.calibration_tokens < MinCalibrationTokens:
+            return DefaultCharsPerToken
+        return self.calibration_chars / self.calibration_tokens
+
+    def estimate(self, text: str) -> int:
+        """Approximate number of tokens in text without encoding it - for logging and
+        budgeting fallbacks where an exact count isn't worth the cost."""
+        if not text:
+            return 0
+        return max(1, round(len(text) / self.get_chars_per_token()))
+
+    def get_stats(self) -> dict:
+        n_calls = self.num_encoded + self.num_cache_hits
+        return {
+            "encoded": self.num_encoded,
+            "cacheHits": self.num_cache_hits,
+            "cacheHitRate": round(self.num_cache_hits / n_calls, 3) if n_calls else 0,
+            "cacheSize": len(self._cache),
+            "encodeSeconds": round(self.encode_seconds, 3),
+            "charsPerToken": round(self.get_chars_per_token(), 3),
+        }
+
+    def log_stats(self) -> None:
+        log_debug(f"TokenCounter stats: {self.get_stats()}")
+
+
+_token_counter = TokenCounter()
+
+def get_token_counter() -> TokenCounter:
+    return _token_counter
+
+def get_token_encoding() -> tiktoken.Encoding:
+    return _token_counter.encoding
+
+def get_num_tokens(text: str) -> int:
+    return _token_counter.count(text)
+
+def get_num_tokens_batch(texts: list[str]) -> list[int]:
+    return _token_counter.count_batch(texts)
+
+def estimate_num_tokens(text: str) -> int:
+    return _token_counter.estimate(text)
+
@@ -1,9 +1,9 @@
 from typing import Dict, Callable, Tuple, Any
 import datetime
+import hashlib
 import dateutil
 import time
 from functools import wraps
-import tiktoken
 import re
 import gc
 import sys
@@ -13,6 +13,7 @@ if __name__ == '__main__':
     sys.path.append(os.path.dirname(os.path.abspath(__file__ + './')))
     sys.path.append(os.path.dirname(os.path.abspath(__file__ + '../../')))
 from shared.OpenTelemetry import log_debug, log_exception, log_info, log_error, log_warning
+from shared.TokenCounter import get_token_counter
 
 DebugMode = os.environ.get("COPILOT_DEBUG", "").lower() == "true"
 
@@ -115,11 +116,11 @@ def path_join(*args):
     """os.path.join and Pathlib both do things we don't want"""
     return '/'.join([p.strip('/') for p in args])
 
-token_encoding = tiktoken.get_encoding("cl100k_base")
-
 def get_num_tokens(text: str) -> int:
-    tokens = token_encoding.encode(text)
-    return len(tokens)
+    return get_token_counter().count(text)
+
+def get_content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
 
 def pluck(dict, *args): 
     return (dict.get(arg, -1) for arg in args)
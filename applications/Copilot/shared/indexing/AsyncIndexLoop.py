@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+from typing import Any, Coroutine, Dict
+
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+from shared.ServicesWrapper import ServicesWrapper
+from shared.local.LocalSearch import AsyncLocalSearchClient
+from shared.OpenTelemetry import log_info
+
+# Send index writes (AzureAiIndexOps upload, merge and delete) on the process-wide async
+#  index loop, so concurrent documents share one event loop and connection pool instead of
+#  each holding threads for its batches
+AsyncIndexIoEnabled = (os.environ.get("COPILOT_ASYNC_INDEX_IO") or "true").lower() == "true"
+
+# Connections in the pool shared by all async search clients on an event loop
+AsyncIndexMaxConnections = int(os.environ.get("COPILOT_ASYNC_INDEX_MAX_CONNECTIONS") or 32)
+
+
+class AsyncSearchResources:
+    """ The aiohttp session (connection pool) and credential shared by every async
+    search client on one event loop, plus a client per index.
+    Must be created and closed on the loop that uses it.
+    """
+
+    def __init__(self, services: ServicesWrapper) -> None:
+        self.endpoint = services.get_vector_store_address()
+        api_key = services.get_vector_store_api_key()
+        self.credential = AzureKeyCredential(api_key) if api_key else AsyncDefaultAzureCredential()
+        self.session = aiohttp.ClientSession(connector = aiohttp.TCPConnector(limit = AsyncIndexMaxConnections))
+        self._clients: Dict[str, AsyncSearchClient] = {}
+        log_info(f"AsyncSearchResources: created for '{self.endpoint}' with {'key' if api_key else 'ManagedIdentity'}")
+
+    def get_search_client(self, index_name: str) -> AsyncSearchClient:
+        client = self._clients.get(index_name)
+        if client is None:
+            client = AsyncSearchClient(self.endpoint, index_name, self.credential,
+                                       transport = AioHttpTransport(session = self.session, session_owner = False))
+            self._clients[index_name] = client
+        return client
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+        if isinstance(self.credential, AsyncDefaultAzureCredential):
+            await self.credential.close()
+        await self.session.close()
+
+
+_async_search_resources: Dict[asyncio.AbstractEventLoop, AsyncSearchResources] = {}
+_async_search_resources_lock = threading.Lock()
+
+def get_async_search_resources(services: ServicesWrapper) -> AsyncSearchResources:
+    """ The shared resources for the running event loop """
+    loop = asyncio.get_running_loop()
+    with _async_search_resources_lock:
+        resources = _async_search_resources.get(loop)
+        if resources is None:
+            resources = AsyncSearchResources(services)
+            _async_search_resources[loop] = resources
+        return resources
+
+async def close_async_search_resources() -> None:
+    """ Close the shared resources of the running event loop """
+    with _async_search_resources_lock:
+        resources = _async_search_resources.pop(asyncio.get_running_loop(), None)
+    if resources:
+        await resources.close()
+
+
+class AsyncIndexLoop:
+    """ An event loop on a background thread shared by sync callers of the async index ops,
+    so index I/O from all of them is multiplexed over one connection pool.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target = self.loop.run_forever, name = "async-index-loop", daemon = True)
+        self._thread.start()
+
+    def run(self, coro: Coroutine) -> Any:
+        """ Run coro on the loop, blocking the calling thread until it's done """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncIndexLoop.run called from the loop's own thread - await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_async_index_loop: AsyncIndexLoop|None = None
+_async_index_loop_lock = threading.Lock()
+
+def get_async_index_loop() -> AsyncIndexLoop:
+    global _async_index_loop
+    with _async_index_loop_lock:
+        if _async_index_loop is None:
+            _async_index_loop = AsyncIndexLoop()
+        return _async_index_loop
+
+
+def get_async_search_client(services: ServicesWrapper, index_name: str) -> AsyncSearchClient:
+    """ The async search client of the index for the running event loop """
+    if services.is_local_search():
+        return AsyncLocalSearchClient(index_name)
+    return get_async_search_resources(services).get_search_client(index_name)
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+from shared.ServicesWrapper import ServicesWrapper
+from shared.indexing.SearchIndexConfig import FieldName_Id
+from shared.indexing.IndexOps import AzureAiIndexOps, IndexDocsPage, DefaultIndexDocsPageSize
+from shared.indexing.IndexPayload import IndexAction_Upload, IndexAction_Merge, IndexAction_Delete
+from shared.indexing.IndexUploader import AsyncIndexUploader
+from shared.indexing.IndexProjections import Projection_NoVector, get_projection
+from shared.indexing.AsyncIndexLoop import get_async_index_loop, get_async_search_client
+from shared.OpenTelemetry import log_exception, log_info, log_warning
+
+
+class AsyncIndexOps:
+    """ Async variant of AzureAiIndexOps for the index document operations, on the async
+    search client. Any number of documents' operations can be awaited together on one loop.
+    Building documents and getting embeddings is shared with AzureAiIndexOps.
+    """
+
+    def __init__(self, index_name: str = None, services: ServicesWrapper = None):
+        self.sync_ops = AzureAiIndexOps(index_name = index_name, services = services)
+        self.services = self.sync_ops.services
+        self.index_name = self.sync_ops.index_name
+
+    def _get_search_client(self) -> AsyncSearchClient:
+        return get_async_search_client(self.services, self.index_name)
+
+    async def get_document(self, id, projection: str = Projection_NoVector) -> dict[str, Any]:
+        search_client = self._get_search_client()
+        return await search_client.get_document(id, selected_fields = get_projection(projection))
+
+    async def find_index_docs_page(self, 
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        page_size: int = DefaultIndexDocsPageSize,
+                        continuation_token: str|None = None,
+                        return_total_count: bool = False,
+                        use_index_update_time: bool = True
+                    ) -> IndexDocsPage:
+        """ As AzureAiIndexOps.find_index_docs_page - same keyset query and continuation tokens """
+        # The first query of an index checks its schema for keyset paging on the sync client
+        query = await asyncio.to_thread(self.sync_ops.get_index_docs_page_query,
+                                        uri, copilot_enabled_only, doc_type, select_extra_fields, update_time,
+                                        continuation_token, return_total_count, use_index_update_time)
+        search_client = self._get_search_client()
+        try:
+            search_results_response = await search_client.search(**query.get_search_args(page_size))
+            docs = [s async for s in search_results_response]
+        except Exception as e:
+            log_exception(f"Error searching for documents with filter '{query.page_filter}'", e)
+            raise
+        total_count = await search_results_response.get_count() if query.count_now else query.total_count
+        return query.get_page(docs, page_size, total_count)
+
+    async def find_index_docs(self,
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        use_index_update_time: bool = True
+                    ) -> List[Dict[str, Any]]:
+        """ All the docs AzureAiIndexOps.find_index_docs would return, fetched by keyset page -
+        use find_index_docs_page to page through them """
+        docs = []
+        continuation_token = None
+        while True:
+            page = await self.find_index_docs_page(uri, copilot_enabled_only, doc_type, select_extra_fields, update_time,
+                                                   continuation_token = continuation_token,
+                                                   use_index_update_time = use_index_update_time)
+            docs.extend(page.docs)
+            continuation_token = page.continuation_token
+            if not continuation_token:
+                break
+        log_info(f"Returning {len(docs)} matching documents for uri '{uri}', type '{doc_type}'")
+        return docs
+
+    async def _index_documents(self, docs: List[Dict[str, Any]], action: str):
+        response = await AsyncIndexUploader(self._get_search_client()).index_documents(docs, action)
+        failed = [r for r in response if not r.succeeded]
+        if failed:
+            log_warning(f"Failed to {action} {len(failed)} of {len(docs)} index documents")
+            raise Exception(failed)
+
+    async def upload_documents(self, docs: List[Dict[str, Any]]):
+        if not docs:
+            log_warning("No index documents to upload")
+            return
+        await self._index_documents(docs, IndexAction_Upload)
+
+    async def merge_documents(self, docs: List[Dict[str, Any]]):
+        if not docs:
+            return
+        await self._index_documents(docs, IndexAction_Merge)
+
+    async def delete_documents(self, docs: List[dict[str,Any]]):
+        if not docs:
+            return
+        await self._index_documents([{FieldName_Id: d[FieldName_Id]} for d in docs], IndexAction_Delete)
+
+    async def add_whole_index_document(self,
+                                   text: str,
+                                   file: str,
+                                   doc_last_update_time: datetime,
+                                   item_type: str,
+                                   metadata: Optional[str] = None,
+                                   summary_type: Optional[str] = None):
+        # Embedding waits on the shared EmbeddingScheduler - keep it off the loop
+        merged_doc = await asyncio.to_thread(self.sync_ops.get_whole_index_document,
+                                             text, file, doc_last_update_time, item_type, metadata, summary_type)
+        # This will upsert if already exists
+        await self._index_documents([merged_doc], IndexAction_Upload)
+
+
+class SyncIndexOpsFacade:
+    """ Blocking calls to AsyncIndexOps for sync callers such as the Flask handlers - the
+    operations run on the process-wide AsyncIndexLoop, so concurrent requests share its
+    connection pool.
+    """
+
+    def __init__(self, index_name: str = None, services: ServicesWrapper = None):
+        self.async_ops = AsyncIndexOps(index_name = index_name, services = services)
+        self.index_name = self.async_ops.index_name
+        self._loop = get_async_index_loop()
+
+    def get_document(self, id, projection: str = Projection_NoVector) -> dict[str, Any]:
+        return self._loop.run(self.async_ops.get_document(id, projection))
+
+    def find_index_docs(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return self._loop.run(self.async_ops.find_index_docs(*args, **kwargs))
+
+    def find_index_docs_page(self, *args, **kwargs) -> IndexDocsPage:
+        return self._loop.run(self.async_ops.find_index_docs_page(*args, **kwargs))
+
+    def upload_documents(self, docs: List[Dict[str, Any]]):
+        return self._loop.run(self.async_ops.upload_documents(docs))
+
+    def merge_documents(self, docs: List[Dict[str, Any]]):
+        return self._loop.run(self.async_ops.merge_documents(docs))
+
+    def delete_documents(self, docs: List[dict[str,Any]]):
+        return self._loop.run(self.async_ops.delete_documents(docs))
+
+    def add_whole_index_document(self, *args, **kwargs):
+        return self._loop.run(self.async_ops.add_whole_index_document(*args, **kwargs))
@@ -1,5 +1,6 @@
 import io
 import os
+import threading
 import urllib.parse
 
 from azure.identity import DefaultAzureCredential
@@ -20,6 +21,9 @@ class BlobOps:
     container_name = os.environ["BlobStorage__ContainerName"]
     account_url = f"https://{account_name}.blob.core.windows.net/"
     file_prefix = path_join(account_url, container_name)
+    # One client for all BlobOps - it's thread-safe and pools its connections
+    _shared_service_client: BlobServiceClient|None = None
+    _shared_service_client_lock = threading.Lock()
 
     def __init__(self, file:str = None, container:str|None = None) -> None:
         self.blob_name = file
@@ -86,10 +90,14 @@ class BlobOps:
         return bytes
 
     def get_service_client(self) -> BlobServiceClient:
-        self.blob_service_client = self.blob_service_client or BlobServiceClient(
-            self.account_url, 
-            credential = self.default_credential
-        )
+        if self.blob_service_client is None:
+            with BlobOps._shared_service_client_lock:
+                if BlobOps._shared_service_client is None:
+                    BlobOps._shared_service_client = BlobServiceClient(
+                        self.account_url, 
+                        credential = self.default_credential
+                    )
+            self.blob_service_client = BlobOps._shared_service_client
         return self.blob_service_client
 
     def get_container_client(self) -> ContainerClient:
@@ -132,13 +140,15 @@ class BlobOps:
         return os.path.splitext(self.get_blob_name())[1].lower()
 
     #@timed
-    def get_blob_list(self) -> list[BlobProperties]:
+    def get_blob_list(self, include_metadata: bool = False) -> list[BlobProperties]:
+        """ The properties of every blob - with their metadata if include_metadata, so they
+        can be used in place of get_blob_properties """
         c_client = self.get_container_client()
-        blob_generator = c_client.list_blobs()
+        blob_generator = c_client.list_blobs(include = ["metadata"] if include_metadata else None)
         return [b for b in blob_generator]
 
-    def file_looks_like(self, extension = "pdf") -> bool:
-        file_type = self.get_blob_properties().content_settings['content_type']
+    def file_looks_like(self, extension = "pdf", blob_props: BlobProperties|None = None) -> bool:
+        file_type = (blob_props or self.get_blob_properties()).content_settings['content_type']
         if file_type == f'application/{extension}':
             return True
         file = self.get_blob_name()
@@ -4,14 +4,15 @@ from typing import List
 import sys
 import itertools
 
-from shared.Utils import timed, get_num_tokens
+from shared.Utils import timed
+from shared.TokenCounter import estimate_num_tokens
 from shared.indexing.BlobOps import BlobOps
-from shared.indexing.TextChunker import TextChunk, TextChunker
+from shared.indexing.TextChunker import TextChunk, OffsetTextChunker
 
 from langchain.chains.summarize import load_summarize_chain
 from langchain_core.documents import Document
 
-from shared.ServicesWrapper import ServicesWrapper
+from shared.ServicesWrapper import get_services_wrapper
 from shared.OpenTelemetry import log_info, log_debug, log_error, log_exception, log_warning
 from shared.Prompts import SummarizeDocumentPrompt
 
@@ -38,7 +39,7 @@ class DocumentSummarizer:
                  use_large_model = True,
                  file:str = None):
 
-        self.services = ServicesWrapper()
+        self.services = get_services_wrapper()
         self.stuff_chain = None
         self.llm = self.services.get_llm_large() if use_large_model else self.services.get_llm_small()
         self.llm_max_tokens = self.services.get_llm_max_tokens(is_large = use_large_model)
@@ -83,7 +84,7 @@ class DocumentSummarizer:
 
     def rechunk_text(self, text:str, chunk_size:int, max_chunks:int) -> List[Document]:
 
-        tc = TextChunker(
+        tc = OffsetTextChunker(
             chunk_size = chunk_size, 
             overlap = 50)
         tc.add_text(1, text)
@@ -114,7 +115,7 @@ class DocumentSummarizer:
             docs = self.rechunk_text(self.text, chunk_size, max_chunks)
 
         for i, doc in enumerate(docs):
-            log_debug(f"Summary document chunk {i} tokens: {get_num_tokens(doc.page_content)}")
+            log_debug(f"Summary document chunk {i} ~tokens: {estimate_num_tokens(doc.page_content)}")
 
         return docs
                 
@@ -157,7 +158,7 @@ class DocumentSummarizer:
             log_warning(f"summarize_stuff: Document length exceeds max: {len(text)} for '{self.file}'")
             text = text[:chars_max]
 
-        log_info(f"Running stuff summary for '{self.file}': input len: {len(text)}, tokens: {get_num_tokens(text)}")
+        log_info(f"Running stuff summary for '{self.file}': input len: {len(text)}, ~tokens: {estimate_num_tokens(text)}")
 
         summary:str = self.stuff_chain.run(docs)
 
@@ -166,7 +167,7 @@ class DocumentSummarizer:
             # TODO: replace with Status:Failed summary document
             return SummaryGeneratedEmpty
 
-        log_info(f"Created stuff summary for '{self.file}': summary len: {len(summary)}, tokens: {get_num_tokens(summary)}")
+        log_info(f"Created stuff summary for '{self.file}': summary len: {len(summary)}, ~tokens: {estimate_num_tokens(summary)}")
 
         return summary
 
@@ -248,7 +249,7 @@ class DocumentSummarizer:
 
         #return summary # when return_intermediate_steps = False
         summary_text = summary['output_text']
-        log_info(f"Created mapreduce summary: len: {len(summary_text)}, tokens: {get_num_tokens(summary_text)}")
+        log_info(f"Created mapreduce summary: len: {len(summary_text)}, ~tokens: {estimate_num_tokens(summary_text)}")
 
         return summary_text
 
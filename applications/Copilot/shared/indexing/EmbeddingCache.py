@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+
+from shared.OpenTelemetry import log_info, log_debug, log_warning, MetricEmbeddingCache
+
+# Bump if the layout of the cache files changes
+EmbeddingCacheVersion = 1
+EmbeddingCacheKeySize = 16
+# When full, free this fraction of the rows at once rather than one row per miss
+EmbeddingCacheEvictFraction = 0.1
+
+
+def get_default_embedding_cache_dir() -> str:
+    return os.environ.get("COPILOT_EMBEDDING_CACHE_DIR") or \
+                os.path.join(tempfile.gettempdir(), "copilot-embedding-cache")
+
+def get_default_embedding_cache_max_rows() -> int:
+    # 50k 1536-dim vectors is ~300MB on disk - 0 disables the cache
+    return int(os.environ.get("COPILOT_EMBEDDING_CACHE_MAX_ROWS") or 50000)
+
+
+class EmbeddingStore:
+    """Fixed-capacity store of the embeddings of one deployment, on disk in three memory-mapped files:
+    - vectors: float32 matrix of capacity x dims
+    - keys: the content hash stored in each row
+    - stamps: last access counter of each row, for LRU eviction - 0 for free rows
+    The keys file is the index - it's read into a dict of key -> row when the store is opened.
+    A row's vector and key are written before its stamp so a crash can't leave a used row with a partial vector.
+    """
+
+    def __init__(self, path_prefix: str, dims: int, capacity: int) -> None:
+        self.path_prefix = path_prefix
+        self.dims = dims
+        self.capacity = capacity
+        self._open()
+
+    def _open(self) -> None:
+        meta_path = self.path_prefix + ".meta.json"
+        meta = {"version": EmbeddingCacheVersion, "dims": self.dims, "capacity": self.capacity}
+        existing_meta = None
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, "r", encoding = "utf-8") as f:
+                    existing_meta = json.load(f)
+            except Exception as e:
+                log_warning(f"EmbeddingCache: unreadable metadata '{meta_path}': {e}")
+
+        # Start from scratch if the layout, dims or capacity changed
+        mode = "r+" if existing_meta == meta else "w+"
+        self.vectors = np.memmap(self.path_prefix + ".vectors", dtype = np.float32, mode = mode, shape = (self.capacity, self.dims))
+        self.keys = np.memmap(self.path_prefix + ".keys", dtype = np.uint8, mode = mode, shape = (self.capacity, EmbeddingCacheKeySize))
+        self.stamps = np.memmap(self.path_prefix + ".stamps", dtype = np.int64, mode = mode, shape = (self.capacity,))
+        if mode == "w+":
+            with open(meta_path, "w", encoding = "utf-8") as f:
+                json.dump(meta, f)
+
+        used = self.stamps > 0
+        self.rows = {self.keys[i].tobytes(): i for i in np.flatnonzero(used).tolist()}
+        self.free_rows = np.flatnonzero(~used)[::-1].tolist()
+        self.clock = int(self.stamps.max()) if self.capacity else 0
+        log_info(f"EmbeddingCache: opened '{self.path_prefix}' with {len(self.rows)} of {self.capacity} rows used")
+
+    def get(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        found = {}
+        for key in keys:
+            row = self.rows.get(key)
+            if row is not None:
+                self.clock += 1
+                self.stamps[row] = self.clock
+                found[key] = np.array(self.vectors[row])
+        return found
+
+    def put(self, items: list[tuple[bytes, np.ndarray]]) -> None:
+        for key, vector in items:
+            if key in self.rows:
+                continue
+            if not self.free_rows:
+                self._evict()
+            row = self.free_rows.pop()
+            self.clock += 1
+            self.vectors[row] = vector
+            self.keys[row] = np.frombuffer(key, dtype = np.uint8)
+            self.stamps[row] = self.clock
+            self.rows[key] = row
+
+    def _evict(self) -> None:
+        n_evict = max(1, int(self.capacity * EmbeddingCacheEvictFraction))
+        used_rows = np.fromiter(self.rows.values(), dtype = np.int64)
+        oldest = used_rows[np.argpartition(self.stamps[used_rows], min(n_evict, len(used_rows)) - 1)[:n_evict]]
+        for row in oldest.tolist():
+            del self.rows[self.keys[row].tobytes()]
+            self.stamps[row] = 0
+            self.free_rows.append(row)
+        log_debug(f"EmbeddingCache: evicted {len(oldest)} least recently used rows from '{self.path_prefix}'")
+
+    def flush(self) -> None:
+        self.vectors.flush()
+        self.keys.flush()
+        self.stamps.flush()
+
+
+class EmbeddingCache:
+    """Local on-disk cache of embedding vectors keyed by content hash and embeddings deployment.
+
+    Reindexing - FORCE_REINDEX_LASTUPDATETIME sweeps, delete_and_recreate rebuilds, chunk
+      size experiments that produce some of the same chunks - mostly embeds text that has
+      been embedded before. Each deployment gets its own EmbeddingStore, so vectors from
+      different models never mix.
+    Assumes one process per cache directory - the stores are only locked within the process.
+    """
+
+    def __init__(self, cache_dir: str|None = None, max_rows: int|None = None) -> None:
+        self.cache_dir = cache_dir or get_default_embedding_cache_dir()
+        self.max_rows = max_rows if max_rows is not None else get_default_embedding_cache_max_rows()
+        self._stores: dict[str, EmbeddingStore] = {}
+        self._lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    @staticmethod
+    def get_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size = EmbeddingCacheKeySize).digest()
+
+    def _get_store(self, deployment: str, dims: int|None) -> EmbeddingStore|None:
+        """The store for the deployment - opened from disk, or created if dims is known"""
+        store = self._stores.get(deployment)
+        if store is None:
+            safe_name = re.sub(r"[^A-Za-z0-9_\-]", "_", deployment)
+            path_prefix = os.path.join(self.cache_dir, safe_name)
+            if dims is None:
+                # Find the dims of an existing store
+                try:
+                    with open(path_prefix + ".meta.json", "r", encoding = "utf-8") as f:
+                        dims = json.load(f)["dims"]
+                except Exception:
+                    return None
+            os.makedirs(self.cache_dir, exist_ok = True)
+            store = EmbeddingStore(path_prefix, dims, self.max_rows)
+            self._stores[deployment] = store
+        return store
+
+    def get(self, deployment: str, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        """Cached vectors for whichever of the keys are present"""
+        if not self.enabled or not keys:
+            return {}
+        try:
+            with self._lock:
+                store = self._get_store(deployment, None)
+                found = store.get(keys) if store else {}
+        except Exception as e:
+            log_warning(f"EmbeddingCache: lookup failed: {e}")
+            found = {}
+
+        n_hits = len(found)
+        self.num_hits += n_hits
+        self.num_misses += len(keys) - n_hits
+        MetricEmbeddingCache(n_hits, len(keys) - n_hits)
+        return found
+
+    def put(self, deployment: str, items: list[tuple[bytes, np.ndarray]]) -> None:
+        if not self.enabled or not items:
+            return
+        try:
+            with self._lock:
+                store = self._get_store(deployment, len(items[0][1]))
+                if store.dims != len(items[0][1]):
+                    log_warning(f"EmbeddingCache: not caching {len(items[0][1])}-dim vectors in {store.dims}-dim store for '{deployment}'")
+                    return
+                store.put(items)
+        except Exception as e:
+            # The cache is only an optimization
+            log_warning(f"EmbeddingCache: failed to add {len(items)} vectors: {e}")
+
+    def get_hit_rate(self) -> float:
+        n = self.num_hits + self.num_misses
+        return self.num_hits / n if n else 0.0
+
+    def flush(self) -> None:
+        with self._lock:
+            for store in self._stores.values():
+                store.flush()
+
+    def log_stats(self) -> None:
+        log_info(f"EmbeddingCache: {self.num_hits} hits, {self.num_misses} misses, hit rate {self.get_hit_rate():.1%}")
+
+
+_embedding_cache: EmbeddingCache|None = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,274 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+import openai
+
+from shared.TokenCounter import get_num_tokens_batch
+from shared.OpenTelemetry import log_info, log_debug, log_warning, log_exception, MetricEmbeddingRequest
+
+# Limits of a single embeddings request
+EmbeddingMaxTextsPerRequest = int(os.environ.get("COPILOT_EMBEDDING_MAX_TEXTS_PER_REQUEST") or 100)
+EmbeddingMaxTokensPerRequest = int(os.environ.get("COPILOT_EMBEDDING_MAX_TOKENS_PER_REQUEST") or 64000)
+
+# Quota of the embeddings deployment - 0 for no limit.
+#  Defaults are the Azure OpenAI standard quota for text-embedding-ada-002 (6 RPM per 1000 TPM)
+EmbeddingTokensPerMinute = int(os.environ.get("COPILOT_EMBEDDING_TPM") or 240000)
+EmbeddingRequestsPerMinute = int(os.environ.get("COPILOT_EMBEDDING_RPM") or 1440)
+
+# Requests in flight at once - enough to hide request latency without bursting past the quota
+EmbeddingMaxConcurrentRequests = int(os.environ.get("COPILOT_EMBEDDING_MAX_CONCURRENT_REQUESTS") or 4)
+
+# Attempts per text before its future fails
+EmbeddingMaxAttempts = 8
+# Pause when throttled without a retry-after hint, doubled for each throttle in a row
+DefaultThrottlePauseSeconds = 2.0
+MaxThrottlePauseSeconds = 60.0
+BudgetWindowSeconds = 60.0
+
+
+def get_retry_after_seconds(ex: Exception) -> float|None:
+    """ Seconds to wait before retrying, from the headers or message of a throttled request """
+    response = getattr(ex, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in [("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)]:
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass # retry-after can also be an http date
+    # e.g. "... have exceeded call rate limit of your current OpenAI S0 pricing tier. Please retry after 3 seconds."
+    match = re.search(r"retry after (\d+) second", str(ex))
+    return float(match.group(1)) if match else None
+
+
+def is_retryable_error(ex: Exception) -> bool:
+    if isinstance(ex, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(ex, openai.APIStatusError):
+        return ex.status_code == 408 or ex.status_code >= 500
+    return False
+
+
+class _EmbeddingWork:
+    __slots__ = ("text", "num_tokens", "future", "attempts")
+
+    def __init__(self, text: str, num_tokens: int) -> None:
+        self.text = text
+        self.num_tokens = num_tokens
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+class EmbeddingScheduler:
+    """ Process-wide queue for embedding requests to one embeddings deployment.
+
+    Texts submitted from any thread are packed into requests of up to max_texts_per_request
+      texts and max_tokens_per_request tokens, and sent when they fit in the tokens-per-minute
+      and requests-per-minute budget of the deployment over the last minute.
+    When a request is throttled all sending pauses for the retry-after time given by the
+      service, and its texts go back to the front of the queue - so the indexing threads
+      back off once together rather than each retrying on its own schedule.
+    Other transient errors are retried up to EmbeddingMaxAttempts times per text.
+    """
+
+    def __init__(self,
+                 embed_fn: Callable[[list[str]], list[list[float]]],
+                 tokens_per_minute: int = EmbeddingTokensPerMinute,
+                 requests_per_minute: int = EmbeddingRequestsPerMinute,
+                 max_texts_per_request: int = EmbeddingMaxTextsPerRequest,
+                 max_tokens_per_request: int = EmbeddingMaxTokensPerRequest,
+                 max_concurrent_requests: int = EmbeddingMaxConcurrentRequests) -> None:
+        self.embed_fn = embed_fn
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_texts_per_request = max_texts_per_request
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_concurrent_requests = max_concurrent_requests
+
+        self._cond = threading.Condition()
+        self._pending: deque[_EmbeddingWork] = deque()
+        # (time, tokens) of the requests sent in the last BudgetWindowSeconds
+        self._sent: deque[tuple[float, int]] = deque()
+        self._sent_tokens = 0
+        self._paused_until = 0.0
+        self._num_throttled_in_row = 0
+        self._slots = threading.Semaphore(max_concurrent_requests)
+        self._executor: ThreadPoolExecutor|None = None
+        self._dispatcher: threading.Thread|None = None
+
+        # Stats
+        self.num_requests = 0
+        self.num_texts = 0
+        self.num_tokens = 0
+        self.num_throttled = 0
+        self.num_failed = 0
+
+    def submit(self, texts: list[str]) -> list[Future]:
+        """ Queue texts to embed - each future's result is the float32 vector of its text """
+        work = [_EmbeddingWork(text, n) for text, n in zip(texts, get_num_tokens_batch(texts))]
+        with self._cond:
+            self._start()
+            self._pending.extend(work)
+            self._cond.notify_all()
+        return [w.future for w in work]
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        """ Embed texts, waiting for the results """
+        return [future.result() for future in self.submit(texts)]
+
+    def _start(self) -> None:
+        if self._dispatcher is None:
+            self._executor = ThreadPoolExecutor(max_workers = self.max_concurrent_requests,
+                                                thread_name_prefix = "embedding-request")
+            self._dispatcher = threading.Thread(target = self._dispatch, name = "embedding-scheduler", daemon = True)
+            self._dispatcher.start()
+            log_info(f"EmbeddingScheduler: started - budget {self.tokens_per_minute} TPM {self.requests_per_minute} RPM, "
+                     f"max {self.max_texts_per_request} texts and {self.max_tokens_per_request} tokens per request, "
+                     f"{self.max_concurrent_requests} concurrent requests")
+
+    def _get_next_batch_size(self) -> tuple[int, int]:
+        """ Number of texts and tokens in the next request - always at least one text, even if it's over the token limit """
+        n_texts = 1
+        n_tokens = self._pending[0].num_tokens
+        while n_texts < min(len(self._pending), self.max_texts_per_request) and \
+                n_tokens + self._pending[n_texts].num_tokens <= self.max_tokens_per_request:
+            n_tokens += self._pending[n_texts].num_tokens
+            n_texts += 1
+        return n_texts, n_tokens
+
+    def _get_budget_wait(self, n_tokens: int, now: float) -> float:
+        """ Seconds until a request of n_tokens fits in the budget """
+        while self._sent and self._sent[0][0] <= now - BudgetWindowSeconds:
+            self._sent_tokens -= self._sent.popleft()[1]
+
+        wait = 0.0
+        if self.requests_per_minute > 0 and len(self._sent) >= self.requests_per_minute:
+            wait = self._sent[len(self._sent) - self.requests_per_minute][0] + BudgetWindowSeconds - now
+        if self.tokens_per_minute > 0 and self._sent and self._sent_tokens + n_tokens > self.tokens_per_minute:
+            # Wait until enough of the oldest requests leave the window - a request bigger than
+            #  the whole budget goes alone once the window is empty
+            excess = self._sent_tokens + n_tokens - self.tokens_per_minute
+            for sent_time, sent_tokens in self._sent:
+                excess -= sent_tokens
+                if excess <= 0:
+                    break
+            wait = max(wait, sent_time + BudgetWindowSeconds - now)
+        return max(wait, self._paused_until - now)
+
+    def _dispatch(self) -> None:
+        while True:
+            self._slots.acquire()
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        self._cond.wait()
+                        continue
+                    now = time.monotonic()
+                    n_texts, n_tokens = self._get_next_batch_size()
+                    wait = self._get_budget_wait(n_tokens, now)
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+
+                batch = [self._pending.popleft() for _ in range(n_texts)]
+                self._sent.append((now, n_tokens))
+                self._sent_tokens += n_tokens
+
+            self._executor.submit(self._send, batch, n_tokens)
+
+    def _send(self, batch: list[_EmbeddingWork], n_tokens: int) -> None:
+        start = time.perf_counter()
+        try:
+            vectors = self.embed_fn([w.text for w in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(f"Got {len(vectors)} embeddings for {len(batch)} texts")
+        except Exception as ex:
+            self._slots.release()
+            self._handle_error(batch, ex)
+            MetricEmbeddingRequest(int((time.perf_counter() - start) * 1000), ok = False,
+                                   n_texts = len(batch), throttled = isinstance(ex, openai.RateLimitError))
+            return
+
+        self._slots.release()
+        with self._cond:
+            self._num_throttled_in_row = 0
+            self.num_requests += 1
+            self.num_texts += len(batch)
+            self.num_tokens += n_tokens
+        for w, vector in zip(batch, vectors):
+            # Don't keep the service's lists of python floats around any longer than needed
+            w.future.set_result(np.asarray(vector, dtype = np.float32))
+        MetricEmbeddingRequest(int((time.perf_counter() - start) * 1000), ok = True, n_texts = len(batch))
+
+    def _handle_error(self, batch: list[_EmbeddingWork], ex: Exception) -> None:
+        throttled = isinstance(ex, openai.RateLimitError)
+        retry = []
+        for w in batch:
+            w.attempts += 1
+            if (throttled or is_retryable_error(ex)) and w.attempts < EmbeddingMaxAttempts:
+                retry.append(w)
+            else:
+                w.future.set_exception(ex)
+
+        with self._cond:
+            if throttled:
+                self.num_throttled += 1
+                self._num_throttled_in_row += 1
+                pause = get_retry_after_seconds(ex)
+                if pause is None:
+                    pause = min(DefaultThrottlePauseSeconds * 2 ** (self._num_throttled_in_row - 1), MaxThrottlePauseSeconds)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                log_debug(f"EmbeddingScheduler: throttled - pausing for {pause:.1f}s")
+            else:
+                # Back off a little before other errors are retried
+                self._paused_until = max(self._paused_until, time.monotonic() + DefaultThrottlePauseSeconds)
+
+            if len(retry) < len(batch):
+                self.num_failed += len(batch) - len(retry)
+                log_exception(f"EmbeddingScheduler: failed to embed {len(batch) - len(retry)} texts: {ex}")
+            elif not throttled:
+                log_warning(f"EmbeddingScheduler: retrying {len(retry)} texts after error: {ex}")
+            # Retried texts go first so callers see results in roughly submission order
+            self._pending.extendleft(reversed(retry))
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.num_requests,
+            "texts": self.num_texts,
+            "tokens": self.num_tokens,
+            "throttled": self.num_throttled,
+            "failed": self.num_failed,
+            "pending": len(self._pending),
+        }
+
+    def log_stats(self) -> None:
+        log_info(f"EmbeddingScheduler stats: {self.get_stats()}")
+
+
+_embedding_schedulers: dict[str, EmbeddingScheduler] = {}
+_embedding_schedulers_lock = threading.Lock()
+
+def get_embedding_scheduler(services) -> EmbeddingScheduler:
+    """ The scheduler for the embeddings deployment of services (a ServicesWrapper) """
+    deployment = services.get_embeddings_deployment_name()
+    with _embedding_schedulers_lock:
+        scheduler = _embedding_schedulers.get(deployment)
+        if scheduler is None:
+            # The scheduler handles throttling, so the client mustn't retry on its own
+            embed_service = services.create_embeddings_service(max_retries = 0)
+            scheduler = EmbeddingScheduler(
+                lambda texts: embed_service.embed_documents(texts, chunk_size = len(texts)))
+            _embedding_schedulers[deployment] = scheduler
+        return scheduler
+
+def get_embedding_schedulers() -> list[EmbeddingScheduler]:
+    with _embedding_schedulers_lock:
+        return list(_embedding_schedulers.values())
@@ -0,0 +1,100 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set, Tuple
+
+from shared.indexing.BlobOps import BlobOps
+from shared.indexing.IndexOps import AzureAiIndexOps
+from shared.indexing.SearchIndexConfig import (
+    FieldName_Uri, FieldName_ItemType, FieldName_DocLastUpdateTime, FieldName_IndexUpdateTime,
+    FieldName_TotalDocumentLength, FieldName_ContentLength, FieldName_GroupId, FieldName_TotalDocumentNumChunks,
+    ItemType_DocumentChunk, ItemType_DocumentWhole, ItemType_DocumentSummary
+)
+from shared.OpenTelemetry import log_info
+
+# All the rebuild decisions need from each index doc
+ManifestFields = [
+    FieldName_Uri,
+    FieldName_ItemType,
+    FieldName_DocLastUpdateTime,
+    FieldName_IndexUpdateTime,
+    FieldName_TotalDocumentLength,
+    FieldName_ContentLength,
+    FieldName_GroupId,
+    FieldName_TotalDocumentNumChunks,
+]
+
+# Docs per page when streaming the index - the manifest fields are small
+ManifestPageSize = 1000
+
+
+@dataclass
+class IndexManifestEntry:
+    """ What the index holds for one file """
+    # Representative of all the chunk docs for the non-content fields
+    chunk_doc: Dict[str, Any]|None = None
+    num_chunk_docs: int = 0
+    chunk_group_ids: Set[str] = field(default_factory = set)
+    whole_docs: List[Dict[str, Any]] = field(default_factory = list)
+    summary_docs: List[Dict[str, Any]] = field(default_factory = list)
+
+    def is_empty(self) -> bool:
+        return self.num_chunk_docs == 0 and not self.whole_docs and not self.summary_docs
+
+    def get_chunk_group(self) -> Tuple[str, int]|None:
+        """ The group id and number of chunks of the chunk docs, if they're all of one group
+        and their count matches its TotalDocumentNumChunks - so their Ids can be generated """
+        if self.chunk_doc is None or len(self.chunk_group_ids) != 1:
+            return None
+        group_id = self.chunk_doc.get(FieldName_GroupId)
+        num_chunks = self.chunk_doc.get(FieldName_TotalDocumentNumChunks)
+        if not group_id or num_chunks != self.num_chunk_docs:
+            return None
+        return group_id, num_chunks
+
+
+class IndexManifest:
+    """ The index docs of every file, from one pass over the index, so the ifNewer decisions
+    of a rebuild need no search per file - a file that's up to date is skipped without any
+    round trip, and only files with work to do fetch their docs.
+    The manifest is a snapshot from the start of the rebuild - each file is only processed once
+      per rebuild, so only its own changes would make its entry stale.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, IndexManifestEntry] = {}
+        self.num_docs = 0
+
+    @staticmethod
+    def build(index_ops: AzureAiIndexOps, page_size: int = ManifestPageSize) -> "IndexManifest":
+        start = time.perf_counter()
+        manifest = IndexManifest()
+        for doc in index_ops.iter_index_docs(None, copilot_enabled_only = False,
+                                             select_extra_fields = ManifestFields, page_size = page_size):
+            manifest.add(doc)
+        log_info(f"IndexManifest: {manifest.num_docs} docs of {len(manifest.entries)} files "
+                 f"in {time.perf_counter() - start:.1f}s")
+        return manifest
+
+    def add(self, doc: Dict[str, Any]) -> None:
+        self.num_docs += 1
+        uri = doc.get(FieldName_Uri)
+        if not uri:
+            return
+        entry = self.entries.get(uri)
+        if entry is None:
+            entry = self.entries[uri] = IndexManifestEntry()
+
+        item_type = doc.get(FieldName_ItemType)
+        if item_type == ItemType_DocumentChunk:
+            entry.num_chunk_docs += 1
+            entry.chunk_group_ids.add(doc.get(FieldName_GroupId))
+            if entry.chunk_doc is None:
+                entry.chunk_doc = doc
+        elif item_type == ItemType_DocumentWhole:
+            entry.whole_docs.append(doc)
+        elif item_type == ItemType_DocumentSummary:
+            entry.summary_docs.append(doc)
+
+    def get_entry(self, file: str) -> IndexManifestEntry:
+        """ The entry for a blob name or uri - empty if the index has no docs for it """
+        return self.entries.get(BlobOps.get_nameOrUri_uri(file)) or IndexManifestEntry()
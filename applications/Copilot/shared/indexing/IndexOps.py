@@ -1,18 +1,31 @@
 
 from datetime import datetime, timedelta, timezone
+import base64
+import hashlib
 import json
-from typing import Literal, Optional, Dict, Any, List, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Literal, Optional, Dict, Any, List, Tuple, Iterable, Iterator
 
 import os
 import numpy as np
 import pydantic
-from tenacity import retry, wait_exponential, stop_after_attempt, before_sleep, before_sleep_log
-import logging
 
+from azure.core.exceptions import HttpResponseError
 from azure.search.documents.indexes.models import SearchIndex
 
 from CopilotPythonHost.libs.models.GetIndexDocumentInfo import GetIndexDocumentInfoDocInfo, GetIndexDocumentInfoResponse
 from shared.indexing.BlobOps import BlobOps
+from shared.indexing.Pipeline import PipelineStage, run_pipeline
+from shared.indexing.EmbeddingCache import EmbeddingCache, get_embedding_cache
+from shared.indexing.EmbeddingScheduler import get_embedding_scheduler
+from shared.indexing.IndexPayload import IndexAction_Upload, IndexAction_Merge, IndexAction_Delete
+from shared.indexing.IndexUploader import IndexUploader, AsyncIndexUploader
+from shared.indexing.AsyncIndexLoop import AsyncIndexIoEnabled, get_async_index_loop, get_async_search_client
+from shared.indexing.IndexingStats import Stage_Embed, Stage_Upload, get_indexing_stats
+from shared.indexing.IndexProjections import (
+    Projection_DocInfo, Projection_NoVector, get_projection, get_select_fields
+)
 from shared.Utils import get_num_tokens, get_search_filter, try_parse_isodate, get_index_timestr
 from shared.indexing.SearchIndexConfig import (
     FieldName_ContentTokenCount,
@@ -29,15 +42,17 @@ from shared.indexing.SearchIndexConfig import (
     ItemType_DocumentChunk,
     FieldName_Id, FieldName_IndexUpdateTime,
     FieldName_ItemType, FieldName_Content,
-    FieldName_ParsePath, FieldName_PageNumber,
+    FieldName_ParsePath, FieldName_PageNumber, FieldName_LastPageNumber,
     FieldName_CopilotEnabled, FieldName_GroupId,
-    FieldName_Vector
+    FieldName_Vector, FieldName_ContentHash, FieldName_PageContentHash,
+    FieldName_RequestChunkSize, FieldName_IndexerSource,
+    FieldName_ProcessingParameters, FieldName_ChunkIndex
 )
 
-from shared.ServicesWrapper import ServicesWrapper
-from shared.Utils import timed
+from shared.ServicesWrapper import ServicesWrapper, get_services_wrapper
+from shared.Utils import timed, get_content_hash
 from shared.OpenTelemetry import (
-    log_exception, log_info, log_debug, log_warning, logger,
+    log_exception, log_info, log_debug, log_warning,
     MetricDeleteDocument, MetricGetDocumentInfo
 )
 
@@ -46,6 +61,52 @@ from shared.OpenTelemetry import (
 #   the fist part of the document is likely to contain most of the info we need
 MaxWholeDocTextSizeForVectorEmbeddings = 8*1000
 
+# Number of chunks embedded and uploaded together when streaming a document into the index -
+#  together with IndexPipelineQueueSize this sets the peak memory used per document
+DefaultIndexBatchSize = int(os.environ.get("COPILOT_INDEX_BATCH_SIZE") or 100)
+IndexPipelineQueueSize = 2
+
+# Max number of ids in one search.in filter
+MaxIdsPerFilter = 100
+# Candidate search.in delimiters for values that may contain ',' - e.g. blob uris
+SearchInDelimiters = "|,;^~"
+
+# Page size when streaming through index docs with iter_index_docs
+DefaultIndexDocsPageSize = 1000
+# Keyset pagination order - both fields must be sortable in the index
+KeysetOrderFields = [FieldName_IndexUpdateTime, FieldName_Id]
+ContinuationTokenVersion = 1
+# Index name -> whether the live index can be paged by keyset (indexes created before 
+#  the order fields were sortable can only be paged with skip)
+_keyset_paging_support: Dict[str, bool] = {}
+# Names of the indexes known to exist - checking is slow, and indexes are rarely deleted
+_existing_index_names: set[str] = set()
+
+# Fields updated in place on chunks whose content is unchanged by an incremental reindex
+#  - everything except Content, the vector and the derived content fields
+IncrementalMergeFields = [
+    FieldName_PageNumber, FieldName_LastPageNumber, FieldName_ParsePath, FieldName_PageContentHash,
+    FieldName_Title, FieldName_Uri, FieldName_RequestChunkSize, FieldName_TotalDocumentNumChunks,
+    FieldName_TotalDocumentLength, FieldName_DocLastUpdateTime, FieldName_IndexerSource,
+    FieldName_ProcessingParameters, FieldName_DocUnstructuredMetadata, FieldName_CopilotEnabled,
+    FieldName_GroupId, FieldName_IndexUpdateTime, FieldName_FilterTags, FieldName_ChunkIndex,
+]
+# Vectors of overwritten chunks kept by an incremental reindex, for chunks whose content moved
+#  later in the document - a few MB. Content that moved further than this is embedded again
+IncrementalMaxOverwrittenVectors = 1000
+
+
+def _add_page_range(ranges: List[List[int]], first: int, last: int|None) -> None:
+    """ Add pages first-last to ranges in page order, merging it with the last range if they touch """
+    last = last if last is not None else first
+    if ranges and first <= ranges[-1][1] + 1:
+        ranges[-1][1] = max(ranges[-1][1], last)
+    else:
+        ranges.append([first, last])
+
+def _format_page_ranges(ranges: List[List[int]]) -> str:
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
 # TODO: could use python TypedDict instead of pydantic BaseModel (no runtime checking)
 class IndexDocumentInfo(pydantic.BaseModel):
     model_config = pydantic.ConfigDict(extra='forbid')
@@ -94,17 +155,109 @@ class IndexDocumentChunk(pydantic.BaseModel):
     ContentTokenCount: int
     ContentLength: int
     ParsePath: Optional[str] = None
+    LastPageNumber: Optional[int] = None
+    ContentHash: Optional[str] = None
+    PageContentHash: Optional[str] = None
     Id: Optional[str] = None
     ContentVector: Optional[List[float]] = None
     ItemType: Optional[str] = ItemType_DocumentChunk
+    ChunkIndex: Optional[int] = None
 
     def to_doc_dict(self, chunk_group_id: str, chunk_num: int) -> Dict[str, str|int]:
         d = self.model_dump()
         d[FieldName_ParsePath] = d[FieldName_ParsePath] or str( d[FieldName_PageNumber] or '')
-        d[FieldName_Id] = d[FieldName_Id] or f"{chunk_group_id}-{chunk_num}"
+        d[FieldName_ContentHash] = d[FieldName_ContentHash] or get_content_hash(self.Content)
+        if d[FieldName_LastPageNumber] is None:
+            d[FieldName_LastPageNumber] = d[FieldName_PageNumber]
+        d[FieldName_Id] = d[FieldName_Id] or get_chunk_doc_id(chunk_group_id, chunk_num)
+        if d[FieldName_ChunkIndex] is None and d[FieldName_ItemType] == ItemType_DocumentChunk:
+            d[FieldName_ChunkIndex] = chunk_num
         return d
 
 
+def get_chunk_doc_id(chunk_group_id: str, chunk_num: int) -> str:
+    return f"{chunk_group_id}-{chunk_num}"
+
+def get_chunk_doc_ids(chunk_group_id: str, num_chunks: int) -> List[str]:
+    """ Ids of all the chunk docs of a group - chunks are numbered from 0 and the stale
+    chunks of a shrunk document are deleted, so these are exactly the group's docs """
+    return [get_chunk_doc_id(chunk_group_id, i) for i in range(num_chunks)]
+
+
+@dataclass
+class IndexDocsPage:
+    docs: List[Dict[str, Any]]
+    # Pass to the next find_index_docs_page call - None on the last page
+    continuation_token: str|None
+    # Total matching docs when the first page was requested
+    total_count: int|None = None
+
+
+@dataclass
+class IndexDocsPageQuery:
+    """ The search for one page of find_index_docs_page - shared by the sync and async index ops """
+    filter: str|None
+    page_filter: str|None
+    fields: List[str]
+    order_by: List[str]|None
+    skip: int|None
+    keyset: bool
+    count_now: bool
+    total_count: int|None
+
+    def get_search_args(self, page_size: int) -> Dict[str, Any]:
+        return dict(search_text = "", filter = self.page_filter, select = self.fields, order_by = self.order_by,
+                    include_total_count = self.count_now, skip = self.skip, top = page_size)
+
+    def get_page(self, docs: List[Dict[str, Any]], page_size: int, total_count: int|None) -> IndexDocsPage:
+        next_token = None
+        if len(docs) >= page_size:
+            next_state = {"t": docs[-1][FieldName_IndexUpdateTime], "id": docs[-1][FieldName_Id]} if self.keyset \
+                            else {"skip": (self.skip or 0) + len(docs)}
+            if total_count is not None:
+                next_state["n"] = total_count
+            next_token = encode_continuation_token(next_state, self.filter)
+
+        log_debug(f"Returning page of {len(docs)} documents for filter '{self.page_filter}' (of total: {total_count})")
+        return IndexDocsPage(docs = docs, continuation_token = next_token, total_count = total_count)
+
+
+def _get_filter_hash(filter: str|None) -> str:
+    return hashlib.sha256((filter or '').encode('utf-8')).hexdigest()[:16]
+
+def encode_continuation_token(state: Dict[str, Any], filter: str|None) -> str:
+    """ Opaque token for the position after the last doc of a page, tied to the filter it was made for """
+    state = {"v": ContinuationTokenVersion, "f": _get_filter_hash(filter), **state}
+    return base64.urlsafe_b64encode(json.dumps(state, separators = (',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_continuation_token(token: str, filter: str|None) -> Dict[str, Any]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid continuation token")
+    if state.get("v") != ContinuationTokenVersion or state.get("f") != _get_filter_hash(filter):
+        raise ValueError("Continuation token doesn't match the request")
+    return state
+
+def get_keyset_filter(last_update_time: str|None, last_id: str) -> str:
+    """ Docs after (last_update_time, last_id) in KeysetOrderFields order - nulls sort first """
+    id_value = last_id.replace("'", "''")
+    if last_update_time is None:
+        return (f"(({FieldName_IndexUpdateTime} eq null and {FieldName_Id} gt '{id_value}') "
+                f"or {FieldName_IndexUpdateTime} ne null)")
+    return (f"(({FieldName_IndexUpdateTime} gt {last_update_time}) "
+            f"or ({FieldName_IndexUpdateTime} eq {last_update_time} and {FieldName_Id} gt '{id_value}'))")
+
+
+def get_search_in_filter(field: str, values: List[str]) -> str:
+    """ A search.in filter matching any of the values - delimited by a character none of them contain """
+    delimiter = next((c for c in SearchInDelimiters if not any(c in v for v in values)), None)
+    if delimiter is None:
+        return "(" + " or ".join(get_search_filter([(field, v)]) for v in values) + ")"
+    joined = delimiter.join(values).replace("'", "''")
+    return f"search.in({field}, '{joined}', '{delimiter}')"
+
+
 class AzureAiIndexOps:
 
     def __init__(self, index_name: str = None, services: ServicesWrapper = None):
@@ -113,9 +266,8 @@ class AzureAiIndexOps:
             self.index_name = services._vector_index_name
         else:
             self.index_name = index_name or ServicesWrapper.get_default_read_index_name()
-            self.services = ServicesWrapper(index_name = self.index_name)
+            self.services = get_services_wrapper(self.index_name)
         log_info(f"AzureAiIndexOps: index_name: {self.index_name}")
-        self._cached_index_names = []
 
     # TODO: Only create index for indexing operations - not for search
     #   otherwise we create random indexes with errrant runflags
@@ -129,10 +281,23 @@ class AzureAiIndexOps:
         index = SearchIndex(
             name = self.index_name, 
             fields = IndexFields,
-            vector_search = get_vector_search_config(), 
+            # The local search backend searches vectors exactly and has no vectorizer
+            vector_search = get_vector_search_config() if not self.services.is_local_search() else None, 
             #semantic_search=semantic_search
         )
-        result = index_client.create_or_update_index(index)
+        _keyset_paging_support.pop(self.index_name, None)
+        try:
+            result = index_client.create_or_update_index(index)
+        except HttpResponseError as e:
+            if not self.index_exists():
+                raise
+            # Attributes of existing fields (e.g. sortable) can't be changed without recreating
+            #  the index - keep the existing fields as they are and only add new ones
+            log_warning(f"Index '{self.index_name}' can't be updated to the current schema - adding new fields only: {e.message}")
+            existing = index_client.get_index(self.index_name)
+            existing_names = set(f.name for f in existing.fields)
+            existing.fields = [*existing.fields, *[f for f in IndexFields if f.name not in existing_names]]
+            result = index_client.create_or_update_index(existing)
         log_info(f"Index '{result.name}' created or updated")
 
     @timed()
@@ -140,15 +305,15 @@ class AzureAiIndexOps:
         """Check to see if index exits.
         We only need this because of langchains propensity to create indexes on-the-fly 
          during a query rather than throwing an error.
-        This call is pretty slow to make every call, so cache positive responses.
+        This call is pretty slow to make every call, so cache positive responses (for the process).
         """
-        if self.index_name in self._cached_index_names:
+        if self.index_name in _existing_index_names:
             return True
         index_client = self.services.get_search_index_client()
         index_names = [i for i in index_client.list_index_names()]
         found = self.index_name in index_names
         if found:
-            self._cached_index_names.append(self.index_name)
+            _existing_index_names.add(self.index_name)
         return found
 
     @timed()
@@ -156,93 +321,299 @@ class AzureAiIndexOps:
         log_info(f"Deleting index '{self.index_name}'")
         index_client = self.services.get_search_index_client()
         index_client.delete_index(self.index_name)
+        _existing_index_names.discard(self.index_name)
+        _keyset_paging_support.pop(self.index_name, None)
 
     @timed()
     def _add_embeddings(self, 
                         doc_dicts: list[dict[str, Any]],
                         file: str|None = None
                         ):
-        log_info(f"Getting embeddings for {len(doc_dicts)} documents")
-        embed_service = self.services.get_embeddings_service()
-        text_chunks = [ d[FieldName_Content] for d in doc_dicts]
-
-        vector_embeddings = self._embed_documents(text_chunks)
+        with get_indexing_stats().stage(Stage_Embed, file):
+            self._add_embeddings_to_docs(doc_dicts, file)
 
+    def _add_embeddings_to_docs(self, doc_dicts: list[dict[str, Any]], file: str|None):
+        text_chunks = [ d[FieldName_Content] for d in doc_dicts]
+        cache = get_embedding_cache()
+        deployment = self.services.get_embeddings_deployment_name()
+
+        # Identical chunks (e.g. repeated headers or boilerplate pages) are embedded once
+        keys = [EmbeddingCache.get_key(text) for text in text_chunks]
+        unique_keys = list(dict.fromkeys(keys))
+        vectors = cache.get(deployment, unique_keys)
+
+        missing_keys = [key for key in unique_keys if key not in vectors]
+        log_info(f"Getting embeddings for {len(doc_dicts)} documents - "
+                 f"{len(unique_keys) - len(missing_keys)} cached, {len(missing_keys)} to embed")
+        if missing_keys:
+            first_index = {}
+            for i, key in enumerate(keys):
+                first_index.setdefault(key, i)
+            vector_embeddings = self._embed_documents([text_chunks[first_index[key]] for key in missing_keys])
+            new_vectors = [(key, np.asarray(vec, dtype = np.float32)) for key, vec in zip(missing_keys, vector_embeddings)]
+            vectors.update(new_vectors)
+            cache.put(deployment, [(key, vec) for key, vec in new_vectors if vec.size])
+
+        # One contiguous float32 matrix per batch - each doc's vector is a view of its row,
+        #  serialized straight into the upload payload
+        dims = max(v.size for v in vectors.values())
+        batch_vectors = np.empty((len(doc_dicts), dims), dtype = np.float32)
         for i in range(len(doc_dicts)):
-            # TODO: Do we really need numpy here?
-            vec_list = np.array(vector_embeddings[i], dtype = np.float32).tolist()
-            if not vec_list:
-                log_warning(f"Empty vector embeddings vector {i} for file '{file}'")
-            doc_dicts[i][FieldName_Vector] = vec_list
-
-    @retry(
-        wait=wait_exponential(multiplier=1, min=1, max=60), 
-        stop=stop_after_attempt(8),
-        before_sleep = before_sleep_log(logger, logging.DEBUG),
-    )
-    # Will throw a RetryError if all retries fail
-    # "Error processing pdf file: Error code: 429 - {'error': {'code': '429', 'message': 'Requests to the Embeddings_Create Operation under Azure OpenAI API version 2023-05-15 have exceeded call rate limit of your current OpenAI S0 pricing tier. Please retry after 3 seconds. Please go here: https://aka.ms/oai/quotaincrease if you would like to further increase the default rate limit.'}}"
-    def _embed_documents(self, text_chunks: List[str]) -> List[List[float]]:
-        embed_service = self.services.get_embeddings_service()
-        return embed_service.embed_documents(text_chunks)
+            vec = vectors[keys[i]]
+            if vec.size == dims:
+                batch_vectors[i] = vec
+                doc_dicts[i][FieldName_Vector] = batch_vectors[i]
+            else:
+                log_warning(f"Vector embeddings vector {i} for file '{file}' has {vec.size} dimensions, expected {dims}")
+                doc_dicts[i][FieldName_Vector] = vec
+
+    def _embed_documents(self, text_chunks: List[str]) -> List[np.ndarray]:
+        # Throttling and retries are handled by the process-wide scheduler, shared with the 
+        #  other indexing threads
+        return get_embedding_scheduler(self.services).embed(text_chunks)
 
     @timed()
     def add_doc_index_chunks_to_index(self, 
-                        chunks: List[IndexDocumentChunk],
+                        chunks: Iterable[IndexDocumentChunk],
                         doc_info: IndexDocumentInfo,
-                        file:str|None = None):
+                        file:str|None = None,
+                        batch_size:int|None = None) -> int:
         """ Adds a Document to the index, with each chunk as a separate index document.
         doc_info contains the data common to all chunks, which is merged with the chunks.
+        Chunks are consumed lazily and streamed through embedding and upload in batches,
+          with bounded queues between the stages, so only a few batches are in memory at once.
+        Returns the number of chunks added.
         """
-        log_info(f"Adding {len(chunks)} document chunks for {file} to index {self.index_name}")
+        batch_size = batch_size or DefaultIndexBatchSize
+        log_info(f"Adding {doc_info.TotalDocumentNumChunks} document chunks for {file} to index {self.index_name} in batches of {batch_size}")
 
-        if len(chunks) == 0:
+        chunk_group_id = doc_info.get_chunk_group_id()
+        # Merge the common doc info with each chunk
+        info_dict = doc_info.to_doc_dict(chunk_group_id)
+
+        def merged_doc_batches() -> Iterator[List[Dict[str, Any]]]:
+            batch = []
+            for (i, c) in enumerate(chunks):
+                batch.append({**c.to_doc_dict(chunk_group_id, i), **info_dict})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def embed(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            # Call embedding service to get vectors for each chunk
+            self._add_embeddings(batch, file)
+            return batch
+
+        def upload(batch: List[Dict[str, Any]]) -> int:
+            self.upload_documents(batch)
+            get_indexing_stats().add("chunks", len(batch))
+            return len(batch)
+
+        n_added = sum(run_pipeline(
+            f"add-chunks-{file}",
+            merged_doc_batches(),
+            [
+                PipelineStage("embed", embed, queue_size = IndexPipelineQueueSize),
+                PipelineStage("upload", upload, queue_size = IndexPipelineQueueSize),
+            ]))
+
+        if n_added == 0:
             log_warning("No document chunks to upload")
-            return
+        elif n_added != doc_info.TotalDocumentNumChunks:
+            log_warning(f"Added {n_added} chunks for '{file}' but TotalDocumentNumChunks is {doc_info.TotalDocumentNumChunks}")
+        return n_added
+
 
+    @timed()
+    def update_doc_index_chunks_incrementally(self, 
+                        chunks: Iterable[IndexDocumentChunk],
+                        doc_info: IndexDocumentInfo,
+                        existing_chunk_docs: List[Dict[str, Any]],
+                        file:str|None = None,
+                        batch_size:int|None = None) -> int:
+        """Update the chunks of a changed document, re-embedding only chunks whose content changed.
+        existing_chunk_docs are the document's current chunk docs - at least Id and ContentHash.
+        - chunks whose content is unchanged at the same Id only have their non-content fields merged
+        - chunks whose content exists under a different Id (e.g. shifted by an inserted page) are
+          uploaded with the existing vector
+        - all other chunks are embedded and uploaded
+        - existing chunk Ids that are no longer used are deleted
+        Chunks are classified and streamed through embedding and upload in batches, as by
+          add_doc_index_chunks_to_index - only the existing docs' Ids and hashes are held throughout.
+        Returns the number of chunks in the document.
+        """
+        batch_size = batch_size or DefaultIndexBatchSize
         chunk_group_id = doc_info.get_chunk_group_id()
-        # Merge the common doc info with each chunk
         info_dict = doc_info.to_doc_dict(chunk_group_id)
-        merged_docs = [{**c.to_doc_dict(chunk_group_id, i), **info_dict} \
-                        for (i,c) in enumerate(chunks)]
 
-        # Call embedding service to get vectors for each chunk
-        self._add_embeddings(merged_docs, file)
-        self.upload_documents(merged_docs)
+        # Docs indexed before ContentHash was added - hash their content instead
+        unhashed_ids = [d[FieldName_Id] for d in existing_chunk_docs if not d.get(FieldName_ContentHash)]
+        unhashed_docs = self.find_docs_by_ids(unhashed_ids, [FieldName_Content]) if unhashed_ids else []
+        existing_hashes = {d[FieldName_Id]: d.get(FieldName_ContentHash) for d in existing_chunk_docs}
+        existing_hashes.update({d[FieldName_Id]: get_content_hash(d[FieldName_Content] or '') for d in unhashed_docs})
+        existing_ids_by_hash = {}
+        for (id, content_hash) in existing_hashes.items():
+            existing_ids_by_hash.setdefault(content_hash, id)
+        existing_page_hashes = set(d.get(FieldName_PageContentHash) for d in existing_chunk_docs)
+
+        # Vectors of the content of existing docs already overwritten by earlier batches, by
+        #  content hash, for chunks it moved to later in the document
+        overwritten_vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        overwritten_ids: set[str] = set()
+        new_ids: set[str] = set()
+        changed_page_ranges: List[List[int]] = []
+        counts = {"unchanged": 0, "moved": 0, "changed": 0}
+
+        def get_vectors(ids: List[str]) -> Dict[str, np.ndarray]:
+            return {
+                v[FieldName_Id]: np.array(v[FieldName_Vector], dtype = np.float32)
+                    for v in self.find_docs_by_ids(ids, [FieldName_Vector])
+                    if v.get(FieldName_Vector)
+            }
+
+        def classify(batch: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+            """ Split a batch into the docs to upload (moved and changed) and the merges of the unchanged docs """
+            upload_docs, unchanged_docs = [], []
+            for d in batch:
+                new_ids.add(d[FieldName_Id])
+                if d.get(FieldName_PageContentHash) not in existing_page_hashes:
+                    _add_page_range(changed_page_ranges, d[FieldName_PageNumber], d[FieldName_LastPageNumber])
+                if existing_hashes.get(d[FieldName_Id]) == d[FieldName_ContentHash]:
+                    unchanged_docs.append({k: d[k] for k in [FieldName_Id, *IncrementalMergeFields]})
+                else:
+                    upload_docs.append(d)
+
+            # Get the vectors of moved chunks before their old docs are overwritten - by this batch, or
+            #  (from overwritten_vectors) by an earlier one. Batches are classified before they're uploaded
+            moved_docs = [d for d in upload_docs if d[FieldName_ContentHash] in existing_ids_by_hash]
+            overwriting_ids = [d[FieldName_Id] for d in upload_docs
+                                if d[FieldName_Id] in existing_hashes and d[FieldName_Id] not in overwritten_ids]
+            source_ids = set(existing_ids_by_hash[d[FieldName_ContentHash]] for d in moved_docs) - overwritten_ids
+            vectors = get_vectors(list(source_ids.union(overwriting_ids))) if source_ids or overwriting_ids else {}
+            for d in moved_docs:
+                source_id = existing_ids_by_hash[d[FieldName_ContentHash]]
+                d[FieldName_Vector] = overwritten_vectors.get(d[FieldName_ContentHash]) \
+                                        if source_id in overwritten_ids else vectors.get(source_id)
+            n_moved = sum(1 for d in moved_docs if d[FieldName_Vector] is not None)
+            counts["moved"] += n_moved
+            counts["changed"] += len(upload_docs) - n_moved
+            counts["unchanged"] += len(unchanged_docs)
+
+            overwritten_ids.update(overwriting_ids)
+            for id in overwriting_ids:
+                if id in vectors:
+                    overwritten_vectors[existing_hashes[id]] = vectors[id]
+            # A moved chunk whose vector was dropped is embedded again
+            while len(overwritten_vectors) > IncrementalMaxOverwrittenVectors:
+                overwritten_vectors.popitem(last = False)
+            return upload_docs, unchanged_docs
+
+        def classified_batches() -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+            batch = []
+            for (i, c) in enumerate(chunks):
+                batch.append({**c.to_doc_dict(chunk_group_id, i), **info_dict})
+                if len(batch) >= batch_size:
+                    yield classify(batch)
+                    batch = []
+            if batch:
+                yield classify(batch)
+
+        def embed(batch: Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+            needs_embedding = [d for d in batch[0] if d[FieldName_Vector] is None]
+            if needs_embedding:
+                self._add_embeddings(needs_embedding, file)
+            return batch
+
+        def upload(batch: Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]) -> int:
+            upload_docs, unchanged_docs = batch
+            if upload_docs:
+                self.upload_documents(upload_docs)
+                get_indexing_stats().add("chunks", len(upload_docs))
+            self.merge_documents(unchanged_docs)
+            return len(upload_docs) + len(unchanged_docs)
+
+        n_chunks = sum(run_pipeline(
+            f"update-chunks-{file}",
+            classified_batches(),
+            [
+                PipelineStage("embed", embed, queue_size = IndexPipelineQueueSize),
+                PipelineStage("upload", upload, queue_size = IndexPipelineQueueSize),
+            ]))
+
+        stale_docs = [{FieldName_Id: id} for id in existing_hashes if id not in new_ids]
+        if stale_docs:
+            self.delete_documents(stale_docs)
+
+        log_info(f"Incremental update for '{file}': {n_chunks} chunks - {counts['unchanged']} unchanged, "
+                 f"{counts['moved']} moved, {counts['changed']} changed, {len(stale_docs)} stale, "
+                 f"changed pages: {_format_page_ranges(changed_page_ranges) or 'none'}")
+        return n_chunks
+
+    @timed()
+    def find_docs_by_ids(self, ids: List[str], select_extra_fields: List[str]) -> List[Dict[str, Any]]:
+        """Get the selected fields of the docs with the given ids"""
+        search_client = self.services.get_search_client()
+        fields = [FieldName_Id, *select_extra_fields]
+        docs = []
+        for start in range(0, len(ids), MaxIdsPerFilter):
+            batch_ids = ids[start:start + MaxIdsPerFilter]
+            # Ids only contain letters, digits, '_', '-' and '=' so ',' is a safe delimiter
+            filter = f"search.in({FieldName_Id}, '{','.join(batch_ids)}', ',')"
+            docs.extend(search_client.search(
+                search_text = "",
+                filter = filter,
+                select = fields,
+                top = len(batch_ids)
+            ))
+        return docs
+
+    def index_documents(self, docs: List[Dict[str, Any]], action: str) -> List[Any]:
+        """ Send the docs in size-limited batches - only docs that failed are retried. Returns the
+        IndexingResult of every doc, whether it succeeded or not.
+        With AsyncIndexIoEnabled the batches go out on the process-wide async index loop, shared
+          by every document being indexed, rather than on threads of this call.
+        """
+        with get_indexing_stats().stage(Stage_Upload):
+            if AsyncIndexIoEnabled:
+                return get_async_index_loop().run(self._index_documents_async(docs, action))
+            return IndexUploader(self.services.get_search_client()).index_documents(docs, action)
+
+    def _index_documents(self, docs: List[Dict[str, Any]], action: str):
+        response = self.index_documents(docs, action)
+        failed = [r for r in response if not r.succeeded]
+        if failed:
+            log_warning(f"Failed to {action} {len(failed)} of {len(docs)} index documents")
+            raise Exception(failed)
 
+    async def _index_documents_async(self, docs: List[Dict[str, Any]], action: str) -> List[Any]:
+        return await AsyncIndexUploader(get_async_search_client(self.services, self.index_name)).index_documents(docs, action)
+
+    @timed()
+    def merge_documents(self, docs: List[Dict[str, Any]]):
+        if not docs:
+            return 
+        self._index_documents(docs, IndexAction_Merge)
 
     @timed()
     def upload_documents(self, docs: List[Dict[str, Any]]):
-        search_client = self.services.get_search_client()
         if not docs:
             log_warning("No index documents to upload")
             return 
-        response = search_client.upload_documents(docs)
-        if not all([r.succeeded for r in response]):
-            raise Exception(response)
+        self._index_documents(docs, IndexAction_Upload)
 
     @timed()
-    def get_document(self, id)-> dict[str, Any]:
+    def get_document(self, id, projection: str = Projection_NoVector)-> dict[str, Any]:
         search_client = self.services.get_search_client()
-        return search_client.get_document(id)
-
-    # Hack: Polymorphic return: return_total_count:true will return (count,docs) - all other callers don't need this and will return docs only
-    # TODO: Refactor
-    @timed()
-    def find_index_docs(self, 
-                        uri: str|None,
-                        copilot_enabled_only: bool,
-                        doc_type = None,
-                        select_extra_fields: List[str]|None = None,
-                        update_time: Optional[datetime] = None,
-                        page_size:int|None = None,
-                        page_number:int|None = None,
-                        return_total_count: bool = False,
-                        use_index_update_time: bool = True
-                    ) -> List[Dict[str, Any]] | Tuple[int, List[Dict[str, Any]]]:
-        """ Returns skinny documents (only doc Id) matching the filter.
-        Select Id plus any additional fields - if s_a_f is None, omit select to include all fields.
-        """
+        return search_client.get_document(id, selected_fields = get_projection(projection))
+
+    @staticmethod
+    def get_find_index_docs_filter(uri: str|None,
+                                   copilot_enabled_only: bool,
+                                   doc_type = None,
+                                   update_time: Optional[datetime] = None,
+                                   use_index_update_time: bool = True) -> str|None:
         filters = []
 
         if uri:
@@ -262,11 +633,29 @@ class AzureAiIndexOps:
                 update_time, 
                 "gt"))
 
-        filter = get_search_filter(filters)
+        return get_search_filter(filters)
+
+    # Hack: Polymorphic return: return_total_count:true will return (count,docs) - all other callers don't need this and will return docs only
+    # TODO: Refactor
+    @timed()
+    def find_index_docs(self, 
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        page_size:int|None = None,
+                        page_number:int|None = None,
+                        return_total_count: bool = False,
+                        use_index_update_time: bool = True
+                    ) -> List[Dict[str, Any]] | Tuple[int, List[Dict[str, Any]]]:
+        """ Returns skinny documents (only doc Id) matching the filter.
+        Select Id plus any additional fields - if s_a_f is None, all the fields but the vector.
+        """
+        filter = self.get_find_index_docs_filter(uri, copilot_enabled_only, doc_type, update_time, use_index_update_time)
 
         search_client = self.services.get_search_client()
-        fields = [FieldName_Id, *select_extra_fields] \
-                    if select_extra_fields is not None else None
+        fields = get_select_fields(select_extra_fields)
 
         skip = page_size * page_number if (page_number is not None and page_size) else None
         top = page_size or None
@@ -293,6 +682,102 @@ class AzureAiIndexOps:
 
         return matching_docs
 
+    def supports_keyset_paging(self) -> bool:
+        supported = _keyset_paging_support.get(self.index_name)
+        if supported is None:
+            index = self.services.get_search_index_client().get_index(self.index_name)
+            sortable = set(f.name for f in index.fields if f.sortable)
+            supported = all(f in sortable for f in KeysetOrderFields)
+            if not supported:
+                log_info(f"Index '{self.index_name}' can't be sorted by {KeysetOrderFields} - paging with skip. Recreate the index to page by keyset.")
+            _keyset_paging_support[self.index_name] = supported
+        return supported
+
+    @timed()
+    def find_index_docs_page(self, 
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        page_size: int = DefaultIndexDocsPageSize,
+                        continuation_token: str|None = None,
+                        return_total_count: bool = False,
+                        use_index_update_time: bool = True
+                    ) -> IndexDocsPage:
+        """ A page of the docs find_index_docs would return, ordered by IndexUpdateTime then Id.
+        Pages are found by keyset - the filter continues after the last doc of the previous page,
+          so later pages cost the same as the first and there's no skip limit.
+        """
+        query = self.get_index_docs_page_query(uri, copilot_enabled_only, doc_type, select_extra_fields, update_time,
+                                               continuation_token, return_total_count, use_index_update_time)
+        search_client = self.services.get_search_client()
+        try:
+            search_results_response = search_client.search(**query.get_search_args(page_size))
+            docs = [s for s in search_results_response]
+        except Exception as e:
+            log_exception(f"Error searching for documents with filter '{query.page_filter}'", e)
+            raise
+        total_count = search_results_response.get_count() if query.count_now else query.total_count
+        return query.get_page(docs, page_size, total_count)
+
+    def get_index_docs_page_query(self, 
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        continuation_token: str|None = None,
+                        return_total_count: bool = False,
+                        use_index_update_time: bool = True
+                    ) -> IndexDocsPageQuery:
+        """ The search for the page after continuation_token (the first page if None) """
+        filter = self.get_find_index_docs_filter(uri, copilot_enabled_only, doc_type, update_time, use_index_update_time)
+        fields = list(dict.fromkeys([*get_select_fields(select_extra_fields), FieldName_IndexUpdateTime]))
+        state = decode_continuation_token(continuation_token, filter) if continuation_token else {}
+        total_count = state.get("n")
+        count_now = return_total_count and total_count is None
+
+        # Tokens keep the paging mode they were made with
+        keyset = "id" in state or ("skip" not in state and self.supports_keyset_paging())
+        if keyset:
+            page_filter = filter
+            if state:
+                keyset_filter = get_keyset_filter(state["t"], state["id"])
+                page_filter = f"{filter} and {keyset_filter}" if filter else keyset_filter
+            skip, order_by = None, [f"{f} asc" for f in KeysetOrderFields]
+        else:
+            page_filter, skip, order_by = filter, state.get("skip") or None, None
+
+        return IndexDocsPageQuery(filter = filter, page_filter = page_filter, fields = fields, order_by = order_by,
+                                  skip = skip, keyset = keyset, count_now = count_now, total_count = total_count)
+
+    def iter_index_doc_pages(self, 
+                        uri: str|None,
+                        copilot_enabled_only: bool,
+                        doc_type = None,
+                        select_extra_fields: List[str]|None = None,
+                        update_time: Optional[datetime] = None,
+                        page_size: int = DefaultIndexDocsPageSize,
+                        use_index_update_time: bool = True
+                    ) -> Iterator[List[Dict[str, Any]]]:
+        """ Pages of all the docs find_index_docs would return, fetched one page at a time """
+        continuation_token = None
+        while True:
+            page = self.find_index_docs_page(uri, copilot_enabled_only, doc_type, select_extra_fields, update_time,
+                                             page_size = page_size, continuation_token = continuation_token,
+                                             use_index_update_time = use_index_update_time)
+            if page.docs:
+                yield page.docs
+            continuation_token = page.continuation_token
+            if not continuation_token:
+                break
+
+    def iter_index_docs(self, *args, **kwargs) -> Iterator[Dict[str, Any]]:
+        """ Docs find_index_docs would return, streamed at constant memory - same args as iter_index_doc_pages """
+        for docs in self.iter_index_doc_pages(*args, **kwargs):
+            yield from docs
+
     def find_skinny_docs_for_summary(self, uri: str) -> List[Dict[str, Any]]:
         """ Returns skinny documents (only doc Id) matching the uri and ItemType_DocumentSummary"""
 
@@ -305,10 +790,56 @@ class AzureAiIndexOps:
 
     @timed()
     def delete_documents(self, docs:List[dict[str,Any]]):
+        if not docs:
+            return
+        # Only the key is needed to delete
+        self._index_documents([{FieldName_Id: d[FieldName_Id]} for d in docs], IndexAction_Delete)
+
+    @timed()
+    def delete_doc_group(self, chunk_group_id: str, num_chunks: int) -> int:
+        """ Deletes the chunk docs of a group by their Ids, generated from the group id and
+        TotalDocumentNumChunks - no search needed. Returns the number of Ids deleted. """
+        ids = get_chunk_doc_ids(chunk_group_id, num_chunks)
+        log_info(f"Deleting {len(ids)} docChunks of group '{chunk_group_id}'")
+        self.delete_documents([{FieldName_Id: id} for id in ids])
+        return len(ids)
+
+    @timed()
+    def find_docs_to_delete_for_uri(self, uri: str) -> List[Dict[str, Any]]:
+        """ All the docs for a uri (Id and DocLastUpdateTime), from two small searches rather than
+        paging through every chunk doc - one for the whole and summary docs, and one for a chunk
+        doc and the count of chunk docs. The chunk doc Ids are generated from the GroupId and
+        TotalDocumentNumChunks of the chunk doc - if those don't account for the count (chunks
+        of several groups, or indexed without a GroupId), falls back to finding every chunk doc.
+        """
         search_client = self.services.get_search_client()
-        response = search_client.delete_documents(docs)
-        if not all([r.succeeded for r in response]):
-            raise Exception(response)
+        fields = [FieldName_Id, FieldName_DocLastUpdateTime, FieldName_GroupId, FieldName_TotalDocumentNumChunks]
+        uri_filter = (FieldName_Uri, BlobOps.get_nameOrUri_uri(uri))
+
+        other_docs = [d for d in search_client.search(
+                search_text = "",
+                filter = get_search_filter([uri_filter, (FieldName_ItemType, ItemType_DocumentChunk, "ne")]),
+                select = fields)]
+        chunk_results = search_client.search(
+                search_text = "",
+                filter = get_search_filter([uri_filter, (FieldName_ItemType, ItemType_DocumentChunk)]),
+                select = fields,
+                include_total_count = True,
+                top = 1)
+        chunk_docs = [d for d in chunk_results]
+        num_chunk_docs = chunk_results.get_count()
+
+        if num_chunk_docs is not None and num_chunk_docs > len(chunk_docs):
+            doc = chunk_docs[0]
+            group_id, num_chunks = doc.get(FieldName_GroupId), doc.get(FieldName_TotalDocumentNumChunks)
+            if group_id and num_chunks == num_chunk_docs:
+                chunk_docs = [{FieldName_Id: id, FieldName_DocLastUpdateTime: doc[FieldName_DocLastUpdateTime]}
+                                for id in get_chunk_doc_ids(group_id, num_chunks)]
+            else:
+                log_info(f"TotalDocumentNumChunks of '{uri}' doesn't match its {num_chunk_docs} docChunks - searching for all")
+                chunk_docs = self.find_index_docs(uri, copilot_enabled_only = False, doc_type = ItemType_DocumentChunk,
+                                                  select_extra_fields = [FieldName_DocLastUpdateTime])
+        return chunk_docs + other_docs
 
     # TODO: Need to pass in chunk size/overlap to only detect/delete correctly sized chunks
     #  Will need to use groupId rather than Uri for search
@@ -324,11 +855,7 @@ class AzureAiIndexOps:
         matching_docs, n_docs = None, 0
         try:
             uri = BlobOps.get_nameOrUri_uri(uri) # in case only filename part was passed in
-            search_client = self.services.get_search_client(self.index_name)
-            matching_docs = self.find_index_docs(
-                uri, 
-                select_extra_fields = [FieldName_DocLastUpdateTime],
-                copilot_enabled_only = False)
+            matching_docs = self.find_docs_to_delete_for_uri(uri)
             n_docs = len(matching_docs)
 
             if n_docs > 0:
@@ -346,14 +873,13 @@ class AzureAiIndexOps:
                     return len(matching_docs)
 
                 log_info(f"Deleting existing docChunks for uri: {uri}")
-                response = search_client.delete_documents(matching_docs)
-
                 # deletion is idempotent and will succeed for any id so should never get 
                 #  a doc-specific error unless we have a bug passing invalid ids
-                if not all([r.succeeded for r in response]):
+                try:
+                    self.delete_documents(matching_docs)
+                except Exception:
                     matching_docs = None
-                    # TODO: Better exception
-                    raise Exception(response)
+                    raise
         finally:
             MetricDeleteDocument(matching_docs is not None, n_docs)
 
@@ -368,6 +894,19 @@ class AzureAiIndexOps:
                                    metadata: Optional[str] = None,
                                    summary_type: Optional[str] = None):
         
+        merged_doc = self.get_whole_index_document(text, file, doc_last_update_time, item_type, metadata, summary_type)
+
+        # This will upsert if already exists
+        self._index_documents([merged_doc], IndexAction_Upload)
+
+    def get_whole_index_document(self, 
+                                   text: str, 
+                                   file: str,
+                                   doc_last_update_time: datetime,
+                                   item_type: str,
+                                   metadata: Optional[str] = None,
+                                   summary_type: Optional[str] = None) -> Dict[str, Any]:
+        """ The index doc for a whole document or summary, with its vector embeddings """
         uri = BlobOps.get_nameOrUri_uri(file)
         file = BlobOps.get_nameOrUri_filename(file)
 
@@ -409,71 +948,95 @@ class AzureAiIndexOps:
         # TODO: remove when Azure indexer updated or we move completely away from it
         del merged_doc[FieldName_FilterTags]
 
-        search_client = self.services.get_search_client()
         # Limit the amount of text we create embeddings for, but still write entire doc to index
         if len(text) > MaxWholeDocTextSizeForVectorEmbeddings:
             log_info(f"Document text too large for vector embeddings - clipping: {len(text)} chars to {MaxWholeDocTextSizeForVectorEmbeddings} for '{file}'")
             merged_doc[FieldName_Content] = text[:MaxWholeDocTextSizeForVectorEmbeddings]
         self._add_embeddings([merged_doc], file = file)
         merged_doc[FieldName_Content] = text
-
-        # This will upsert if already exists
-        responses = search_client.upload_documents(documents = [merged_doc] )
-
-        if not all([r.succeeded for r in responses]):
-            raise Exception(responses)
+        return merged_doc
 
     # Returning part of a response object is a leaky abstraction
     # This fn should be moved to a new api helper file, as it's only used for GetDocInfo 
     def get_document_info(self, file: str) -> GetIndexDocumentInfoDocInfo | None:
+        return self.get_documents_info([file])[0]
+
+    def get_documents_info(self, files: List[str]) -> List[GetIndexDocumentInfoDocInfo | None]:
+        """ The info of each file (None if it's not in the index), in the order of files """
         try:
-            info = self._get_document_info(file)
-            MetricGetDocumentInfo(True, info is not None)
+            infos = self._get_documents_info(files)
         except Exception as e:
-            MetricGetDocumentInfo(False, False)
-            log_exception(f"Error getting document info for '{file}'", e)
+            for _ in files:
+                MetricGetDocumentInfo(False, False)
+            log_exception(f"Error getting document info for {len(files)} files", e)
             raise
+        for info in infos:
+            MetricGetDocumentInfo(True, info is not None)
+        return infos
+
+    def _get_documents_info(self, files: List[str]) -> List[GetIndexDocumentInfoDocInfo | None]:
+        """ A search per MaxIdsPerFilter files for their first chunk, whole and summary docs,
+        then one lookup for the summary contents - rather than searches per file. """
+        search_client = self.services.get_search_client()
+        uris = list(dict.fromkeys(BlobOps.get_nameOrUri_uri(f) for f in files))
+        fields = get_projection(Projection_DocInfo)
+
+        # Only the first doc of each type is needed - don't get all the chunk docs of large files
+        first_docs, chunk_docs, summary_docs = {}, {}, {}
+        def add_doc(d: Dict[str, Any]):
+            uri = d[FieldName_Uri]
+            first_docs.setdefault(uri, d)
+            if d[FieldName_ItemType] == ItemType_DocumentChunk:
+                chunk_docs.setdefault(uri, d)
+            elif d[FieldName_ItemType] == ItemType_DocumentSummary:
+                summary_docs.setdefault(uri, d)
+
+        def search_uris(batch_uris: List[str], filter: str):
+            uri_filter = get_search_in_filter(FieldName_Uri, batch_uris)
+            for d in search_client.search(search_text = "", filter = f"{uri_filter} and ({filter})", select = fields):
+                add_doc(d)
+
+        for start in range(0, len(uris), MaxIdsPerFilter):
+            search_uris(uris[start:start + MaxIdsPerFilter], 
+                        f"{FieldName_ItemType} ne '{ItemType_DocumentChunk}' or {FieldName_ChunkIndex} eq 0")
+
+        # Chunks indexed before ChunkIndex was added - all their chunks match, so only search
+        #  for the files that are missing a chunk doc
+        missing_uris = [u for u in uris if u not in chunk_docs]
+        for start in range(0, len(missing_uris), MaxIdsPerFilter):
+            search_uris(missing_uris[start:start + MaxIdsPerFilter],
+                        f"{FieldName_ItemType} eq '{ItemType_DocumentChunk}' and {FieldName_ChunkIndex} eq null")
 
-    def _get_document_info(self, file: str) -> GetIndexDocumentInfoDocInfo | None:
-        docs = self.find_index_docs(file, copilot_enabled_only = False, 
-                select_extra_fields = [
-                    FieldName_IndexUpdateTime, 
-                    FieldName_TotalDocumentNumChunks,
-                    FieldName_TotalDocumentLength,
-                    FieldName_ItemType,
-                    FieldName_CopilotEnabled,
-                    FieldName_DocUnstructuredMetadata,
-                    FieldName_Uri,
-                    FieldName_Title
-                ])
-
-        if not docs: 
-            return None
-
-        chunk_docs = [d for d in docs if d[FieldName_ItemType] == ItemType_DocumentChunk]
-        chunk_doc = chunk_docs[0] if chunk_docs else None
-        doc = chunk_doc or docs[0]
-        summary_docs = [d for d in docs if d[FieldName_ItemType] == ItemType_DocumentSummary]
-        summary_doc = summary_docs[0] if summary_docs else None
         # TODO: Could recover from cache here if not in index (though should be copied to index during any ifNewer rebuild)
-        if summary_doc:
-            search_client = self.services.get_search_client()
-            summary_doc = search_client.get_document(summary_doc[FieldName_Id])
-            #summary_doc = self.find_index_docs(file, copilot_enabled_only = False, select_extra_fields = [ FieldName_Content ])[0]
-            
-        info = GetIndexDocumentInfoDocInfo(
-            uri = doc[FieldName_Uri],
-            file = doc[FieldName_Title],
-            indexed_time = doc[FieldName_IndexUpdateTime],
-            # Return -1 if info not available - only if using index maintained by Azure integrated indexer 
-            num_chunk_docs = int(doc[FieldName_TotalDocumentNumChunks] or "-1"),
-            document_size = int(chunk_doc[FieldName_TotalDocumentLength]) if chunk_doc else -1,
-            summary = summary_doc[FieldName_Content] if summary_doc else None,
-            copilot_enabled = doc[FieldName_CopilotEnabled],
-            metadata_json = chunk_doc[FieldName_DocUnstructuredMetadata] if chunk_doc else None,
-            summary_updated_time = summary_doc[FieldName_IndexUpdateTime] if summary_doc else None
-        )
-        return info
+        summary_ids = [d[FieldName_Id] for d in summary_docs.values()]
+        summaries = {d[FieldName_Id]: d for d in self.find_docs_by_ids(summary_ids, [FieldName_Content, FieldName_IndexUpdateTime])} \
+                        if summary_ids else {}
+
+        infos = []
+        for file in files:
+            uri = BlobOps.get_nameOrUri_uri(file)
+            first_doc = first_docs.get(uri)
+            if not first_doc: 
+                infos.append(None)
+                continue
+            chunk_doc = chunk_docs.get(uri)
+            summary_doc = summary_docs.get(uri)
+            summary_doc = summaries.get(summary_doc[FieldName_Id]) if summary_doc else None
+            doc = chunk_doc or first_doc
+
+            infos.append(GetIndexDocumentInfoDocInfo(
+                uri = doc[FieldName_Uri],
+                file = doc[FieldName_Title],
+                indexed_time = doc[FieldName_IndexUpdateTime],
+                # Return -1 if info not available - only if using index maintained by Azure integrated indexer 
+                num_chunk_docs = int(doc[FieldName_TotalDocumentNumChunks] or "-1"),
+                document_size = int(chunk_doc[FieldName_TotalDocumentLength]) if chunk_doc else -1,
+                summary = summary_doc[FieldName_Content] if summary_doc else None,
+                copilot_enabled = doc[FieldName_CopilotEnabled],
+                metadata_json = chunk_doc[FieldName_DocUnstructuredMetadata] if chunk_doc else None,
+                summary_updated_time = summary_doc[FieldName_IndexUpdateTime] if summary_doc else None
+            ))
+        return infos
 
 if __name__ == '__main__':  
 
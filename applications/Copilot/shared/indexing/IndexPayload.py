@@ -0,0 +1,94 @@
+from typing import Any, Dict, List
+
+import orjson
+from azure.core.exceptions import HttpResponseError
+from azure.search.documents import IndexDocumentsBatch, SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.search.documents.models import IndexingResult
+
+from shared.OpenTelemetry import log_warning
+
+# Serialized batches are sent with the SDK's generated client (SearchClient._client), which
+#  isn't public API - azure-search-documents is pinned in requirements.txt for it, and batches
+#  fall back to SearchClient.index_documents if an upgrade moves it
+try:
+    from azure.search.documents._search_client import RequestEntityTooLargeError
+except ImportError:
+    class RequestEntityTooLargeError(HttpResponseError):
+        """ An index batch over the service's request size limit """
+
+# Vectors are float32 numpy arrays until they're written to the request body - orjson
+#  serializes them directly, with the shortest repr of each float32 value
+IndexPayloadJsonOptions = orjson.OPT_SERIALIZE_NUMPY
+
+IndexAction_Upload = "upload"
+IndexAction_Merge = "merge"
+IndexAction_MergeOrUpload = "mergeOrUpload"
+IndexAction_Delete = "delete"
+
+
+def serialize_index_action(doc: Dict[str, Any], action: str = IndexAction_Upload) -> bytes:
+    """ The json of one action in an index batch """
+    return orjson.dumps({"@search.action": action, **doc}, option = IndexPayloadJsonOptions)
+
+def serialize_index_batch(serialized_actions: List[bytes]) -> bytes:
+    """ The request body of an index batch from already serialized actions """
+    return b'{"value":[' + b','.join(serialized_actions) + b']}'
+
+def get_index_batch_size(serialized_actions: List[bytes]) -> int:
+    """ Size in bytes of the request body serialize_index_batch would return """
+    return len(b'{"value":[]}') + sum(len(a) for a in serialized_actions) + max(len(serialized_actions) - 1, 0)
+
+def _has_generated_client(search_client: SearchClient|AsyncSearchClient) -> bool:
+    generated = getattr(search_client, "_client", None)
+    return hasattr(getattr(generated, "documents", None), "index") and hasattr(search_client, "_merge_client_headers")
+
+_warned_no_generated_client = False
+
+def _get_index_documents_batch(search_client: SearchClient|AsyncSearchClient, payload: bytes) -> IndexDocumentsBatch:
+    """ The payload as a batch of the public API, when the generated client isn't there to send it """
+    global _warned_no_generated_client
+    if not _warned_no_generated_client:
+        _warned_no_generated_client = True
+        log_warning(f"send_index_batch: {type(search_client).__name__} has no generated client, "
+                    "sending index batches with index_documents - check the azure-search-documents version")
+    add_actions = {
+        IndexAction_Upload: IndexDocumentsBatch.add_upload_actions,
+        IndexAction_Merge: IndexDocumentsBatch.add_merge_actions,
+        IndexAction_MergeOrUpload: IndexDocumentsBatch.add_merge_or_upload_actions,
+        IndexAction_Delete: IndexDocumentsBatch.add_delete_actions,
+    }
+    batch = IndexDocumentsBatch()
+    for doc in orjson.loads(payload)["value"]:
+        add_actions[doc.pop("@search.action")](batch, [doc])
+    return batch
+
+def send_index_batch(search_client: SearchClient, payload: bytes) -> List[IndexingResult]:
+    """ Send a serialized index batch, skipping the SDK's model serialization of the documents.
+    Raises RequestEntityTooLargeError if the payload is over the service limit, and
+      HttpResponseError for other failed requests - results of individual documents are returned
+      whether they succeeded or not.
+    """
+    if not _has_generated_client(search_client):
+        return search_client.index_documents(_get_index_documents_batch(search_client, payload))
+    # The generated client accepts an already serialized body - SearchClient.index_documents only
+    #  accepts models, which would turn each vector into a list of python floats
+    batch_response = search_client._client.documents.index(
+        batch = payload,
+        content_type = "application/json",
+        error_map = {413: RequestEntityTooLargeError},
+        headers = search_client._merge_client_headers(None),
+    )
+    return batch_response.results
+
+async def send_index_batch_async(search_client: AsyncSearchClient, payload: bytes) -> List[IndexingResult]:
+    """ send_index_batch for the async search client """
+    if not _has_generated_client(search_client):
+        return await search_client.index_documents(_get_index_documents_batch(search_client, payload))
+    batch_response = await search_client._client.documents.index(
+        batch = payload,
+        content_type = "application/json",
+        error_map = {413: RequestEntityTooLargeError},
+        headers = search_client._merge_client_headers(None),
+    )
+    return batch_response.results
@@ -0,0 +1,83 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from azure.search.documents.models import VectorizedQuery
+from langchain_core.documents import Document
+from langchain_community.vectorstores.azuresearch import (
+    AzureSearch, FIELDS_CONTENT, FIELDS_CONTENT_VECTOR, FIELDS_METADATA
+)
+
+from shared.indexing.SearchIndexConfig import (
+    IndexFields, FieldName_Id, FieldName_Vector, FieldName_Uri, FieldName_Title, FieldName_ItemType,
+    FieldName_IndexUpdateTime, FieldName_TotalDocumentNumChunks, FieldName_TotalDocumentLength,
+    FieldName_CopilotEnabled, FieldName_DocUnstructuredMetadata
+)
+
+# Named sets of fields to select when reading index docs. Each vector is 1536 floats - several
+#  times the size of the rest of a chunk doc - so only the reads that use vectors select them.
+Projection_Skinny = "skinny"
+Projection_DocInfo = "docInfo"
+# Everything but the vector - what the chat path and full-doc reads use
+Projection_NoVector = "noVector"
+Projection_WithVector = "withVector"
+
+ProjectionFields: Dict[str, List[str]] = {
+    Projection_Skinny: [FieldName_Id],
+    Projection_DocInfo: [
+        FieldName_Id, FieldName_Uri, FieldName_Title, FieldName_ItemType, FieldName_IndexUpdateTime,
+        FieldName_TotalDocumentNumChunks, FieldName_TotalDocumentLength,
+        FieldName_CopilotEnabled, FieldName_DocUnstructuredMetadata,
+    ],
+    Projection_NoVector: [f.name for f in IndexFields if f.name != FieldName_Vector],
+    Projection_WithVector: [f.name for f in IndexFields],
+}
+
+
+def get_projection(profile: str) -> List[str]:
+    return ProjectionFields[profile]
+
+def get_select_fields(select_extra_fields: List[str]|None, profile: str = Projection_NoVector) -> List[str]:
+    """ The select of a read - Id plus select_extra_fields, or the fields of the profile if None """
+    if select_extra_fields is None:
+        return get_projection(profile)
+    return list(dict.fromkeys([FieldName_Id, *select_extra_fields]))
+
+
+class ProjectedAzureSearch(AzureSearch):
+    """ AzureSearch whose vector and hybrid searches select the fields of a projection -
+    AzureSearch selects every field, then drops the vectors it downloaded from the results.
+    """
+
+    def __init__(self, *args, projection: str = Projection_NoVector, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.projection = projection
+
+    def vector_search_with_score(self, query: str, k: int = 4, filters: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return self._search_with_score("", query, k, filters)
+
+    def hybrid_search_with_score(self, query: str, k: int = 4, filters: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return self._search_with_score(query, query, k, filters)
+
+    def _search_with_score(self, search_text: str, query: str, k: int, filters: Optional[str]) -> List[Tuple[Document, float]]:
+        results = self.client.search(
+            search_text = search_text,
+            vector_queries = [
+                VectorizedQuery(
+                    vector = np.array(self.embed_query(query), dtype = np.float32).tolist(),
+                    k_nearest_neighbors = k,
+                    fields = FIELDS_CONTENT_VECTOR,
+                )
+            ],
+            filter = filters,
+            select = get_projection(self.projection),
+            top = k,
+        )
+        # Same documents as AzureSearch
+        return [
+            (Document(page_content = result.pop(FIELDS_CONTENT),
+                      metadata = json.loads(result[FIELDS_METADATA]) if FIELDS_METADATA in result
+                                    else {n: v for n, v in result.items() if n != FIELDS_CONTENT_VECTOR}),
+             float(result["@search.score"]))
+            for result in results
+        ]
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.search.documents.models import IndexingResult
+
+from shared.indexing.SearchIndexConfig import FieldName_Id
+from shared.indexing.IndexPayload import (
+    IndexAction_Upload, serialize_index_action, serialize_index_batch, get_index_batch_size,
+    send_index_batch, send_index_batch_async, RequestEntityTooLargeError
+)
+from shared.OpenTelemetry import log_debug, log_warning, MetricIndexUpload
+
+# The service limits are 16MB and 32000 documents per request, but smaller batches
+#  are retried more cheaply and spread better over the parallel requests
+IndexUploadMaxBatchBytes = int(float(os.environ.get("COPILOT_INDEX_UPLOAD_MAX_BATCH_MB") or 8) * 1024 * 1024)
+IndexUploadMaxBatchDocs = int(os.environ.get("COPILOT_INDEX_UPLOAD_MAX_BATCH_DOCS") or 1000)
+IndexUploadParallelism = int(os.environ.get("COPILOT_INDEX_UPLOAD_PARALLELISM") or 4)
+
+IndexUploadMaxAttempts = 5
+IndexUploadRetryMinSeconds = 1.0
+IndexUploadRetryMaxSeconds = 30.0
+
+# Status codes of individual documents worth retrying - the document was locked by a concurrent
+#  update (409, 422) or the service was too busy to process it (503)
+RetryableDocStatusCodes = {409, 422, 429, 503}
+RetryableRequestStatusCodes = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable_request_error(ex: Exception) -> bool:
+    if isinstance(ex, (ServiceRequestError, ServiceResponseError)):
+        return True
+    return isinstance(ex, HttpResponseError) and ex.status_code in RetryableRequestStatusCodes
+
+
+def get_retry_seconds(attempt: int) -> float:
+    return min(IndexUploadRetryMinSeconds * 2 ** (attempt - 1), IndexUploadRetryMaxSeconds)
+
+
+class IndexUploader:
+    """ Send index actions for any number of documents in batches limited by serialized size
+    and document count, several batches at a time.
+    Documents that fail with a retryable status are retried on their own with backoff - the
+      rest of their batch isn't sent again. A batch the service rejects as too large is split.
+    Each document is serialized once, up front.
+    """
+
+    def __init__(self,
+                 search_client: SearchClient,
+                 max_batch_bytes: int = IndexUploadMaxBatchBytes,
+                 max_batch_docs: int = IndexUploadMaxBatchDocs,
+                 parallelism: int = IndexUploadParallelism) -> None:
+        self.search_client = search_client
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_docs = max_batch_docs
+        self.parallelism = parallelism
+
+    def get_batches(self, serialized_actions: List[bytes]) -> List[List[int]]:
+        """ Indexes of the actions in each batch, in order """
+        batches = []
+        batch, batch_bytes = [], 0
+        for i, action in enumerate(serialized_actions):
+            # +1 for the separating comma
+            if batch and (len(batch) >= self.max_batch_docs or batch_bytes + len(action) + 1 > self.max_batch_bytes):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(i)
+            batch_bytes += len(action) + 1
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def index_documents(self, docs: List[Dict[str, Any]], action: str = IndexAction_Upload) -> List[IndexingResult]:
+        """ Index all docs - returns the final result of every doc, in no particular order """
+        if not docs:
+            return []
+        serialized = [serialize_index_action(d, action) for d in docs]
+        keys = [d[FieldName_Id] for d in docs]
+        batches = self.get_batches(serialized)
+
+        def send(batch: List[int]) -> List[IndexingResult]:
+            return self._send_with_retry([keys[i] for i in batch], [serialized[i] for i in batch], action)
+
+        start = time.perf_counter()
+        if len(batches) == 1 or self.parallelism <= 1:
+            results = [r for batch in batches for r in send(batch)]
+        else:
+            with ThreadPoolExecutor(max_workers = min(self.parallelism, len(batches)), thread_name_prefix = "index-upload") as executor:
+                results = [r for batch_results in executor.map(send, batches) for r in batch_results]
+
+        seconds = time.perf_counter() - start
+        n_bytes = sum(len(a) for a in serialized)
+        log_debug(f"IndexUploader: {action} {len(docs)} docs, {n_bytes:,} bytes in {len(batches)} batches - "
+                  f"{seconds:.2f}s, {len(docs) / max(seconds, 1e-6):.0f} docs/s, {n_bytes / 2**20 / max(seconds, 1e-6):.1f} MB/s")
+        return results
+
+    def _send_with_retry(self, keys: List[str], serialized: List[bytes], action: str) -> List[IndexingResult]:
+        final_results: Dict[str, IndexingResult] = {}
+        attempt = 0
+        while keys:
+            attempt += 1
+            try:
+                results = self._send(keys, serialized, action)
+            except Exception as ex:
+                if attempt >= IndexUploadMaxAttempts or not is_retryable_request_error(ex):
+                    raise
+                log_warning(f"IndexUploader: retrying batch of {len(keys)} docs after error: {ex}")
+                time.sleep(get_retry_seconds(attempt))
+                continue
+
+            keys, serialized = self._get_retries(keys, serialized, results, final_results, attempt)
+            if keys:
+                time.sleep(get_retry_seconds(attempt))
+
+        return list(final_results.values())
+
+    @staticmethod
+    def _get_retries(keys: List[str], serialized: List[bytes], results: List[IndexingResult],
+                     final_results: Dict[str, IndexingResult], attempt: int) -> tuple[List[str], List[bytes]]:
+        """ Record the results and return the keys and actions of the docs to retry """
+        retry_keys = set()
+        for r in results:
+            final_results[r.key] = r
+            if not r.succeeded and r.status_code in RetryableDocStatusCodes and attempt < IndexUploadMaxAttempts:
+                retry_keys.add(r.key)
+        if not retry_keys:
+            return [], []
+
+        log_debug(f"IndexUploader: retrying {len(retry_keys)} of {len(keys)} docs")
+        retries = [(k, s) for k, s in zip(keys, serialized) if k in retry_keys]
+        return [k for k, _ in retries], [s for _, s in retries]
+
+    def _send(self, keys: List[str], serialized: List[bytes], action: str) -> List[IndexingResult]:
+        start = time.perf_counter()
+        n_bytes = get_index_batch_size(serialized)
+        try:
+            results = send_index_batch(self.search_client, serialize_index_batch(serialized))
+        except RequestEntityTooLargeError:
+            MetricIndexUpload(int((time.perf_counter() - start) * 1000), False, action, len(keys), n_bytes)
+            if len(keys) == 1:
+                raise
+            half = len(keys) // 2
+            log_warning(f"IndexUploader: batch of {len(keys)} docs, {n_bytes:,} bytes too large - splitting")
+            return self._send(keys[:half], serialized[:half], action) + \
+                    self._send(keys[half:], serialized[half:], action)
+        except Exception:
+            MetricIndexUpload(int((time.perf_counter() - start) * 1000), False, action, len(keys), n_bytes)
+            raise
+
+        MetricIndexUpload(int((time.perf_counter() - start) * 1000), all(r.succeeded for r in results), action, len(keys), n_bytes)
+        return results
+
+
+class AsyncIndexUploader(IndexUploader):
+    """ IndexUploader for the async search client - up to parallelism batches are sent 
+    concurrently on the calling event loop.
+    """
+
+    def __init__(self,
+                 search_client: AsyncSearchClient,
+                 max_batch_bytes: int = IndexUploadMaxBatchBytes,
+                 max_batch_docs: int = IndexUploadMaxBatchDocs,
+                 parallelism: int = IndexUploadParallelism) -> None:
+        super().__init__(search_client, max_batch_bytes, max_batch_docs, parallelism)
+
+    async def index_documents(self, docs: List[Dict[str, Any]], action: str = IndexAction_Upload) -> List[IndexingResult]:
+        if not docs:
+            return []
+        serialized = [serialize_index_action(d, action) for d in docs]
+        keys = [d[FieldName_Id] for d in docs]
+        semaphore = asyncio.Semaphore(max(self.parallelism, 1))
+
+        async def send(batch: List[int]) -> List[IndexingResult]:
+            async with semaphore:
+                return await self._send_with_retry([keys[i] for i in batch], [serialized[i] for i in batch], action)
+
+        batch_results = await asyncio.gather(*[send(batch) for batch in self.get_batches(serialized)])
+        return [r for results in batch_results for r in results]
+
+    async def _send_with_retry(self, keys: List[str], serialized: List[bytes], action: str) -> List[IndexingResult]:
+        final_results: Dict[str, IndexingResult] = {}
+        attempt = 0
+        while keys:
+            attempt += 1
+            try:
+                results = await self._send(keys, serialized, action)
+            except Exception as ex:
+                if attempt >= IndexUploadMaxAttempts or not is_retryable_request_error(ex):
+                    raise
+                log_warning(f"AsyncIndexUploader: retrying batch of {len(keys)} docs after error: {ex}")
+                await asyncio.sleep(get_retry_seconds(attempt))
+                continue
+
+            keys, serialized = self._get_retries(keys, serialized, results, final_results, attempt)
+            if keys:
+                await asyncio.sleep(get_retry_seconds(attempt))
+
+        return list(final_results.values())
+
+    async def _send(self, keys: List[str], serialized: List[bytes], action: str) -> List[IndexingResult]:
+        start = time.perf_counter()
+        n_bytes = get_index_batch_size(serialized)
+        try:
+            results = await send_index_batch_async(self.search_client, serialize_index_batch(serialized))
+        except RequestEntityTooLargeError:
+            MetricIndexUpload(int((time.perf_counter() - start) * 1000), False, action, len(keys), n_bytes)
+            if len(keys) == 1:
+                raise
+            half = len(keys) // 2
+            log_warning(f"AsyncIndexUploader: batch of {len(keys)} docs, {n_bytes:,} bytes too large - splitting")
+            return await self._send(keys[:half], serialized[:half], action) + \
+                    await self._send(keys[half:], serialized[half:], action)
+        except Exception:
+            MetricIndexUpload(int((time.perf_counter() - start) * 1000), False, action, len(keys), n_bytes)
+            raise
+
+        MetricIndexUpload(int((time.perf_counter() - start) * 1000), all(r.succeeded for r in results), action, len(keys), n_bytes)
+        return results
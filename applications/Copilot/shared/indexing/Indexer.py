@@ -3,26 +3,44 @@ import io
 import time
 import os
 import base64
-from typing import List, Any, Tuple, Literal, Callable
+import itertools
+from functools import partial
+from typing import List, Any, Tuple, Literal, Callable, Iterable, Iterator
 import json
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import threading
 import multiprocessing
-import deepdiff
-from time import sleep
+import urllib.parse
 from pypdf import PdfReader
 
-from shared.indexing.IndexOps import IndexDocumentChunk, IndexDocumentInfo, AzureAiIndexOps
+from shared.indexing.IndexOps import IndexDocumentChunk, IndexDocumentInfo, AzureAiIndexOps, get_chunk_doc_ids
 from shared.ServicesWrapper import ServicesWrapper
-from shared.indexing.TextChunker import TextChunk, TextChunker
+from shared.indexing.TextChunker import (
+    TextChunk, TokenTextChunker, 
+    chunk_pages_simple_text_overlap, chunk_pages_page_with_overlap, chunk_pages_token_overlap
+)
 from shared.indexing.BlobOps import BlobOps
+from shared.indexing.PdfPageExtractor import PdfPageExtractor, get_default_num_extract_workers
+from shared.indexing.Pipeline import PipelineStage, run_pipeline
+from shared.indexing.PageTextCache import get_page_text_cache
 from shared.indexing.SearchIndexConfig import FieldName_CopilotEnabled, FieldName_FilterTags, FieldName_Id, FieldName_IndexUpdateTime, FieldName_Title, FieldName_Vector, ItemType_DocumentSummary, ItemType_DocumentWhole, FieldName_DocUnstructuredMetadata, ItemType_DocumentChunk, FieldName_ItemType
 from shared.indexing.DocumentSummarizer import DocumentSummarizer, SummaryError, summary_is_error
 from shared.indexing.SearchIndexConfig import FieldName_DocLastUpdateTime, FieldName_TotalDocumentLength, FieldName_ContentLength
+from shared.indexing.SearchIndexConfig import FieldName_ContentHash, FieldName_PageContentHash
 from shared.Metadata import DocumentMetadata, Metadata
 from shared.Utils import (
     timed, get_num_tokens, default, try_parse_isodate, 
-    gc_collect, DebugMode, elapsed_ms
+    gc_collect, DebugMode, elapsed_ms, get_content_hash
+)
+from shared.TokenCounter import get_token_counter, get_num_tokens_batch
+from shared.indexing.EmbeddingCache import get_embedding_cache
+from shared.indexing.IndexManifest import IndexManifest, IndexManifestEntry
+from shared.indexing.MetadataMergeBatcher import MetadataMergeBatcher, get_metadata_merge_docs
+from shared.indexing.EmbeddingScheduler import get_embedding_schedulers
+from shared.indexing.RebuildJobs import RebuildJob, get_rebuild_job_store
+from shared.indexing.RebuildCostModel import RebuildCostModel, get_rebuild_cost_model
+from shared.indexing.IndexingStats import (
+    Stage_Download, Stage_Extract, Stage_Chunk, Stage_TokenCount, Stage_Summary, get_indexing_stats
 )
 from shared.OpenTelemetry import (
     log_info, log_debug, log_error, log_exception, log_warning,
@@ -34,20 +52,70 @@ from azure.storage.blob._models import BlobProperties
 
 DefaultChunkSize = 4000 # about 1k-1.3k tokens
 DefaultChunkOverlap = 200
+# Chunk size and overlap are in tokens for IndexingStrategy_TokenOverlap
+DefaultTokenChunkSize = 1000
+DefaultTokenChunkOverlap = 50
+# Number of chunks whose tokens are counted in one encode_batch call
+TokenCountBatchSize = 16
+
+# When a document's content changes, only re-embed and upload the chunks that changed
+IncrementalReindex = (os.environ.get("COPILOT_INCREMENTAL_REINDEX") or "true").lower() == "true"
+# A blob modified this long before the sync watermark is still processed - covers blobs being
+#  written while the container was listed. Reprocessing an up to date blob is cheap (ifNewer).
+SyncWatermarkOverlapSeconds = int(os.environ.get("COPILOT_SYNC_WATERMARK_OVERLAP_SECONDS") or 300)
 
 # TODO: separate class for processing various format files and adding to index (txt at least)
 # TODO: cutoff size to not chunk in less than n tokens?
 
 PyPdfExtractionMode: Literal['plain', 'layout'] = 'plain'
 
+# Threads downloading blobs ahead of parsing - they're mostly waiting on the network
+RebuildDownloadWorkers = int(os.environ.get("COPILOT_REBUILD_DOWNLOAD_WORKERS") or 8)
+# Threads handing blobs to the PdfPageExtractor process pool - 0 for one per extract process
+RebuildParseWorkers = int(os.environ.get("COPILOT_REBUILD_PARSE_WORKERS") or 0)
+
 GenerateSummaryModeStrEnum = Literal['off', 'ifNewer', 'force'] 
 GenerateIndexModeStrEnum = Literal['off', 'ifNewer', 'force'] 
 
 IndexingStrategy_SimpleTextOverlap = "overlap"
 IndexingStrategy_PageWithOverlap = "page-overlap"
+IndexingStrategy_TokenOverlap = "token-overlap"
 ErrorSummary = "N/A"
 
-RebuildInProgressStartTime:datetime.datetime | None = None
+
+
+@dataclass
+class RebuildItem:
+    """A blob passing through the stages of rebuild_index"""
+    index: int
+    blob: BlobProperties
+    needs_contents: bool = True
+    # Seconds predicted by the cost model, and spent in the stages (not waiting between them)
+    predicted_seconds: float = 0.0
+    work_seconds: float = 0.0
+    num_pages: int|None = None
+    stream: io.BytesIO|None = None
+    pages: list[str]|None = None
+    error: Exception|None = None
+    skipped: bool = False
+
+
+def timed_rebuild_stage(fn: Callable[[RebuildItem], RebuildItem]) -> Callable[[RebuildItem], RebuildItem]:
+    """Add the time fn spends on an item to its work_seconds"""
+    def run(item: RebuildItem) -> RebuildItem:
+        start = time.time()
+        try:
+            return fn(item)
+        finally:
+            item.work_seconds += time.time() - start
+    return run
+
+
+def get_default_chunk_params(indexing_strategy: str|None) -> Tuple[int, int]:
+    """Default (chunk_size, chunk_overlap) - in tokens for the token strategy, otherwise characters"""
+    if indexing_strategy == IndexingStrategy_TokenOverlap:
+        return DefaultTokenChunkSize, DefaultTokenChunkOverlap
+    return DefaultChunkSize, DefaultChunkOverlap
 
 
 class PyPdfIndexProcessor:
@@ -94,70 +162,54 @@ class PyPdfIndexProcessor:
             return False
 
     @timed()
-    def get_text_from_pages(self, stream) -> list[str]:
+    def get_text_from_pages(self, stream: io.BytesIO) -> list[str]:
         """Extract the text from each page in the PDF file and return a list of strings."""
 
         try:
             pdf_reader = self.get_pdf_reader(stream)
             log_info(f"Num pages: {len(pdf_reader.pages)}")
 
-            self.pages_text = [''] * len(pdf_reader.pages)
-            for i, page in enumerate(pdf_reader.pages):
-                text = page.extract_text(
-                    extraction_mode = PyPdfExtractionMode,
-                    layout_mode_space_vertically = False,
-                )
-                self.pages_text[i] = text
-                log_debug(f"\tParser: Page {i+1}: len {len(text)} ({get_num_tokens(text)} tokens)")
-                # Each page extract takes several hundred ms to several mins worst case -
-                #   yield CPU and GIL to any ready IO-bound threads such as incomming requests
-                # There's some debate over whether sleep(0) works as intended on Windows
-                sleep(0.0001) 
+            # Pages are extracted on a process pool reading the blob bytes from shared memory
+            extractor = PdfPageExtractor(extraction_mode = PyPdfExtractionMode)
+            with stream.getbuffer() as pdf_bytes:
+                self.pages_text = extractor.extract_pages(pdf_bytes, reader = pdf_reader)
+            for i, text in enumerate(self.pages_text):
+                log_debug(f"\tParser: Page {i+1}: len {len(text)}")
             return self.pages_text
 
         except Exception as e:
             log_exception(f"Error getting pdf page text: {e}")
             raise
 
-    @timed()
     def get_chunks_from_pages_simple_text_overlap(
             self, 
             pages: list[str],
             chunk_size: int,
-            chunk_overlap: int) -> list[TextChunk]:
+            chunk_overlap: int) -> Iterator[TextChunk]:
         """
         Generate overlapping chunks from PDF pages with no regard to maintaining page boundaries.
         This creates full chunks of text that may span multiple pages.
+        Chunks are generated lazily.
         """
-        log_info(f"get_chunks_from_pdf_stream: chunk_size:{chunk_size} overlap:{chunk_overlap}") 
-        log_debug("Creating PdfReader from stream")
-
-        all_text = ""
+        log_info(f"get_chunks_from_pages_simple_text_overlap: chunk_size:{chunk_size} overlap:{chunk_overlap} pages:{len(pages)}") 
 
         try:
-            log_info(f"Num pages: {len(self.pages_text)}")
-            text_chunker = TextChunker(
+            yield from chunk_pages_simple_text_overlap(
+                pages,
                 chunk_size, 
                 chunk_overlap, 
                 remove_extra_whitespace = self.remove_extra_whitespace
             )
-            for i, text in enumerate(pages):
-                all_text += text
-                text_chunker.add_text(i+1, text)
-
-            chunks = [c for c in text_chunker] # custom iterator calls get_next_chunk() until spans exhausted
-            return chunks
 
         except Exception as e:
             log_exception(f"Error processing pdf file: {e}")
             raise
 
-    @timed()
     def get_chunks_from_pages_page_with_overlap(
             self, 
             pages: list[str],
             chunk_size: int,
-            chunk_overlap: int) -> list[TextChunk]:
+            chunk_overlap: int) -> Iterator[TextChunk]:
         """
         Generate chunks that cover exactly one page, with overlap/2 context from 
          previous and next pages.
@@ -166,45 +218,129 @@ class PyPdfIndexProcessor:
          of 4000 chars this doesn't usually happen.
         This method will create more chunks than the simple_text_overlap method, but
          will be more accurate in terms of page citations.
+        Chunks are generated lazily.
         """
-        log_info(f"get_chunks_from_pdf_stream: chunk_size:{chunk_size} overlap:{chunk_overlap}") 
-        log_debug("Creating PdfReader from stream")
-
-        chunks:list[TextChunk] = []
+        log_info(f"get_chunks_from_pages_page_with_overlap: chunk_size:{chunk_size} overlap:{chunk_overlap} pages:{len(pages)}") 
 
         try:
-            log_info(f"Num pages: {len(self.pages_text)}")
-
-            for i, cur_page_text in enumerate(pages):
-                text_chunker = TextChunker(
-                    chunk_size, 
-                    chunk_overlap, 
-                    remove_extra_whitespace = self.remove_extra_whitespace
-                )
-                if i > 0:
-                    prev_page_text = pages[i-1][-chunk_overlap//2:] 
-                    text_chunker.add_text(i-1, prev_page_text)
-
-                text_chunker.add_text(i, cur_page_text)
-
-                if i < len(pages)-1:
-                    next_page_text = pages[i+1][:chunk_overlap//2]
-                    text_chunker.add_text(i+1, next_page_text)
-
-                page_chunks = [c for c in text_chunker] # custom iterator calls get_next_chunk() until spans exhausted
-                chunks.extend(page_chunks)
-
-            return chunks
+            yield from chunk_pages_page_with_overlap(
+                pages,
+                chunk_size, 
+                chunk_overlap, 
+                remove_extra_whitespace = self.remove_extra_whitespace
+            )
 
         except Exception as e:
             log_exception(f"Error processing pdf file: {e}")
             raise
 
-    def get_index_chunk_from_text_chunk(self, chunk: TextChunk) -> IndexDocumentChunk:
-        token_count = get_num_tokens(chunk.Content)
+    def get_chunks_from_pages_token_overlap(
+            self, 
+            pages: list[str],
+            chunk_size: int,
+            chunk_overlap: int) -> TokenTextChunker:
+        """
+        Generate overlapping chunks of chunk_size tokens from PDF pages with no regard
+         to maintaining page boundaries, as for simple_text_overlap.
+        The document is encoded once, and the chunks carry their exact token counts.
+        Chunks are generated lazily - the returned chunker can count them up front.
+        """
+        log_info(f"get_chunks_from_pages_token_overlap: chunk_size:{chunk_size} overlap:{chunk_overlap} tokens, pages:{len(pages)}") 
+
+        return chunk_pages_token_overlap(
+            pages,
+            chunk_size, 
+            chunk_overlap, 
+            remove_extra_whitespace = self.remove_extra_whitespace
+        )
+
+    def get_text_chunks_from_pages(self, 
+                                   pages: list[str],
+                                   chunk_size: int,
+                                   overlap: int,
+                                   indexing_strategy: str|None = None) -> Iterable[TextChunk]:
+        indexing_strategy = indexing_strategy or IndexingStrategy_SimpleTextOverlap
+        if indexing_strategy == IndexingStrategy_SimpleTextOverlap:
+            return self.get_chunks_from_pages_simple_text_overlap(pages, chunk_size, overlap)
+        elif indexing_strategy == IndexingStrategy_PageWithOverlap:
+            return self.get_chunks_from_pages_page_with_overlap(pages, chunk_size, overlap)
+        elif indexing_strategy == IndexingStrategy_TokenOverlap:
+            return self.get_chunks_from_pages_token_overlap(pages, chunk_size, overlap)
+        else:
+            raise ValueError(f"Invalid indexing strategy: '{indexing_strategy}'")
+
+    def get_index_chunks_from_pages(self, 
+                                    pages: list[str],
+                                    chunk_size: int,
+                                    overlap: int,
+                                    indexing_strategy: str|None = None,
+                                    file: str|None = None) -> Iterator[IndexDocumentChunk]:
+        """Lazily generate the index chunks for the pages: page -> chunk -> token count"""
+        chunks = self.get_text_chunks_from_pages(pages, chunk_size, overlap, indexing_strategy)
+        return self.get_index_chunks_from_text_chunks(chunks, file = file, pages = pages, indexing_strategy = indexing_strategy)
+
+    @staticmethod
+    def get_first_page_number(indexing_strategy: str|None) -> int:
+        """TextChunk.Page of the first page - the page-overlap strategy numbers pages from 0"""
+        return 0 if indexing_strategy == IndexingStrategy_PageWithOverlap else 1
+
+    def get_index_chunks_from_text_chunks(self, 
+                                          chunks: Iterable[TextChunk],
+                                          file: str|None = None,
+                                          pages: list[str]|None = None,
+                                          indexing_strategy: str|None = None) -> Iterator[IndexDocumentChunk]:
+        """Lazily generate index chunks for the text chunks.
+        If the pages are passed, each chunk gets a hash of the text of the pages it covers.
+        """
+        page_hashes = [get_content_hash(p) for p in pages] if pages else []
+        first_page = self.get_first_page_number(indexing_strategy)
+
+        def get_page_content_hash(c: TextChunk) -> str|None:
+            first, last = c.Page - first_page, default(c.LastPage, c.Page) - first_page
+            if not page_hashes or first < 0 or last >= len(page_hashes):
+                return None
+            return get_content_hash(''.join(page_hashes[first:last+1]))
+
+        i = 0
+        chunks = iter(chunks)
+        stats = get_indexing_stats()
+        while True:
+            with stats.stage(Stage_Chunk, file):
+                batch = list(itertools.islice(chunks, TokenCountBatchSize))
+            if not batch:
+                break
+            # Chunks cut by characters are counted a batch at a time
+            uncounted = [c for c in batch if c.TokenCount is None]
+            with stats.stage(Stage_TokenCount, file):
+                token_counts = iter(get_num_tokens_batch([c.Content for c in uncounted]) if uncounted else [])
+            for c in batch:
+                token_count = c.TokenCount if c.TokenCount is not None else next(token_counts)
+                index_chunk = self.get_index_chunk_from_text_chunk(c, token_count)
+                index_chunk.PageContentHash = get_page_content_hash(c)
+                log_debug(f"File:'{file}', Chunk {i}, pages:{c.Page}-{c.LastPage}, len:{index_chunk.ContentLength} ({index_chunk.ContentTokenCount})")
+                i += 1
+                yield index_chunk
+
+    @timed()
+    def count_chunks_from_pages(self, 
+                                pages: list[str],
+                                chunk_size: int,
+                                overlap: int,
+                                indexing_strategy: str|None = None) -> int:
+        """Number of chunks the pages will be split into - needed up front for
+        TotalDocumentNumChunks when the chunks themselves are streamed."""
+        text_chunks = self.get_text_chunks_from_pages(pages, chunk_size, overlap, indexing_strategy)
+        if isinstance(text_chunks, TokenTextChunker):
+            return text_chunks.count_chunks()
+        return sum(1 for _ in text_chunks)
+
+    def get_index_chunk_from_text_chunk(self, chunk: TextChunk, token_count: int|None = None) -> IndexDocumentChunk:
+        if token_count is None:
+            token_count = chunk.TokenCount if chunk.TokenCount is not None else get_num_tokens(chunk.Content)
         return IndexDocumentChunk(
             Content = chunk.Content, 
             PageNumber = chunk.Page, 
+            LastPageNumber = chunk.LastPage,
             ContentTokenCount = token_count,
             ContentLength = len(chunk.Content),
         )
@@ -221,9 +357,11 @@ class PyPdfIndexProcessor:
     # TODO: Should we separate summary generation from the index processing 
     #    and make it background/eventual?
 
-    def add_pdf_file_to_index(self, *args, **kwargs):
+    def add_pdf_file_to_index(self, file: str, *args, **kwargs):
+        blob_props = kwargs.get("blob_props")
         try:
-            return self._add_pdf_file_to_index(*args, **kwargs)
+            with get_indexing_stats().document(file, blob_props.size if blob_props else 0):
+                return self._add_pdf_file_to_index(file, *args, **kwargs)
         except Exception as e:
             log_exception(f"Error adding pdf file to index: {e}")
             raise
@@ -241,31 +379,50 @@ class PyPdfIndexProcessor:
                         chunk_size: int|None = None, 
                         chunk_overlap: int|None = None,
                         include_chunkdocs_for_copilot_disabled_files = True,
-                        indexing_strategy:str|None = None    
+                        indexing_strategy:str|None = None,
+                        manifest: IndexManifest|None = None,
+                        metadata_batcher: MetadataMergeBatcher|None = None,
+                        prefetched_pages: list[str]|None = None,
+                        blob_props: BlobProperties|None = None
                         ) -> bool:
         """Add the PDF file to the index.
         Depending on options, only update the docChunk index docs if the file is 
         copilot enabled or needs to be reindexed based on update times.
         Also add wholeDoc index docs for the entire document, and use the LLM to
         create docSummary index docs.
+        With a manifest (see rebuild_index) the decisions are made from it rather than
+          searching the index - the file's docs are only fetched if there's work to do.
+        With a metadata_batcher, metadata-only changes are merged in batches with other files' -
+          the caller must flush it.
+        prefetched_pages are the file's page texts if already extracted, otherwise the blob is
+          only downloaded and parsed if its contents are needed.
+        blob_props are the blob's properties with metadata if already listed (see get_blob_list).
         """
 
-        chunk_size = chunk_size or DefaultChunkSize
-        chunk_overlap = chunk_overlap or DefaultChunkOverlap
+        default_chunk_size, default_chunk_overlap = get_default_chunk_params(indexing_strategy)
+        chunk_size = chunk_size or default_chunk_size
+        chunk_overlap = chunk_overlap or default_chunk_overlap
 
         bops = BlobOps(file)
-        blob_props = bops.get_blob_properties()
+        blob_props = blob_props or bops.get_blob_properties()
 
-        if not bops.file_looks_like("pdf"):
+        if not bops.file_looks_like("pdf", blob_props):
             log_info(f"File does not appear to be a PDF - ignoring: '{file}'")
             return False
                 
         blob_last_update_time = blob_props.last_modified
-        index_chunks, all_text = None, None
+        pages, all_text = prefetched_pages, ''.join(prefetched_pages) if prefetched_pages is not None else None
         reindex_chunks = generate_index_mode == "force"
+        incremental_reindex = False
         add_whole_doc = generate_index_mode == "force"
         update_metadata = False
         matching_docs, matching_chunk_docs = [], []
+        # Representative of all chunk docs for the non-content fields
+        chunk_doc = None
+        summary_docs = None
+        manifest_entry = None
+        # Group id and number of chunks, when the chunk doc Ids can be generated rather than searched for
+        chunk_group = None
         force_delete = False
         need_existing_docs = force_delete or generate_index_mode != "off"
 
@@ -284,35 +441,30 @@ class PyPdfIndexProcessor:
         doc_copilot_enabled = doc_metadata.is_copilot_enabled
         log_info(f"Document '{file}' copilotEnabled:{doc_copilot_enabled}")
 
-        if need_existing_docs:
-
-            matching_docs = self.index_ops.find_index_docs(
-                # Get skinny docs for file - include docWhole and docSummary as well as docChunks
-                file, 
-                doc_type = None, 
-                select_extra_fields = [ 
-                                       FieldName_DocLastUpdateTime, 
-                                       FieldName_IndexUpdateTime,
-                                       FieldName_TotalDocumentLength, 
-                                       FieldName_ContentLength,
-                                       FieldName_ItemType
-                                    ],
-                copilot_enabled_only = False)
+        if manifest is not None and not force_delete:
+            manifest_entry = manifest.get_entry(file)
+            summary_docs = manifest_entry.summary_docs
+            if need_existing_docs:
+                chunk_doc = manifest_entry.chunk_doc
+                add_whole_doc = add_whole_doc or len(manifest_entry.whole_docs) == 0
 
-            self.check_invariants_for_index_docs(file, matching_docs)
+        elif need_existing_docs:
 
+            matching_docs = self._find_existing_docs(file)
             matching_chunk_docs = [d for d in matching_docs if d[FieldName_ItemType] == ItemType_DocumentChunk]
             matching_whole_docs = [d for d in matching_docs if d[FieldName_ItemType] == ItemType_DocumentWhole]
+            summary_docs = [d for d in matching_docs if d[FieldName_ItemType] == ItemType_DocumentSummary]
+            chunk_doc = matching_chunk_docs[0] if matching_chunk_docs else None
             add_whole_doc = add_whole_doc or len(matching_whole_docs) == 0
 
         if generate_index_mode == "ifNewer":
 
-            if len(matching_chunk_docs) == 0:
+            if chunk_doc is None:
                 # No current index docs - must reindex
                 reindex_chunks = True
             else:
                 # Get first chunk for doc - representitive of all chunks re:all non-content fields
-                doc = matching_chunk_docs[0]
+                doc = chunk_doc
 
                 source_doc_update_time = try_parse_isodate(doc[FieldName_DocLastUpdateTime])
                 index_doc_update_time = try_parse_isodate(doc[FieldName_IndexUpdateTime])
@@ -339,91 +491,125 @@ class PyPdfIndexProcessor:
                         log_warning(f"Detected document change - doesn't match current TLM/ADTAPI upload implementation of always creating new document on upload")
                         reindex_chunks = True
                         add_whole_doc = True
+                        incremental_reindex = IncrementalReindex
                     else:
                         log_info(f"Document '{file}' assuming only metadata changed")
                         update_metadata = True
 
-        if matching_chunk_docs and update_metadata and not reindex_chunks:
-            # Merge in new metadata into same content and upsert into existing docs.
-            # We need to get all the indexdoc fields and merge because we can't upsert only specific fields
-            #  - want to reuse current vector embeddings.
-            #  (could be better to just to do this up top instead of getting skinny docs first?)
-            matching_docs = self.index_ops.find_index_docs(
-                file, 
-                doc_type = None, # ItemType_DocumentChunk,
-                select_extra_fields = None,
-                copilot_enabled_only = False)
-
-            if self.patch_document_metadata_if_needed(matching_docs, blob_props) > 0:
-                log_info(f"Upserting metadata in-place for '{file}'")
-                self.index_ops.upload_documents(matching_docs)
+        if manifest_entry is not None and manifest_entry.num_chunk_docs > 0 and \
+                (update_metadata or reindex_chunks or not doc_copilot_enabled):
+            # There's work to do on the existing docs - an incremental reindex needs their hashes,
+            #  otherwise their Ids can be generated if the manifest's chunk counts are consistent
+            reindexing_incrementally = incremental_reindex and reindex_chunks and \
+                (doc_copilot_enabled or include_chunkdocs_for_copilot_disabled_files)
+            chunk_group = None if reindexing_incrementally else manifest_entry.get_chunk_group()
+            if chunk_group is None:
+                matching_docs = self._find_existing_docs(file)
+                matching_chunk_docs = [d for d in matching_docs if d[FieldName_ItemType] == ItemType_DocumentChunk]
+        has_chunk_docs = len(matching_chunk_docs) > 0 or chunk_group is not None
+
+        if has_chunk_docs and update_metadata and not reindex_chunks:
+            # Merge only the metadata fields into the existing docs by Id - their content and
+            #  vectors are never downloaded or uploaded again
+            if chunk_group is not None:
+                ids = get_chunk_doc_ids(*chunk_group) + \
+                    [d[FieldName_Id] for d in manifest_entry.whole_docs + manifest_entry.summary_docs]
+            else:
+                ids = [d[FieldName_Id] for d in matching_docs]
+            merge_docs = get_metadata_merge_docs(ids, blob_props.metadata, doc_metadata, blob_last_update_time)
+            log_info(f"Merging metadata into {len(merge_docs)} index docs of '{file}'")
+            if metadata_batcher is not None:
+                metadata_batcher.add(merge_docs, key = file)
+            else:
+                self.index_ops.merge_documents(merge_docs)
 
         elif force_delete:
             log_info(f"Force deleting all {len(matching_docs)} index docs for '{file}'")
             self.index_ops.delete_documents(matching_docs)
             return True
-        elif matching_chunk_docs and (reindex_chunks or not doc_copilot_enabled):
-            # Document contents have changed - delete old chunks
-            log_debug(f"Deleting for reindex {len(matching_docs)} index chunks docs for '{file}'")
-            self.index_ops.delete_documents(matching_chunk_docs)
-
-        # Get document contents lazily 
-        def get_doc_contents() -> Tuple[list[IndexDocumentChunk], str]:
-            nonlocal all_text, index_chunks
-            if all_text and index_chunks: 
-                return index_chunks, all_text
-            index_chunks, all_text = self.get_chunks_from_pdf_blob( bops, chunk_size, chunk_overlap)
-            if len(index_chunks) == 0 or len(all_text) == 0:
+        elif has_chunk_docs and (reindex_chunks or not doc_copilot_enabled):
+            if incremental_reindex and reindex_chunks and (doc_copilot_enabled or include_chunkdocs_for_copilot_disabled_files):
+                # Unchanged chunks are kept and stale ones deleted by the incremental update
+                log_debug(f"Incrementally reindexing {len(matching_chunk_docs)} index chunks docs for '{file}'")
+            else:
+                # Document contents have changed - delete old chunks
+                incremental_reindex = False
+                if chunk_group is not None:
+                    self.index_ops.delete_doc_group(*chunk_group)
+                else:
+                    log_debug(f"Deleting for reindex {len(matching_docs)} index chunks docs for '{file}'")
+                    self.index_ops.delete_documents(matching_chunk_docs)
+
+        # Get document contents lazily - the pages are only chunked as they are streamed into the index
+        def get_doc_contents() -> Tuple[list[str], str]:
+            nonlocal all_text, pages
+            if pages is not None: 
+                return pages, all_text
+            pages = self.get_pages_from_pdf_blob(bops, indexing_strategy, blob_md5 = doc_metadata.doc_hash_blob_md5)
+            all_text = ''.join(pages)
+            if len(all_text) == 0:
                 log_warning(f"No text found for '{file}'")
-            return index_chunks, all_text
+            return pages, all_text
 
         # Note all_text below is as-is from extraction - extra whitespace has not been
         #   removed as we do for chunks. We could remove extra whitespace here as well
         #   - this is not the same as concatenating the chunks due to overlap.
         if reindex_chunks and (doc_copilot_enabled or include_chunkdocs_for_copilot_disabled_files):
-            index_chunks, all_text = get_doc_contents()
-            # TODO: Add Status field to index so we can mark as failed?
-            if len(index_chunks) == 0 or len(all_text) == 0:
-                log_warning(f"Creating single empty chunk for no-text file '{file}'")
-                # Create empty chunk for no-text file so we don't try and re-index every time
-                index_chunks = [
-                    IndexDocumentChunk(
-                        Content = "", PageNumber = 0, 
-                        ContentTokenCount = 0, ContentLength = 0)
-                    ]
+            pages, all_text = get_doc_contents()
             self._add_chunks_to_index(
                  bops, doc_metadata, 
-                 chunk_size, chunk_overlap, index_chunks)
+                 chunk_size, chunk_overlap, pages, indexing_strategy,
+                 existing_chunk_docs = matching_chunk_docs if incremental_reindex else None,
+                 blob_props = blob_props)
 
         # TODO: We don't update whoDoc if doc is updated - this never happens at the moment, but should handle
         # TODO: Refactor out is_index_doc_newer_than and treat equally for all doc types
         if add_whole_doc:
-            index_chunks, all_text = get_doc_contents()
+            pages, all_text = get_doc_contents()
             log_debug(f"Adding whole document '{file}' to index")
             # Overwrite any existing docWhole -- even for copilot disabled files
             # NOTE: Allow no-text whole doc to be indexed if we can't parse it
             self.index_ops.add_whole_index_document(
                 text = all_text, 
                 file = bops.get_blob_name(), 
-                doc_last_update_time = bops.get_blob_properties().last_modified, 
+                doc_last_update_time = blob_last_update_time, 
                 item_type = ItemType_DocumentWhole, 
                 metadata = json.dumps(blob_props.metadata),
                 summary_type = None)
 
         # Overwrite any existing docSummary if needed -- even for copilot disabled files
-        #TODO: We're now getting all doc types - we can pass in the summary docs now
         self.generate_summary_if_needed(
             file = file, 
             get_text_fn = get_doc_contents,
             metadata = json.dumps(blob_props.metadata),
             blob_last_update_time = blob_last_update_time,
             mode = generate_summaries_mode,
-            update_metadata_only = update_metadata)
+            update_metadata_only = update_metadata,
+            existing_summary_docs = summary_docs)
 
         log_info(f"Add to index processing complete for '{file}'")
         return reindex_chunks
 
 
+    def _find_existing_docs(self, file: str) -> List[dict]:
+        matching_docs = self.index_ops.find_index_docs(
+            # Get skinny docs for file - include docWhole and docSummary as well as docChunks
+            file, 
+            doc_type = None, 
+            select_extra_fields = [ 
+                                   FieldName_DocLastUpdateTime, 
+                                   FieldName_IndexUpdateTime,
+                                   FieldName_TotalDocumentLength, 
+                                   FieldName_ContentLength,
+                                   FieldName_ItemType,
+                                   FieldName_ContentHash,
+                                   FieldName_PageContentHash
+                                ],
+            copilot_enabled_only = False)
+
+        self.check_invariants_for_index_docs(file, matching_docs)
+        return matching_docs
+
     def check_invariants_for_index_docs(self, file:str, docs: List[dict]):
 
         n_summary_docs = len([d for d in docs if d[FieldName_ItemType] == ItemType_DocumentSummary])
@@ -436,12 +622,15 @@ class PyPdfIndexProcessor:
 
     def generate_summary_if_needed(self, 
                                    file: str,
-                                   get_text_fn: Callable[[], Tuple[list[IndexDocumentChunk], str]],
+                                   get_text_fn: Callable[[], Tuple[list[str], str]],
                                    blob_last_update_time: datetime.datetime,
                                    mode: GenerateSummaryModeStrEnum = None,
                                    metadata: str|None = None,
                                    update_metadata_only: bool = False,
-                                   summary_type: str = "basic") -> bool:
+                                   summary_type: str = "basic",
+                                   existing_summary_docs: List[dict]|None = None) -> bool:
+        """ existing_summary_docs: the file's summary docs if already known (with DocLastUpdateTime 
+        and IndexUpdateTime) - otherwise they're searched for """
 
         #TODO: We could also update the summary if missing
         #  doctwin.summary or doctwin.customProperties.copilot.llm_summary 
@@ -467,7 +656,8 @@ class PyPdfIndexProcessor:
             if not blob_last_update_time:
                 raise ValueError("doc_last_update_time must be provided when mode is 'ifNewer'")
 
-            existing_docs = self.index_ops.find_skinny_docs_for_summary(file)
+            existing_docs = existing_summary_docs if existing_summary_docs is not None \
+                                else self.index_ops.find_skinny_docs_for_summary(file)
             log_debug(f"Found {len(existing_docs)} existing summary docs for '{file}'")
 
             have_summary_doc = len(existing_docs) > 0
@@ -528,9 +718,10 @@ class PyPdfIndexProcessor:
             log_info(f"Using blob-cached summary for '{file}'")
             summary = cached_summary
         else:
-            _chunks, text = get_text_fn()
+            _pages, text = get_text_fn()
             summarizer = DocumentSummarizer(text=text, use_large_model = True, file = file)
-            duration, summary = elapsed_ms( summarizer.summarize)
+            with get_indexing_stats().stage(Stage_Summary, file):
+                duration, summary = elapsed_ms( summarizer.summarize)
 
         MetricCreateSummary(
             duration, 
@@ -561,39 +752,37 @@ class PyPdfIndexProcessor:
 
         return False
 
-    def get_chunks_from_pdf_blob(self, 
+    def get_pages_from_pdf_blob(self, 
                                 bops : BlobOps, 
-                                chunk_size, 
-                                overlap,
-                                indexing_strategy:str|None = None
-                                ) -> tuple[list[IndexDocumentChunk], str]:
+                                indexing_strategy:str|None = None,
+                                blob_md5: str|None = None,
+                                stream: io.BytesIO|None = None
+                                ) -> list[str]:
+        """Extract the text of each page, from the local page text cache if this
+        blob content has already been extracted with the same settings, otherwise
+        by downloading and parsing the blob - or parsing the stream if already downloaded."""
+
+        file = bops.blob_name
+        page_text_cache = get_page_text_cache()
+        pages = page_text_cache.get(blob_md5, PyPdfExtractionMode, self.remove_extra_whitespace)
+        if pages is not None:
+            log_info(f"Using cached text for {len(pages)} pages of '{file}' for index '{self.index_ops.index_name}'")
+            return pages
 
         try:
-            indexing_strategy = indexing_strategy or IndexingStrategy_SimpleTextOverlap
-            file = bops.blob_name
-            log_info(f"Processing pdf file: '{file}' for index '{self.index_ops.index_name} using strategy '{indexing_strategy} ")
-
-            stream = bops.get_blob_stream()
-            if not self.can_parse(stream):
-                log_warning(f"Could not parse pdf file: {file}")
-                # TODO: throw something better
-                raise Exception(f"Could not parse pdf file: '{file}'")
-
-            pages = self.get_text_from_pages(stream)
-            all_text = ''.join(pages)
+            log_info(f"Processing pdf file: '{file}' for index '{self.index_ops.index_name} using strategy '{indexing_strategy or IndexingStrategy_SimpleTextOverlap} ")
 
-            if indexing_strategy == IndexingStrategy_SimpleTextOverlap:
-                chunks = self.get_chunks_from_pages_simple_text_overlap(pages, chunk_size, overlap)
-            elif indexing_strategy == IndexingStrategy_PageWithOverlap:
-                chunks = self.get_chunks_from_pages_page_with_overlap(pages, chunk_size, overlap)
-            else:
-                raise ValueError(f"Invalid indexing strategy: '{indexing_strategy}'")
-
-            log_info(f"Adding {len(chunks)} chunks to index for '{file}'")
-            for (i, c) in enumerate(chunks):
-                log_debug(f"File:'{file}', Chunk {i}, page:{c.Page}, len:{len(c.Content)} ({get_num_tokens(c.Content)})")
+            stream = stream or self.download_blob_stream(bops)
+            with get_indexing_stats().stage(Stage_Extract, file):
+                if not self.can_parse(stream):
+                    log_warning(f"Could not parse pdf file: {file}")
+                    # TODO: throw something better
+                    raise Exception(f"Could not parse pdf file: '{file}'")
 
-            index_chunks = [self.get_index_chunk_from_text_chunk(c) for c in chunks]
+                pages = self.get_text_from_pages(stream)
+            get_indexing_stats().add("pages", len(pages))
+            page_text_cache.put(blob_md5, PyPdfExtractionMode, self.remove_extra_whitespace, pages)
+            return pages
 
         finally:
             try:
@@ -601,7 +790,166 @@ class PyPdfIndexProcessor:
             except Exception as e:
                 log_warning(f"Error closing pdf stream: {e}")
 
-        return index_chunks, all_text
+    @staticmethod
+    def download_blob_stream(bops: BlobOps) -> io.BytesIO:
+        stats = get_indexing_stats()
+        with stats.stage(Stage_Download, bops.blob_name):
+            stream = bops.get_blob_stream()
+        with stream.getbuffer() as buffer:
+            stats.add("bytes", buffer.nbytes)
+        return stream
+
+    @staticmethod
+    def get_blob_md5(bops: BlobOps) -> str|None:
+        return PyPdfIndexProcessor.get_blob_props_md5(bops.get_blob_properties())
+
+    @staticmethod
+    def get_blob_props_md5(blob_props: BlobProperties) -> str|None:
+        content_md5 = blob_props.content_settings.content_md5
+        return base64.b64encode(content_md5).decode('utf-8') if content_md5 else None
+
+    @staticmethod
+    def is_forced_by_config(entry: IndexManifestEntry) -> bool:
+        """Whether FORCE_REINDEX_LASTUPDATETIME or FORCE_SUMMARY_LASTUPDATETIME is later than the
+          IndexUpdateTime of the file's chunk or summary docs - the checks _add_pdf_file_to_index makes
+        """
+        def is_older(doc: dict|None, force_time_var: str) -> bool:
+            force_time_str = os.environ.get(force_time_var)
+            force_time = try_parse_isodate(force_time_str) if force_time_str else None
+            if force_time is None or doc is None:
+                return False
+            index_update_time = try_parse_isodate(doc[FieldName_IndexUpdateTime]) if doc.get(FieldName_IndexUpdateTime) else None
+            return index_update_time is None or index_update_time < force_time
+
+        return is_older(entry.chunk_doc, "FORCE_REINDEX_LASTUPDATETIME") or \
+                any(is_older(d, "FORCE_SUMMARY_LASTUPDATETIME") for d in entry.summary_docs)
+
+    def get_blobs_to_sync(self, blob_list: List[BlobProperties], manifest: IndexManifest|None) -> List[BlobProperties]:
+        """The blobs modified since the sync watermark (of the last complete rebuild), missing
+          from the index, or with docs older than FORCE_REINDEX_LASTUPDATETIME/FORCE_SUMMARY_LASTUPDATETIME
+          - after deleting the docs of files no longer in the container, found by comparing the
+          listing with the manifest. Every blob if there's no watermark yet.
+        """
+        if not get_rebuild_job_store().is_persistent():
+            log_warning("Incremental sync: the rebuild jobs db is in memory, so the sync watermark is lost on restart "
+                        "and every blob is processed after one - set COPILOT_REBUILD_JOBS_DB to a path on a persistent volume")
+        if manifest is None:
+            log_info("Incremental sync needs the index manifest (ifNewer of an existing index) - processing every blob")
+            return blob_list
+
+        self.delete_docs_of_deleted_blobs(blob_list, manifest)
+
+        watermark = get_rebuild_job_store().get_sync_watermark(self.index_ops.index_name, BlobOps.container_name)
+        if watermark is None:
+            log_info(f"Incremental sync: no watermark for index '{self.index_ops.index_name}' - processing every blob")
+            return blob_list
+
+        since = watermark - datetime.timedelta(seconds = SyncWatermarkOverlapSeconds)
+        changed, forced = [], 0
+        for b in blob_list:
+            entry = manifest.get_entry(b.name)
+            if b.last_modified > since or entry.is_empty():
+                changed.append(b)
+            elif self.is_forced_by_config(entry):
+                changed.append(b)
+                forced += 1
+        log_info(f"Incremental sync: {len(changed) - forced} of {len(blob_list)} blobs changed since {since.isoformat()}, "
+                 f"{forced} more to reindex or summarize by the FORCE_*_LASTUPDATETIME config")
+        return changed
+
+    def delete_docs_of_deleted_blobs(self, blob_list: List[BlobProperties], manifest: IndexManifest) -> int:
+        """Delete the index docs of the files in the manifest that aren't in the blob listing"""
+        listed_uris = {f"{BlobOps.file_prefix}/{b.name}" for b in blob_list if not b.deleted}
+        # Only this container's files - and nothing if the listing came back empty. Docs can have
+        #  the url-encoded uri of a listed blob (e.g. added with the blob client's url)
+        deleted_uris = [uri for uri in manifest.entries
+                        if uri.startswith(BlobOps.file_prefix + "/")
+                            and uri not in listed_uris and urllib.parse.unquote(uri) not in listed_uris]
+        if not deleted_uris:
+            return 0
+        if not listed_uris:
+            log_warning(f"Incremental sync: container is empty - not deleting the docs of {len(deleted_uris)} files")
+            return 0
+
+        log_info(f"Incremental sync: deleting the index docs of {len(deleted_uris)} deleted files")
+        n_deleted = 0
+        for uri in deleted_uris:
+            entry = manifest.entries[uri]
+            chunk_group = entry.get_chunk_group()
+            if chunk_group is None and entry.num_chunk_docs > 0:
+                n_deleted += max(0, self.index_ops.delete_docs_for_blob_uri_if_needed(uri))
+                continue
+            if chunk_group is not None:
+                n_deleted += self.index_ops.delete_doc_group(*chunk_group)
+            self.index_ops.delete_documents(entry.whole_docs + entry.summary_docs)
+            n_deleted += len(entry.whole_docs) + len(entry.summary_docs)
+        return n_deleted
+
+    @staticmethod
+    def get_rebuild_items(blobs: List[BlobProperties],
+                          manifest: IndexManifest|None,
+                          generate_index_mode: GenerateIndexModeStrEnum,
+                          generate_summaries_mode: GenerateSummaryModeStrEnum,
+                          cost_model: RebuildCostModel) -> List[RebuildItem]:
+        """The blobs in the order to process them - the longest (by predicted cost) first, so the
+          long documents run alongside the many short ones rather than after them.
+        """
+        items = []
+        for i, blob in enumerate(blobs):
+            needs_contents = PyPdfIndexProcessor.needs_doc_contents(blob, manifest, generate_index_mode, generate_summaries_mode)
+            items.append(RebuildItem(i, blob,
+                                     needs_contents = needs_contents,
+                                     predicted_seconds = cost_model.estimate(blob, needs_contents),
+                                     num_pages = cost_model.get_num_pages(blob.name)))
+        items.sort(key = lambda item: item.predicted_seconds, reverse = True)
+        for i, item in enumerate(items):
+            item.index = i
+        log_info(f"rebuild_index: {sum(item.needs_contents for item in items)} of {len(items)} documents need their contents, "
+                 f"predicted {sum(item.predicted_seconds for item in items):.0f}s of work")
+        return items
+
+    @staticmethod
+    def needs_doc_contents(blob: BlobProperties,
+                           manifest: IndexManifest|None,
+                           generate_index_mode: GenerateIndexModeStrEnum,
+                           generate_summaries_mode: GenerateSummaryModeStrEnum) -> bool:
+        """Whether add_pdf_file_to_index is likely to read the blob's text - so rebuild_index can
+          download and parse it ahead. Only an estimate: a blob fetched needlessly costs a download,
+          and one that isn't is still read when it's indexed.
+        """
+        if blob.deleted:
+            return False
+        if generate_index_mode == "force" or generate_summaries_mode == "force":
+            return True
+        if manifest is None:
+            # The index was recreated (or nothing is ifNewer) - every file is added
+            return generate_index_mode != "off" or generate_summaries_mode != "off"
+
+        entry = manifest.get_entry(blob.name)
+        if generate_summaries_mode == "ifNewer" and len(entry.summary_docs) == 0:
+            return True
+        if generate_index_mode == "off":
+            return False
+        if entry.chunk_doc is None or len(entry.whole_docs) == 0:
+            return True
+        # Newer and a different size is a changed document rather than changed metadata
+        return try_parse_isodate(entry.chunk_doc[FieldName_DocLastUpdateTime]) < blob.last_modified and \
+                    int(entry.chunk_doc[FieldName_TotalDocumentLength]) != blob.size
+
+    def get_chunks_from_pdf_blob(self, 
+                                bops : BlobOps, 
+                                chunk_size, 
+                                overlap,
+                                indexing_strategy:str|None = None
+                                ) -> tuple[list[IndexDocumentChunk], str]:
+        """Return all the index chunks and the text for the blob.
+        Note this holds the whole document in memory - the indexing path streams the 
+          chunks from get_index_chunks_from_pages instead.
+        """
+        pages = self.get_pages_from_pdf_blob(bops, indexing_strategy, blob_md5 = self.get_blob_md5(bops))
+        index_chunks = list(self.get_index_chunks_from_pages(
+            pages, chunk_size, overlap, indexing_strategy, file = bops.blob_name))
+        return index_chunks, ''.join(pages)
 
     @timed()
     def _add_chunks_to_index(
@@ -609,7 +957,13 @@ class PyPdfIndexProcessor:
                         bops: BlobOps, 
                         known_metadata: DocumentMetadata,
                         chunk_size: int, overlap: int,
-                        index_chunks: list[IndexDocumentChunk]) -> int:
+                        pages: list[str],
+                        indexing_strategy: str|None = None,
+                        existing_chunk_docs: List[dict]|None = None,
+                        blob_props: BlobProperties|None = None) -> int:
+        """Chunk the pages and stream the chunks into the index.
+        If the document's existing chunk docs are passed, only the changed chunks are re-embedded.
+        """
 
         processing_parameters = {
             "doc-parser": "pypdf",
@@ -618,9 +972,31 @@ class PyPdfIndexProcessor:
             "version": "1.0",
             "chunk-size": chunk_size,
             "chunk-overlap": overlap,
+            "chunk-units": "tokens" if indexing_strategy == IndexingStrategy_TokenOverlap else "characters",
         }
 
-        blob_props = bops.get_blob_properties()
+        blob_props = blob_props or bops.get_blob_properties()
+        file = bops.get_blob_name()
+
+        text_chunks = self.get_text_chunks_from_pages(pages, chunk_size, overlap, indexing_strategy)
+        if isinstance(text_chunks, TokenTextChunker):
+            # Count from the token offsets so the document is only encoded once
+            n_chunks = text_chunks.count_chunks()
+        else:
+            n_chunks = self.count_chunks_from_pages(pages, chunk_size, overlap, indexing_strategy)
+        if n_chunks == 0:
+            # TODO: Add Status field to index so we can mark as failed?
+            log_warning(f"Creating single empty chunk for no-text file '{file}'")
+            # Create empty chunk for no-text file so we don't try and re-index every time
+            n_chunks = 1
+            index_chunks = iter([
+                IndexDocumentChunk(
+                    Content = "", PageNumber = 0, 
+                    ContentTokenCount = 0, ContentLength = 0)
+                ])
+        else:
+            index_chunks = self.get_index_chunks_from_text_chunks(
+                text_chunks, file = file, pages = pages, indexing_strategy = indexing_strategy)
 
         index_doc_info = IndexDocumentInfo(
             Title = bops.get_blob_name(),
@@ -629,7 +1005,7 @@ class PyPdfIndexProcessor:
             #  sure that when we search for chunk/smmary docs that we encode in the filter as well
             Uri = bops.get_blob_uri_unencoded(),
             RequestedChunkSize = chunk_size,
-            TotalDocumentNumChunks = len(index_chunks),
+            TotalDocumentNumChunks = n_chunks,
             TotalDocumentLength = blob_props.size,
             DocLastUpdateTime = blob_props.last_modified,
             IndexerSource = "py-indexer",
@@ -642,64 +1018,45 @@ class PyPdfIndexProcessor:
             DocUnstructuredMetadata = json.dumps(blob_props.metadata),
         )
 
-        log_info(f"Adding {len(index_chunks)} chunks to index for '{bops.get_blob_name()}'")    
+        if existing_chunk_docs:
+            log_info(f"Updating {n_chunks} chunks in index for '{file}'")    
+            return self.index_ops.update_doc_index_chunks_incrementally(
+                index_chunks, index_doc_info, existing_chunk_docs, file = file)
 
-        self.index_ops.add_doc_index_chunks_to_index(index_chunks, index_doc_info, file = bops.get_blob_name())
-        return len(index_chunks)
+        log_info(f"Adding {n_chunks} chunks to index for '{file}'")    
 
-    def patch_document_metadata_if_needed(self, docs: List[dict], blob_props: BlobProperties) -> int:
-        """ Update existing index documents with new metadata so it can be upserted.
-        Only update if metadata has changed - return the number of docs updated.
-        (Should be either 0 or len(docs))
-        """
-        # TODO: Unless we need to be more fine-grained, we could just compare metadata strings?
-        # metadata_diff['values_changed']["root['documentTwinMetadata']"]['new_value']
-        # If we want to see more fine-grained changes, we loads chagned docTwinMetadata and do the diff there
-        #  rather than just at the top-level
-
-        n_docs_updated = 0
-        last_metadata_changed = {}
-        new_metadata = blob_props.metadata
-        new_metadata_json = None
-        doc_metadata:DocumentMetadata = Metadata.parse_doctwin_metadata(
-                                            blob_props.metadata, blob_props.name)
-
-        if not docs or len(docs) == 0:
-            log_warning(f"No docs to patch for '{blob_props.name}'")
-            return 0
-
-        if len(docs) > 0:
-            doc = docs[0]
-            vec = doc[FieldName_Vector]
-            if not vec:
-                log_warning(f"Document '{doc[FieldName_Title]}' of type {doc[FieldName_ItemType]} has no vector embedding in {FieldName_Vector}")
-
-        for doc in docs:
-
-            doc[FieldName_DocLastUpdateTime] = blob_props.last_modified
-            old_metadata = json.loads(doc[FieldName_DocUnstructuredMetadata])
-            #metadata_changed = new_metadata != old_metadata
-            metadata_diff = deepdiff.DeepDiff(old_metadata, new_metadata)
-            # Returns a dict ({} if no changes) with keys 'values_changed', 'dictionary_item_added', 'dictionary_item_removed'  
-            if metadata_diff:
-                if not new_metadata_json: new_metadata_json = json.dumps(new_metadata)
-                # TODO: Should share code w/_add_doc_chunks_to_index
-                doc[FieldName_DocUnstructuredMetadata] = new_metadata_json
-                doc[FieldName_CopilotEnabled] = doc_metadata.is_copilot_enabled
-                doc[FieldName_FilterTags] = doc_metadata.doc_custom_tags
-                if last_metadata_changed != metadata_diff:
-                    log_debug(f"Updating changed metadata for doc: {doc[FieldName_Title]}: {metadata_diff}")
-                    last_metadata_changed = metadata_diff
-                n_docs_updated += 1
-
-        if n_docs_updated != 0 and n_docs_updated != len(docs):
-            # All chunks should have the same metadata
-            log_warning("nDocs with changed metadata should be 0 or all docs")
-
-        return n_docs_updated
+        return self.index_ops.add_doc_index_chunks_to_index(index_chunks, index_doc_info, file = file)
 
     def is_rebuild_in_progress(self) -> bool:
-        return RebuildInProgressStartTime is not None
+        return get_rebuild_job_store().get_running_job() is not None
+
+    def start_rebuild_job(
+                self,
+                delete_and_recreate_index = True,
+                generate_summaries_mode : GenerateSummaryModeStrEnum | None = "ifNewer",
+                generate_index_mode : GenerateIndexModeStrEnum | None = "ifNewer",
+                chunk_size: int|None = None,
+                chunk_overlap: int|None = None,
+                include_chunkdocs_for_copilot_disabled_files: bool | None = True,
+                indexing_strategy:str|None = None,
+                incremental_sync: bool = False,
+                resume: bool = True
+                ) -> RebuildJob|None:
+        """Start the job of a rebuild, to pass to rebuild_index - resuming the unfinished job of
+          an earlier rebuild with the same parameters if resume is set.
+        None if a rebuild is already in progress.
+        """
+        params = dict(
+            delete_and_recreate_index = delete_and_recreate_index,
+            generate_summaries_mode = generate_summaries_mode or "ifNewer",
+            generate_index_mode = generate_index_mode or "ifNewer",
+            chunk_size = chunk_size,
+            chunk_overlap = chunk_overlap,
+            include_chunkdocs_for_copilot_disabled_files = include_chunkdocs_for_copilot_disabled_files,
+            indexing_strategy = indexing_strategy,
+            incremental_sync = incremental_sync,
+        )
+        return get_rebuild_job_store().start_job(self.index_ops.index_name, params, resume = resume)
 
     @timed()
     def rebuild_index(
@@ -711,31 +1068,48 @@ class PyPdfIndexProcessor:
                 chunk_overlap: int|None = None,
                 include_chunkdocs_for_copilot_disabled_files: bool | None = True,
                 num_threads: int|None = None,
-                indexing_strategy:str|None = None
+                indexing_strategy:str|None = None,
+                incremental_sync: bool = False,
+                job: RebuildJob|None = None
                 ) -> int:
         """Rebuild the index by processing each blob file in the container.
         Add doc chunks, whole docs, and LLM-generated summaries to the index,
           depending on force|ifNewer|off settings.
+        Runs as the given job from start_rebuild_job, or starts (or resumes) one - the job
+          checkpoints each blob, so a resumed rebuild skips the blobs already done.
+        With incremental_sync, only the blobs modified since the last complete rebuild are
+          processed, and the docs of blobs deleted since are removed - see get_blobs_to_sync.
         """
 
-        global RebuildInProgressStartTime
-        if RebuildInProgressStartTime:
-            log_warning(f"Index rebuild already in progress (started {RebuildInProgressStartTime.isoformat()}) - skipping this request")
-            # TODO: Should we have a max_time here in case the previous one is hung or improperly reported?
-            return 0
+        if job is None:
+            job = self.start_rebuild_job(
+                delete_and_recreate_index = delete_and_recreate_index,
+                generate_summaries_mode = generate_summaries_mode,
+                generate_index_mode = generate_index_mode,
+                chunk_size = chunk_size,
+                chunk_overlap = chunk_overlap,
+                include_chunkdocs_for_copilot_disabled_files = include_chunkdocs_for_copilot_disabled_files,
+                indexing_strategy = indexing_strategy,
+                incremental_sync = incremental_sync)
+            if job is None:
+                running = get_rebuild_job_store().get_running_job()
+                log_warning(f"Index rebuild already in progress (job {running.job_id if running else '?'}) - skipping this request")
+                return 0
 
+        job_error = None
         try:
-            RebuildInProgressStartTime = datetime.datetime.now()
             generate_summaries_mode = generate_summaries_mode or "ifNewer"
             generate_index_mode = generate_index_mode or "ifNewer"
             include_chunkdocs_for_copilot_disabled_files = default(include_chunkdocs_for_copilot_disabled_files, False)
 
+            get_indexing_stats().reset()
             MetricIndexRebuildRequest(True,
                                 delete_and_recreate = delete_and_recreate_index,
                                 summary_mode = generate_summaries_mode,
                                 index_mode = generate_index_mode)
 
-            if delete_and_recreate_index:
+            # A resumed job's index already has the docs of the blobs it did
+            if delete_and_recreate_index and not job.resumed:
                 self.index_ops.delete_index()
             self.index_ops.create_or_update_index()
 
@@ -743,17 +1117,67 @@ class PyPdfIndexProcessor:
                 log_debug("Rebuild index: No work to do")
                 return 0
 
+            # One pass over the index for the ifNewer decisions of all the files, rather than
+            #  searches per file (a recreated index is empty)
+            manifest = None
+            if (not delete_and_recreate_index or job.resumed) and "ifNewer" in (generate_index_mode, generate_summaries_mode):
+                manifest = IndexManifest.build(self.index_ops)
+
+            # Each stage of the pipeline is sized for what it waits on
             n_cores = multiprocessing.cpu_count()
-            n_workers = num_threads or min(4, int(os.environ.get("COPILOT_INDEXING_NUMTHREADS") or n_cores))
-            log_debug(f"Rebuilding index with {n_workers} threads")
+            n_index_workers = num_threads or int(os.environ.get("COPILOT_INDEXING_NUMTHREADS") or max(4, n_cores))
+            n_download_workers = max(1, RebuildDownloadWorkers)
+            n_parse_workers = RebuildParseWorkers or get_default_num_extract_workers()
+            log_debug(f"Rebuilding index with {n_download_workers} download, {n_parse_workers} parse "
+                      f"and {n_index_workers} index threads")
             n_docs_processed = 0
+            n_docs_failed = 0
+            cost_model = get_rebuild_cost_model()
+            # (predicted, actual) seconds of each document
+            timings = []
 
-            # TODO: Use new twinsapi SQL based jobs api when avail?
-            # TODO: Support cancellation?
             # TODO: Get nested OpenTelemetry logs working so we can scope in the threadid
 
-            def work(job: tuple[int, BlobProperties]):
-                i, blob = job
+            @timed_rebuild_stage
+            def download(item: RebuildItem) -> RebuildItem:
+                """ Fetch the blob if it'll be parsed - unless its pages are in the page text cache """
+                if job.is_cancelled() or not item.needs_contents:
+                    return item
+                try:
+                    item.pages = get_page_text_cache().get(
+                        self.get_blob_props_md5(item.blob), PyPdfExtractionMode, self.remove_extra_whitespace)
+                    if item.pages is None:
+                        item.stream = self.download_blob_stream(BlobOps(item.blob.name))
+                    else:
+                        item.num_pages = len(item.pages)
+                except Exception as e:
+                    # Indexing reads the blob itself
+                    log_warning(f"rebuild_index: prefetch of '{item.blob.name}' failed: {e}")
+                return item
+
+            @timed_rebuild_stage
+            def parse(item: RebuildItem) -> RebuildItem:
+                """ Extract the pages (on the PdfPageExtractor process pool) """
+                if item.stream is None:
+                    return item
+                try:
+                    pp = PyPdfIndexProcessor(self.index_ops.index_name, self.remove_extra_whitespace)
+                    item.pages = pp.get_pages_from_pdf_blob(BlobOps(item.blob.name), indexing_strategy,
+                                                            blob_md5 = self.get_blob_props_md5(item.blob),
+                                                            stream = item.stream)
+                    item.num_pages = len(item.pages)
+                except Exception as e:
+                    log_warning(f"rebuild_index: prefetch parse of '{item.blob.name}' failed: {e}")
+                item.stream = None
+                return item
+
+            @timed_rebuild_stage
+            def index(item: RebuildItem) -> RebuildItem:
+                """ Chunk, embed (through the shared, rate-limited EmbeddingScheduler) and upload """
+                i, blob = item.index, item.blob
+                if job.is_cancelled():
+                    item.skipped = True
+                    return item
                 tid = threading.current_thread().native_id
                 log_info(f"Index all file worker (thread {tid}): {i:3}/{len(blob_list)}: {int(blob.size/1024):>8}K : {blob.name}")
                 # TODO: Pass in file/blob to c'tor and instantiate per-file
@@ -767,28 +1191,74 @@ class PyPdfIndexProcessor:
                         chunk_size = chunk_size,
                         chunk_overlap = chunk_overlap,
                         include_chunkdocs_for_copilot_disabled_files = include_chunkdocs_for_copilot_disabled_files,
-                        indexing_strategy = indexing_strategy
+                        indexing_strategy = indexing_strategy,
+                        manifest = manifest,
+                        metadata_batcher = metadata_batcher,
+                        prefetched_pages = item.pages,
+                        blob_props = item.blob
                     )
                 except Exception as e:
-                    log_exception(f"Aborting thread: IndexAll (thread:{tid}): Error processing '{blob.name}'")
-                    raise # No effect as no more work to do and won't affect main thread
-
+                    log_exception(f"IndexAll (thread:{tid}): Error processing '{blob.name}'")
+                    item.error = e
+                item.pages = None
                 log_info(f"Index all file worker complete: IndexRebuild->IndexDocument (index:{i}, thread:{tid}) '{blob.name}'")
-                nonlocal n_docs_processed
-                n_docs_processed += 1
+                return item
 
             bops = BlobOps()
-            blob_list = bops.get_blob_list()
+            # The listed properties (with metadata) are used in place of a request per blob
+            blob_list = bops.get_blob_list(include_metadata = True)
             log_info(f"rebuild_index: found {len(blob_list)} documents to process")
-            # Process short docs first, for no good reason than faster inital processing of files when debugging
-            blob_list = sorted(blob_list, key = lambda b: b.size)
-            # TODO: Is this threadpool shared w/Flask's for incomming requests? 
+            # Every blob modified up to here is in the index once this rebuild completes
+            sync_watermark = max((b.last_modified for b in blob_list), default = None)
+            if incremental_sync:
+                blob_list = self.get_blobs_to_sync(blob_list, manifest)
+            blob_list = job.set_blobs(blob_list)
+            items = self.get_rebuild_items(blob_list, manifest, generate_index_mode, generate_summaries_mode, cost_model)
+
+            def blob_items() -> Iterator[RebuildItem]:
+                for item in items:
+                    if job.is_cancelled():
+                        return
+                    yield item
+
+            def mark_blob_merged(item: RebuildItem, ok: bool) -> None:
+                if ok:
+                    job.mark_blob_done(item.blob, item.work_seconds)
+                else:
+                    job.mark_blob_failed(item.blob, item.work_seconds, "Failed to merge metadata")
 
             start = time.time()
-            # Index all files in threadpool 
-            with ThreadPoolExecutor(max_workers = n_workers) as executor:
-                worklist = enumerate(blob_list)
-                executor.map(work, worklist)
+            # Download, parse and index overlap - while one file is embedded, the next are being
+            #  parsed and downloaded. The bounded queues between the stages limit how many files
+            #  are held in memory ahead of indexing.
+            # Metadata-only changes of all the files are merged together
+            with MetadataMergeBatcher(self.index_ops) as metadata_batcher:
+                for item in run_pipeline("rebuild-index", blob_items(), [
+                            PipelineStage("download", download, num_workers = n_download_workers, queue_size = n_download_workers),
+                            PipelineStage("parse", parse, num_workers = n_parse_workers, queue_size = n_parse_workers),
+                            PipelineStage("index", index, num_workers = n_index_workers, queue_size = n_index_workers),
+                        ]):
+                    if item.error is not None:
+                        # Retried when the job is resumed
+                        job.mark_blob_failed(item.blob, item.work_seconds, str(item.error))
+                        n_docs_failed += 1
+                    elif not item.skipped:
+                        # Checkpointed once the blob's batched metadata merges (if any) are sent -
+                        #  an interrupted rebuild redoes blobs whose merges were still pending
+                        metadata_batcher.on_sent(item.blob.name, partial(mark_blob_merged, item))
+                        n_docs_processed += 1
+                        log_debug(f"rebuild_index: '{item.blob.name}' took {item.work_seconds:.2f}s, "
+                                  f"predicted {item.predicted_seconds:.2f}s")
+                        cost_model.record(item.blob, item.num_pages, item.needs_contents,
+                                          item.predicted_seconds, item.work_seconds)
+                        timings.append((item.predicted_seconds, item.work_seconds))
+            cost_model.log_accuracy(timings)
+            cost_model.fit()
+
+            # A failed blob could be older than the watermark, so it's only advanced when all succeeded
+            if sync_watermark is not None and generate_index_mode != "off" and \
+                    n_docs_failed == 0 and metadata_batcher.num_failed == 0 and not job.is_cancelled():
+                get_rebuild_job_store().set_sync_watermark(self.index_ops.index_name, BlobOps.container_name, sync_watermark)
             duration_ms = int((time.time() - start) * 1000)
 
             MetricIndexRebuildComplete(duration=duration_ms, ok=True,
@@ -796,10 +1266,19 @@ class PyPdfIndexProcessor:
                                         summary_mode = generate_summaries_mode,
                                         index_mode = generate_index_mode)
 
+        except Exception as e:
+            job_error = str(e)
+            raise
         finally:
-            RebuildInProgressStartTime = None
-
-        log_info(f"Index rebuild complete: {n_docs_processed} documents processed")
+            get_rebuild_job_store().end_job(job, job_error)
+
+        log_info(f"Index rebuild {'cancelled' if job.is_cancelled() else 'complete'} (job {job.job_id}): {n_docs_processed} documents processed")
+        get_token_counter().log_stats()
+        embedding_cache = get_embedding_cache()
+        embedding_cache.flush()
+        embedding_cache.log_stats()
+        for scheduler in get_embedding_schedulers():
+            scheduler.log_stats()
         return n_docs_processed
 
 
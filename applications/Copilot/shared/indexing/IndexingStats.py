@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+from shared.OpenTelemetry import MetricIndexingStage, MetricIndexingInFlight, MetricIndexingThroughput
+
+# Indexing stages, in processing order
+Stage_Download = "download"
+Stage_Extract = "extract"
+Stage_Chunk = "chunk"
+Stage_TokenCount = "tokenCount"
+Stage_Embed = "embed"
+Stage_Upload = "upload"
+Stage_Summary = "summary"
+IndexingStages = [Stage_Download, Stage_Extract, Stage_Chunk, Stage_TokenCount, Stage_Embed, Stage_Upload, Stage_Summary]
+
+# Window of the "current" rates, as opposed to the averages since the rebuild started
+RateWindowSeconds = 60.0
+# Number of slowest documents in flight reported
+NumSlowestDocuments = 5
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    in_flight: int = 0
+
+
+@dataclass
+class DocumentInFlight:
+    file: str
+    size: int
+    start_time: float
+    stage: str|None = None
+
+
+class IndexingStats:
+    """ Where indexing time goes - per-stage timings and in-flight counts, throughput of bytes,
+    pages and chunks, and the documents being indexed - for the /index/progress endpoint, and
+    as telemetry metrics.
+    Stages are timed where they run (PyPdfIndexProcessor, AzureAiIndexOps), so they cover single
+      document requests as well as rebuilds. Totals are since the last rebuild started.
+    The stats are process-wide - use get_indexing_stats().
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._documents: Dict[int, DocumentInFlight] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.start_time = time.time()
+            self.stages: Dict[str, StageStats] = {stage: StageStats() for stage in IndexingStages}
+            self.totals = {"bytes": 0, "pages": 0, "chunks": 0, "documents": 0}
+            # (time, name, count) of recent throughput, for the windowed rates
+            self._recent: deque = deque()
+
+    @contextmanager
+    def stage(self, name: str, file: str|None = None) -> Iterator[None]:
+        """ Time a stage - of the given file's document in flight, if any """
+        with self._lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.in_flight += 1
+            document = self._find_document(file) if file else None
+            if document is not None:
+                document.stage = name
+        MetricIndexingInFlight(name, 1)
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            with self._lock:
+                stats.in_flight -= 1
+                stats.count += 1
+                stats.seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+            MetricIndexingInFlight(name, -1)
+            MetricIndexingStage(name, int(seconds * 1000))
+
+    def add(self, name: str, count: int) -> None:
+        """ Count bytes, pages, chunks or documents indexed """
+        if count <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0) + count
+            self._recent.append((now, name, count))
+            self._trim_recent(now)
+        MetricIndexingThroughput(name, count)
+
+    def _trim_recent(self, now: float) -> None:
+        while self._recent and self._recent[0][0] < now - RateWindowSeconds:
+            self._recent.popleft()
+
+    @contextmanager
+    def document(self, file: str, size: int = 0) -> Iterator[None]:
+        """ Track a document being indexed """
+        document = DocumentInFlight(file, size, time.time())
+        # Keyed by the object, as the same file can be in flight twice
+        key = id(document)
+        with self._lock:
+            self._documents[key] = document
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._documents.pop(key, None)
+            self.add("documents", 1)
+
+    def _find_document(self, file: str) -> DocumentInFlight|None:
+        for document in self._documents.values():
+            if document.file == file:
+                return document
+        return None
+
+    def get_progress(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._trim_recent(now)
+            elapsed = max(now - self.start_time, 0.001)
+            window = min(elapsed, RateWindowSeconds)
+            recent: Dict[str, int] = {}
+            for _, name, count in self._recent:
+                recent[name] = recent.get(name, 0) + count
+            stages = {
+                name: {
+                    "count": s.count,
+                    "in_flight": s.in_flight,
+                    "total_seconds": round(s.seconds, 3),
+                    "mean_ms": int(s.seconds * 1000 / s.count) if s.count else 0,
+                    "max_ms": int(s.max_seconds * 1000),
+                }
+                for name, s in self.stages.items()
+            }
+            slowest: List[DocumentInFlight] = sorted(self._documents.values(), key = lambda d: d.start_time)[:NumSlowestDocuments]
+            return {
+                "elapsed_seconds": int(elapsed),
+                "totals": dict(self.totals),
+                "rates_per_second": {name: round(total / elapsed, 2) for name, total in self.totals.items()},
+                "recent_rates_per_second": {name: round(recent.get(name, 0) / window, 2) for name in self.totals},
+                "stages": stages,
+                "documents_in_flight": len(self._documents),
+                "slowest_documents_in_flight": [
+                    {"file": d.file, "size": d.size, "stage": d.stage, "elapsed_seconds": round(now - d.start_time, 1)}
+                    for d in slowest
+                ],
+            }
+
+
+_indexing_stats = IndexingStats()
+
+def get_indexing_stats() -> IndexingStats:
+    return _indexing_stats
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List
+
+from azure.search.documents.models import IndexingResult
+
+from shared.indexing.IndexOps import AzureAiIndexOps
+from shared.indexing.IndexPayload import IndexAction_Merge
+from shared.indexing.SearchIndexConfig import (
+    FieldName_Id, FieldName_DocUnstructuredMetadata, FieldName_CopilotEnabled,
+    FieldName_FilterTags, FieldName_DocLastUpdateTime
+)
+from shared.Metadata import DocumentMetadata
+from shared.Utils import get_index_timestr
+from shared.OpenTelemetry import log_info, log_warning
+
+# Partial merges are small (no content or vectors), so many documents' worth fit in a batch
+MetadataMergeBatchDocs = int(os.environ.get("COPILOT_METADATA_MERGE_BATCH_DOCS") or 5000)
+
+# The only fields a metadata change touches
+MetadataMergeFields = [
+    FieldName_DocUnstructuredMetadata,
+    FieldName_CopilotEnabled,
+    FieldName_FilterTags,
+    FieldName_DocLastUpdateTime,
+]
+
+
+def get_metadata_merge_docs(ids: List[str], blob_metadata: Dict[str, str], doc_metadata: DocumentMetadata,
+                            last_modified) -> List[Dict[str, Any]]:
+    """ Partial docs merging the blob's current metadata into the index docs with the given ids """
+    fields = {
+        FieldName_DocUnstructuredMetadata: json.dumps(blob_metadata),
+        FieldName_CopilotEnabled: doc_metadata.is_copilot_enabled,
+        FieldName_FilterTags: doc_metadata.doc_custom_tags,
+        FieldName_DocLastUpdateTime: get_index_timestr(last_modified),
+    }
+    return [{FieldName_Id: id, **fields} for id in ids]
+
+
+class MetadataMergeBatcher:
+    """ Collects the metadata merges of many documents and sends them together in large batches,
+    rather than a round trip (or several) per document.
+    Merges are only sent once MetadataMergeBatchDocs are pending, so flush when done adding.
+    A failed merge leaves the doc's DocLastUpdateTime older than its blob, so the next ifNewer
+      rebuild retries it - failures (of docs or of whole requests) are logged rather than raised
+      in whichever thread sent the batch, and reported to the key's on_sent callback.
+    """
+
+    def __init__(self, index_ops: AzureAiIndexOps, batch_docs: int = MetadataMergeBatchDocs) -> None:
+        self.index_ops = index_ops
+        self.batch_docs = batch_docs
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        # Key of each pending doc (by Id), the keys being sent, and the outcome of keys sent
+        #  before anyone asked - see on_sent
+        self._pending_keys: Dict[str, str] = {}
+        self._pending_key_names: set[str] = set()
+        self._sending_keys: set[str] = set()
+        self._sent_keys: Dict[str, bool] = {}
+        self._callbacks: Dict[str, Callable[[bool], None]] = {}
+        self.num_merged = 0
+        self.num_failed = 0
+
+    def add(self, docs: List[Dict[str, Any]], key: str|None = None) -> None:
+        """ Queue the merges - key (e.g. the blob name) identifies them to on_sent """
+        with self._lock:
+            self._pending.extend(docs)
+            if key is not None:
+                self._pending_keys.update((d[FieldName_Id], key) for d in docs)
+                self._pending_key_names.add(key)
+            if len(self._pending) < self.batch_docs:
+                return
+            batch, keys = self._take_pending()
+        self._send(batch, keys)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, keys = self._take_pending()
+        if batch:
+            self._send(batch, keys)
+
+    def on_sent(self, key: str, callback: Callable[[bool], None]) -> None:
+        """ Call callback(ok) once the merges added with key have been sent - straight away if
+        they already have been, or there were none. ok is False if any of them failed. """
+        with self._lock:
+            ok = self._sent_keys.pop(key, None)
+            if ok is None and (key in self._sending_keys or key in self._pending_key_names):
+                self._callbacks[key] = callback
+                return
+        callback(ok is not False)
+
+    def _take_pending(self) -> tuple[List[Dict[str, Any]], Dict[str, str]]:
+        batch, self._pending = self._pending, []
+        keys, self._pending_keys = self._pending_keys, {}
+        self._sending_keys.update(self._pending_key_names)
+        self._pending_key_names = set()
+        return batch, keys
+
+    def _send(self, docs: List[Dict[str, Any]], keys: Dict[str, str]) -> None:
+        try:
+            results: List[IndexingResult] = self.index_ops.index_documents(docs, IndexAction_Merge)
+            failed_ids = set(r.key for r in results if not r.succeeded)
+            log_info(f"MetadataMergeBatcher: merged metadata of {len(docs) - len(failed_ids)} docs")
+            if failed_ids:
+                failed = next(r for r in results if not r.succeeded)
+                log_warning(f"MetadataMergeBatcher: failed to merge metadata of {len(failed_ids)} docs, "
+                            f"e.g. '{failed.key}': {failed.status_code} {failed.error_message}")
+        except Exception as e:
+            failed_ids = set(d[FieldName_Id] for d in docs)
+            log_warning(f"MetadataMergeBatcher: failed to merge metadata of {len(docs)} docs: {e}")
+
+        outcomes: Dict[str, bool] = {}
+        for id, key in keys.items():
+            outcomes[key] = outcomes.get(key, True) and id not in failed_ids
+        with self._lock:
+            self.num_merged += len(docs) - len(failed_ids)
+            self.num_failed += len(failed_ids)
+            self._sending_keys.difference_update(outcomes)
+            callbacks = []
+            for key, ok in outcomes.items():
+                callback = self._callbacks.pop(key, None)
+                if callback is None:
+                    self._sent_keys[key] = ok
+                else:
+                    callbacks.append((callback, ok))
+        for callback, ok in callbacks:
+            callback(ok)
+
+    def __enter__(self) -> "MetadataMergeBatcher":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+
+from shared.OpenTelemetry import log_info, log_debug, log_warning
+
+# Bump if the extraction code changes in a way that changes the text for the same settings
+PageTextCacheVersion = "1"
+PageTextCacheFileSuffix = ".pages.z"
+# When over the size cap, evict down to this fraction of it so we don't evict on every put
+PageTextCacheEvictToFraction = 0.9
+
+
+def get_default_page_text_cache_dir() -> str:
+    return os.environ.get("COPILOT_PAGE_TEXT_CACHE_DIR") or \
+                os.path.join(tempfile.gettempdir(), "copilot-page-text-cache")
+
+def get_default_page_text_cache_max_bytes() -> int:
+    # 0 disables the cache
+    return int(float(os.environ.get("COPILOT_PAGE_TEXT_CACHE_MAX_MB") or 1024) * 1024 * 1024)
+
+
+class PageTextCache:
+    """Local on-disk cache of the extracted text of each page of a PDF.
+
+    Entries are keyed by the blob's content MD5 plus the extraction settings, so a
+      changed blob or different settings never hits a stale entry, and a reindex of an
+      unchanged blob - e.g. with a different chunk size or indexing strategy - skips the
+      download and pypdf extraction.
+    Each entry is one zlib-compressed json list of page texts. The file mtime is used as
+      the last access time, and the least recently used entries are evicted when the
+      total size goes over max_bytes.
+    The cache is process-wide - use get_page_text_cache().
+    """
+
+    def __init__(self, cache_dir: str|None = None, max_bytes: int|None = None) -> None:
+        self.cache_dir = cache_dir or get_default_page_text_cache_dir()
+        self.max_bytes = max_bytes if max_bytes is not None else get_default_page_text_cache_max_bytes()
+        self._lock = threading.Lock()
+        self._total_bytes: int|None = None # lazily scanned from disk
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def get_key(blob_md5: str, extraction_mode: str, remove_extra_whitespace: bool) -> str:
+        key = f"{PageTextCacheVersion}|{blob_md5}|{extraction_mode}|{remove_extra_whitespace}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + PageTextCacheFileSuffix)
+
+    def _list_entries(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) of every entry"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(PageTextCacheFileSuffix):
+                    try:
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+                    except FileNotFoundError:
+                        pass # evicted by another process
+        return entries
+
+    def _get_total_bytes(self) -> int:
+        if self._total_bytes is None:
+            os.makedirs(self.cache_dir, exist_ok = True)
+            self._total_bytes = sum(size for _, size, _ in self._list_entries())
+            log_info(f"PageTextCache: '{self.cache_dir}' holds {self._total_bytes:,} bytes (max {self.max_bytes:,})")
+        return self._total_bytes
+
+    def get(self, blob_md5: str|None, extraction_mode: str, remove_extra_whitespace: bool) -> list[str]|None:
+        if not self.enabled or not blob_md5:
+            return None
+
+        path = self._get_path(self.get_key(blob_md5, extraction_mode, remove_extra_whitespace))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            pages = json.loads(zlib.decompress(data))
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self.num_misses += 1
+            return None
+        except Exception as e:
+            log_warning(f"PageTextCache: ignoring unreadable entry '{path}': {e}")
+            self._remove(path)
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        log_debug(f"PageTextCache: hit for md5 {blob_md5} - {len(pages)} pages")
+        return pages
+
+    def put(self, blob_md5: str|None, extraction_mode: str, remove_extra_whitespace: bool, pages: list[str]) -> None:
+        if not self.enabled or not blob_md5:
+            return
+
+        try:
+            data = zlib.compress(json.dumps(pages).encode('utf-8'))
+            if len(data) > self.max_bytes:
+                return
+
+            with self._lock:
+                self._get_total_bytes()
+                path = self._get_path(self.get_key(blob_md5, extraction_mode, remove_extra_whitespace))
+                # Write then rename so readers never see a partial entry
+                fd, tmp_path = tempfile.mkstemp(dir = self.cache_dir, suffix = ".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                    old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                    os.replace(tmp_path, path)
+                except:
+                    self._remove(tmp_path)
+                    raise
+                self._total_bytes += len(data) - old_size
+
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+
+            log_debug(f"PageTextCache: added md5 {blob_md5} - {len(pages)} pages, {len(data):,} bytes")
+
+        except Exception as e:
+            # The cache is only an optimization
+            log_warning(f"PageTextCache: failed to add entry for md5 {blob_md5}: {e}")
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def _evict(self) -> None:
+        # Rescan - other processes may share the directory
+        entries = sorted(self._list_entries())
+        self._total_bytes = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * PageTextCacheEvictToFraction)
+        n_evicted = 0
+        for _, _, path in entries:
+            if self._total_bytes <= target:
+                break
+            self._total_bytes -= self._remove(path)
+            n_evicted += 1
+        log_info(f"PageTextCache: evicted {n_evicted} entries - {self._total_bytes:,} bytes remaining")
+
+    def clear(self) -> None:
+        with self._lock:
+            if os.path.isdir(self.cache_dir):
+                for _, _, path in self._list_entries():
+                    self._remove(path)
+            self._total_bytes = 0
+
+
+_page_text_cache: PageTextCache|None = None
+_page_text_cache_lock = threading.Lock()
+
+def get_page_text_cache() -> PageTextCache:
+    global _page_text_cache
+    with _page_text_cache_lock:
+        if _page_text_cache is None:
+            _page_text_cache = PageTextCache()
+        return _page_text_cache
@@ -0,0 +1,175 @@
+import os
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from time import sleep
+
+from pypdf import PdfReader
+
+from shared.indexing.PdfPageWorker import extract_page_texts, extract_shared_pages_worker
+from shared.OpenTelemetry import log_info, log_debug, log_warning, log_exception
+
+# Below this many pages, the cost of handing the document to the pool outweighs the gain
+MinPagesForProcessPool = 8
+# Number of page batches per worker - a few per worker evens out slow pages
+BatchesPerWorker = 4
+# Most PDF bytes in shared memory at once, across the documents being extracted. /dev/shm
+#  is a tmpfs - 64 MB by default in docker and k8s - and writing past its size kills the
+#  process with SIGBUS, so documents that don't fit are extracted in-process instead.
+MaxSharedMemoryBytes = int(float(os.environ.get("COPILOT_PDF_EXTRACT_MAX_SHARED_MB") or 32) * 1024 * 1024)
+SharedMemoryDir = "/dev/shm"
+
+
+def get_default_num_extract_workers() -> int:
+    n = os.environ.get("COPILOT_PDF_EXTRACT_NUMPROCS")
+    if n:
+        return max(1, int(n))
+    return min(4, multiprocessing.cpu_count())
+
+
+class PdfPageExtractor:
+    """Extract the text of every page of a PDF using a pool of worker processes.
+
+    pypdf extraction is pure python and CPU-bound, so running it on a Flask thread holds
+      the GIL away from incoming requests. The PDF bytes are put into one shared memory
+      segment that every worker reads in place, and each worker extracts contiguous
+      batches of pages. Pages are returned in document order.
+    The worker pools are process-wide and kept warm between documents. Workers are forked
+      from a forkserver that has imported only PdfPageWorker - run the app from main.py so
+      that the workers' import of the main module doesn't load the app as well.
+    """
+
+    _pools: dict[int, ProcessPoolExecutor] = {}
+    _pools_lock = threading.Lock()
+    # Bytes of the documents currently in shared memory
+    _shared_bytes = 0
+    _shared_bytes_lock = threading.Lock()
+
+    def __init__(self, extraction_mode: str = 'plain', num_workers: int|None = None) -> None:
+        self.extraction_mode = extraction_mode
+        self.num_workers = num_workers or get_default_num_extract_workers()
+
+    @classmethod
+    def _get_pool(cls, num_workers: int) -> ProcessPoolExecutor:
+        with cls._pools_lock:
+            pool = cls._pools.get(num_workers)
+            if pool is None:
+                log_info(f"PdfPageExtractor: starting process pool with {num_workers} workers")
+                pool = ProcessPoolExecutor(
+                    max_workers = num_workers,
+                    mp_context = cls._get_mp_context())
+                cls._pools[num_workers] = pool
+            return pool
+
+    @staticmethod
+    def _get_mp_context() -> multiprocessing.context.BaseContext:
+        # Don't fork a multi-threaded flask process - fork clean workers from a forkserver
+        #  (spawn where there's none, e.g. Windows)
+        if "forkserver" not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("spawn")
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["shared.indexing.PdfPageWorker"])
+        return context
+
+    @classmethod
+    def _reserve_shared_memory(cls, size: int) -> bool:
+        """ Whether a document of size bytes can go in shared memory now - if so, release
+        the reservation with _release_shared_memory when it's done """
+        with cls._shared_bytes_lock:
+            if cls._shared_bytes + size > MaxSharedMemoryBytes:
+                return False
+            if os.path.isdir(SharedMemoryDir):
+                stats = os.statvfs(SharedMemoryDir)
+                if size > stats.f_bavail * stats.f_frsize:
+                    return False
+            cls._shared_bytes += size
+            return True
+
+    @classmethod
+    def _release_shared_memory(cls, size: int) -> None:
+        with cls._shared_bytes_lock:
+            cls._shared_bytes -= size
+
+    @classmethod
+    def _discard_pool(cls, num_workers: int) -> None:
+        with cls._pools_lock:
+            pool = cls._pools.pop(num_workers, None)
+        if pool:
+            pool.shutdown(wait = False, cancel_futures = True)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        with cls._pools_lock:
+            pools, cls._pools = list(cls._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait = True, cancel_futures = True)
+
+    def get_page_batches(self, num_pages: int) -> list[list[int]]:
+        n_batches = min(num_pages, self.num_workers * BatchesPerWorker)
+        batch_size = -(-num_pages // n_batches) # ceil
+        return [list(range(start, min(start + batch_size, num_pages)))
+                    for start in range(0, num_pages, batch_size)]
+
+    def extract_pages(self, pdf_bytes: bytes|memoryview, reader: PdfReader|None = None) -> list[str]:
+        """Return the text of each page in the PDF.
+        Pass the reader if the caller has already parsed the document - it's used to get
+          the page count and for in-process extraction of small documents.
+        """
+        reader = reader or PdfReader(stream = pdf_bytes, strict = False)
+        num_pages = len(reader.pages)
+
+        if num_pages < MinPagesForProcessPool or self.num_workers < 2:
+            return self._extract_pages_in_process(reader, num_pages)
+
+        size = len(pdf_bytes)
+        if not self._reserve_shared_memory(size):
+            log_debug(f"PdfPageExtractor: no room for {size:,} bytes in shared memory - extracting in-process")
+            return self._extract_pages_in_process(reader, num_pages)
+        try:
+            return self._extract_pages_in_pool(pdf_bytes, num_pages)
+        except BrokenProcessPool as e:
+            # A worker died (OOM-killed, crashing pdf) - replace the pool for later documents
+            log_exception(f"PdfPageExtractor: process pool failed - extracting in-process: {e}")
+            self._discard_pool(self.num_workers)
+            return self._extract_pages_in_process(reader, num_pages)
+        except OSError as e:
+            # Couldn't create the shared memory segment
+            log_warning(f"PdfPageExtractor: can't share {size:,} bytes with the process pool - extracting in-process: {e}")
+            return self._extract_pages_in_process(reader, num_pages)
+        finally:
+            self._release_shared_memory(size)
+
+    def _extract_pages_in_process(self, reader: PdfReader, num_pages: int) -> list[str]:
+        log_debug(f"PdfPageExtractor: extracting {num_pages} pages in-process")
+        pages_text = [''] * num_pages
+        for i in range(num_pages):
+            pages_text[i] = extract_page_texts(reader, [i], self.extraction_mode)[0]
+            # Each page extract takes several hundred ms to several mins worst case -
+            #   yield CPU and GIL to any ready IO-bound threads such as incomming requests
+            sleep(0.0001)
+        return pages_text
+
+    def _extract_pages_in_pool(self, pdf_bytes: bytes|memoryview, num_pages: int) -> list[str]:
+        batches = self.get_page_batches(num_pages)
+        log_debug(f"PdfPageExtractor: extracting {num_pages} pages in {len(batches)} batches on {self.num_workers} processes")
+
+        size = len(pdf_bytes)
+        shm = shared_memory.SharedMemory(create = True, size = max(1, size))
+        try:
+            shm.buf[:size] = pdf_bytes
+            pool = self._get_pool(self.num_workers)
+            futures = [
+                pool.submit(extract_shared_pages_worker, shm.name, size, batch, self.extraction_mode)
+                for batch in batches
+            ]
+            pages_text = [''] * num_pages
+            for future in futures:
+                page_indices, texts = future.result()
+                for i, text in zip(page_indices, texts):
+                    pages_text[i] = text
+            return pages_text
+        finally:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,99 @@
+"""Worker-side code for PdfPageExtractor.
+
+This module is imported by the extraction worker processes, so keep the imports
+to the standard library and pypdf - importing the rest of shared/ would configure
+loggers, load the token encoder, etc. in every worker.
+"""
+import io
+from multiprocessing import shared_memory
+
+from pypdf import PdfReader
+
+
+class SharedMemoryStream(io.RawIOBase):
+    """Read-only seekable stream over a buffer, so the PdfReader can read the
+    shared PDF bytes in place rather than from a private copy."""
+
+    def __init__(self, buffer: memoryview, size: int) -> None:
+        super().__init__()
+        self._buf = buffer
+        self._size = size
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return self._pos
+
+    def readinto(self, b) -> int:
+        if self._pos >= self._size:
+            return 0
+        n = min(len(b), self._size - self._pos)
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        # Release our view so the shared memory segment can be closed
+        self._buf = None
+        super().close()
+
+
+def open_shared_pdf_stream(buffer: memoryview, size: int) -> io.BufferedReader:
+    # pypdf makes lots of 1-byte reads and short relative seeks - buffer them in C
+    return io.BufferedReader(SharedMemoryStream(buffer, size), buffer_size = 64*1024)
+
+
+def extract_page_texts(reader: PdfReader, page_indices: list[int], extraction_mode: str) -> list[str]:
+    """Extract the text of the given pages - shared by the worker and in-process paths
+    so that both produce identical text."""
+    texts = []
+    for i in page_indices:
+        text = reader.pages[i].extract_text(
+            extraction_mode = extraction_mode,
+            layout_mode_space_vertically = False,
+        )
+        texts.append(text)
+    return texts
+
+
+def extract_shared_pages_worker(
+        shm_name: str,
+        size: int,
+        page_indices: list[int],
+        extraction_mode: str) -> tuple[list[int], list[str]]:
+    """Process pool entry point: extract a batch of pages from the PDF in shared memory.
+    The segment is attached for the batch only - an idle worker keeps no document mapped,
+      so the parent's unlink frees the memory as soon as the document is done. Opening the
+      reader per batch costs a parse of the xref, small next to extracting the pages.
+    """
+    # The parent process owns and unlinks the segment. Workers share the parent's
+    #  resource tracker, so the registration made when attaching is a no-op.
+    shm = shared_memory.SharedMemory(name = shm_name)
+    try:
+        stream = open_shared_pdf_stream(shm.buf, size)
+        try:
+            reader = PdfReader(stream = stream, strict = False)
+            return page_indices, extract_page_texts(reader, page_indices, extraction_mode)
+        finally:
+            stream.close()
+    finally:
+        shm.close()
@@ -0,0 +1,142 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+from shared.OpenTelemetry import log_debug, log_warning
+
+# How long blocked threads wait before re-checking whether the pipeline was stopped
+_PollSeconds = 0.25
+
+
+class _EndOfStream:
+    pass
+
+_End = _EndOfStream()
+
+
+class PipelineStage:
+    """A step of a pipeline: fn is called for every item from the previous stage
+    on num_workers threads, and its result is passed to the next stage.
+    Results are in input order only when num_workers == 1.
+    """
+
+    def __init__(self,
+                 name: str,
+                 fn: Callable[[Any], Any],
+                 num_workers: int = 1,
+                 queue_size: int = 2) -> None:
+        if num_workers < 1:
+            raise ValueError(f"Pipeline stage '{name}': num_workers must be at least 1")
+        if queue_size < 1:
+            raise ValueError(f"Pipeline stage '{name}': queue_size must be at least 1")
+        self.name = name
+        self.fn = fn
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    """Run items from a source iterable through a chain of stages on background threads.
+    Each stage reads from a bounded queue, so a slow stage applies back-pressure to
+      everything upstream of it and the number of items in flight (and so peak memory)
+      is bounded by the queue sizes rather than by the size of the source.
+    The first exception raised by the source or any stage stops the pipeline and is
+      re-raised to the consumer.
+    """
+
+    def __init__(self, name: str, source: Iterable[Any], stages: list[PipelineStage]) -> None:
+        self.name = name
+        self.source = source
+        self.stages = stages
+        self._stop = threading.Event()
+        self._error: BaseException|None = None
+        self._error_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def _fail(self, stage_name: str, e: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                log_warning(f"Pipeline '{self.name}': stage '{stage_name}' failed: {e}")
+                self._error = e
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout = _PollSeconds)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout = _PollSeconds)
+            except queue.Empty:
+                pass
+        return _End
+
+    def _feed(self, q_out: queue.Queue) -> None:
+        try:
+            for item in self.source:
+                if not self._put(q_out, item):
+                    return
+            self._put(q_out, _End)
+        except BaseException as e: # pylint: disable=broad-exception-caught
+            self._fail("source", e)
+
+    def _work(self, stage: PipelineStage, q_in: queue.Queue, q_out: queue.Queue,
+              remaining_workers: list[int], lock: threading.Lock) -> None:
+        try:
+            while True:
+                item = self._get(q_in)
+                if item is _End:
+                    # Pass the end marker on to sibling workers - the last one out forwards it downstream
+                    self._put(q_in, _End)
+                    with lock:
+                        remaining_workers[0] -= 1
+                        last = remaining_workers[0] == 0
+                    if last:
+                        self._put(q_out, _End)
+                    return
+                if not self._put(q_out, stage.fn(item)):
+                    return
+        except BaseException as e: # pylint: disable=broad-exception-caught
+            self._fail(stage.name, e)
+
+    def _start_thread(self, name: str, target: Callable, *args) -> None:
+        thread = threading.Thread(target = target, name = f"{self.name}-{name}", args = args, daemon = True)
+        self._threads.append(thread)
+        thread.start()
+
+    def __iter__(self) -> Iterator[Any]:
+        queues = [queue.Queue(maxsize = stage.queue_size) for stage in self.stages]
+        q_results = queue.Queue(maxsize = 1)
+        self._start_thread("source", self._feed, queues[0] if queues else q_results)
+
+        for i, stage in enumerate(self.stages):
+            q_out = queues[i+1] if i+1 < len(queues) else q_results
+            remaining_workers, lock = [stage.num_workers], threading.Lock()
+            for w in range(stage.num_workers):
+                self._start_thread(f"{stage.name}-{w}", self._work, stage, queues[i], q_out, remaining_workers, lock)
+
+        try:
+            while True:
+                item = self._get(q_results)
+                if item is _End:
+                    break
+                yield item
+        finally:
+            # Stop any remaining threads if the consumer bails out early
+            self._stop.set()
+            for thread in self._threads:
+                thread.join()
+            log_debug(f"Pipeline '{self.name}' finished")
+
+        if self._error is not None:
+            raise self._error
+
+
+def run_pipeline(name: str, source: Iterable[Any], stages: list[PipelineStage]) -> Iterator[Any]:
+    return iter(Pipeline(name, source, stages))
@@ -0,0 +1,159 @@
+import datetime
+import sqlite3
+import threading
+from typing import Any, Dict, List
+
+import numpy as np
+
+from shared.indexing.RebuildJobs import get_default_rebuild_jobs_path
+from shared.OpenTelemetry import log_info, log_warning, MetricRebuildDocumentCost
+
+# Seconds to process a document before there's history to fit - only their ratios matter
+#  for the dispatch order, and they're replaced once CostModelMinSamples documents are timed
+DefaultSecondsOverhead = 1.0
+DefaultSecondsPerMB = 4.0
+DefaultSecondsPerPage = 0.1
+# Seconds for a document whose contents aren't needed (up to date, or metadata only)
+DefaultSecondsNoContents = 0.05
+
+# Timings needed to fit the model, and the most recent ones it's fitted to
+CostModelMinSamples = 10
+CostModelMaxSamples = 2000
+# Timings kept - the latest few of each document, from the last few months. A document's
+#  page count comes from its latest timing
+CostModelTimingsPerDocument = 3
+CostModelMaxTimingAgeDays = 90
+
+
+class RebuildCostModel:
+    """ Estimates the seconds to index each document, so a rebuild can start the longest
+    documents first - with the largest PDFs started last they set the total run time.
+    The cost is a linear fit of past timings: overhead + size + pages (when the page count
+      is known from an earlier run), refitted from the timings of each rebuild. Documents
+      whose contents aren't needed have their own (small) average cost.
+    Timings are kept with the rebuild jobs in SQLite, with the predicted time of each so
+      the accuracy of the model can be checked - pruned to the latest few of each document.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS document_timings (
+            blob_name TEXT, size INTEGER, pages INTEGER, needs_contents INTEGER,
+            predicted REAL, actual REAL, time TEXT)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_timings_time ON document_timings (time)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_timings_blob ON document_timings (blob_name, time)")
+        self._pages: Dict[str, int] = {}
+        # Coefficients of [1, MB, pages] and [1, MB]
+        self._pages_coef: np.ndarray|None = None
+        self._size_coef = np.array([DefaultSecondsOverhead, DefaultSecondsPerMB])
+        self._no_contents_seconds = DefaultSecondsNoContents
+        self.fit()
+
+    def prune(self) -> None:
+        """ Delete the timings no longer needed - all but the latest of each document, and old ones """
+        oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days = CostModelMaxTimingAgeDays)
+        with self._lock:
+            n_old = self._db.execute("DELETE FROM document_timings WHERE time < ?", (oldest.isoformat(),)).rowcount
+            n_superseded = self._db.execute(
+                "DELETE FROM document_timings WHERE rowid IN (SELECT rowid FROM ("
+                "SELECT rowid, ROW_NUMBER() OVER (PARTITION BY blob_name ORDER BY time DESC) AS n FROM document_timings"
+                ") WHERE n > ?)", (CostModelTimingsPerDocument,)).rowcount
+        if n_old or n_superseded:
+            log_info(f"RebuildCostModel: pruned {n_old} old and {n_superseded} superseded timings")
+
+    def fit(self) -> None:
+        try:
+            self.prune()
+        except sqlite3.Error as e:
+            log_warning(f"RebuildCostModel: failed to prune timings: {e}")
+        with self._lock:
+            rows = self._db.execute("SELECT size, pages, needs_contents, actual FROM document_timings "
+                                    "ORDER BY time DESC LIMIT ?", (CostModelMaxSamples,)).fetchall()
+            # Page counts of the documents, from their latest timing (SQLite takes the bare
+            #  column from the row of the MAX)
+            self._pages = {name: pages for name, pages, _ in self._db.execute(
+                "SELECT blob_name, pages, MAX(time) FROM document_timings WHERE pages IS NOT NULL "
+                "GROUP BY blob_name").fetchall()}
+
+        work = np.array([(size / 1e6, pages if pages is not None else np.nan, actual)
+                         for size, pages, needs_contents, actual in rows if needs_contents], dtype = float).reshape(-1, 3)
+        no_contents = [actual for _, _, needs_contents, actual in rows if not needs_contents]
+        if len(no_contents) >= CostModelMinSamples:
+            self._no_contents_seconds = float(np.mean(no_contents))
+
+        if len(work) >= CostModelMinSamples:
+            self._size_coef = self._fit(np.column_stack([np.ones(len(work)), work[:, 0]]), work[:, 2])
+        with_pages = work[~np.isnan(work[:, 1])]
+        if len(with_pages) >= CostModelMinSamples:
+            self._pages_coef = self._fit(np.column_stack([np.ones(len(with_pages)), with_pages[:, 0], with_pages[:, 1]]),
+                                         with_pages[:, 2])
+        log_info(f"RebuildCostModel: fitted to {len(work)} timings - seconds = {self._size_coef[0]:.2f} + "
+                 f"{self._size_coef[1]:.2f}/MB" +
+                 (f", with pages {self._pages_coef[0]:.2f} + {self._pages_coef[1]:.2f}/MB + {self._pages_coef[2]:.3f}/page"
+                    if self._pages_coef is not None else ""))
+
+    @staticmethod
+    def _fit(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """ Least squares fit with non-negative coefficients - a negative cost per unit is noise in
+        the timings, so its term is dropped and the rest refitted without it (rather than clamped,
+        which leaves the other terms fitted to compensate for it)
+        """
+        coef = np.zeros(x.shape[1])
+        terms = list(range(x.shape[1]))
+        while terms:
+            fitted, *_ = np.linalg.lstsq(x[:, terms], y, rcond = None)
+            if (fitted >= 0.0).all():
+                coef[terms] = fitted
+                break
+            terms.pop(int(np.argmin(fitted)))
+        return coef
+
+    def get_num_pages(self, blob_name: str) -> int|None:
+        return self._pages.get(blob_name)
+
+    def estimate(self, blob: Any, needs_contents: bool) -> float:
+        """ Predicted seconds to index the blob """
+        if not needs_contents:
+            return self._no_contents_seconds
+        mb = (blob.size or 0) / 1e6
+        pages = self._pages.get(blob.name)
+        if pages is not None and self._pages_coef is not None:
+            return float(self._pages_coef @ [1.0, mb, pages])
+        return float(self._size_coef @ [1.0, mb])
+
+    def record(self, blob: Any, pages: int|None, needs_contents: bool, predicted: float, actual: float) -> None:
+        MetricRebuildDocumentCost(int(predicted * 1000), int(actual * 1000), needs_contents)
+        try:
+            with self._lock:
+                self._db.execute("INSERT INTO document_timings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (blob.name, blob.size, pages, int(needs_contents), predicted, actual,
+                                  datetime.datetime.now(datetime.timezone.utc).isoformat()))
+        except sqlite3.Error as e:
+            log_warning(f"RebuildCostModel: failed to record timing of '{blob.name}': {e}")
+
+    @staticmethod
+    def log_accuracy(timings: List[tuple[float, float]]) -> None:
+        """ Compare the (predicted, actual) seconds of the documents of a rebuild """
+        if not timings:
+            return
+        predicted, actual = np.array(timings).T
+        log_info(f"RebuildCostModel: {len(timings)} documents, predicted {predicted.sum():.1f}s, "
+                 f"actual {actual.sum():.1f}s, mean abs error {np.mean(np.abs(predicted - actual)):.2f}s per document")
+
+
+_rebuild_cost_model: RebuildCostModel|None = None
+_rebuild_cost_model_lock = threading.Lock()
+
+def get_rebuild_cost_model() -> RebuildCostModel:
+    global _rebuild_cost_model
+    with _rebuild_cost_model_lock:
+        if _rebuild_cost_model is None:
+            try:
+                _rebuild_cost_model = RebuildCostModel(get_default_rebuild_jobs_path())
+            except sqlite3.Error as e:
+                log_warning(f"RebuildCostModel: can't open '{get_default_rebuild_jobs_path()}', using memory: {e}")
+                _rebuild_cost_model = RebuildCostModel(":memory:")
+        return _rebuild_cost_model
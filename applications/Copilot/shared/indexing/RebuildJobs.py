@@ -0,0 +1,292 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from shared.OpenTelemetry import log_info, log_warning
+
+JobStatus_Running = "running"
+JobStatus_Completed = "completed"
+JobStatus_Failed = "failed"
+JobStatus_Cancelling = "cancelling"
+JobStatus_Cancelled = "cancelled"
+# Running in the store but not in this process - e.g. the container restarted mid-rebuild
+JobStatus_Interrupted = "interrupted"
+
+BlobStatus_Pending = "pending"
+BlobStatus_Done = "done"
+BlobStatus_Failed = "failed"
+
+# Jobs that can be picked up again by a rebuild with the same parameters
+ResumableJobStatuses = (JobStatus_Interrupted, JobStatus_Cancelled, JobStatus_Failed)
+
+
+# SQLite db of the rebuild jobs' checkpoints, sync watermarks and document timings. It has to be
+#  on storage that outlives the container (a persistent volume) - the container's own filesystem
+#  is discarded by a restart, which is what the checkpoints are there to survive
+RebuildJobsDbPath = os.environ.get("COPILOT_REBUILD_JOBS_DB")
+
+
+def get_default_rebuild_jobs_path() -> str:
+    """ The jobs db path - in memory when COPILOT_REBUILD_JOBS_DB isn't set, as a db in the
+    container's filesystem would be lost with it and rebuilds can't resume anyway
+    """
+    return RebuildJobsDbPath or ":memory:"
+
+
+@dataclass
+class RebuildJobStatus:
+    job_id: str
+    index_name: str
+    status: str
+    created_time: str
+    updated_time: str
+    num_blobs: int
+    num_done: int
+    num_failed: int
+    num_remaining: int
+    eta_seconds: int|None
+    error: str|None
+
+
+class RebuildJob:
+    """ A rebuild of one index, with a checkpoint of every blob it has processed so a rebuild
+    that was interrupted (restart, crash, cancel) resumes from the blobs it didn't finish.
+    A blob's checkpoint holds its etag - a blob that changed since it was processed is redone.
+    Cancellation is cooperative: workers check is_cancelled() before starting each blob.
+    """
+
+    def __init__(self, store: "RebuildJobStore", job_id: str, index_name: str, params: Dict[str, Any]) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.index_name = index_name
+        self.params = params
+        self.resumed = False
+        self._cancel = threading.Event()
+        # For the ETA - only the blobs done by this process, as a resumed job's earlier
+        #  progress says nothing about how fast this run is going
+        self._start_time = time.time()
+        self._session_bytes = 0
+        self._lock = threading.Lock()
+
+    def set_blobs(self, blobs: List[Any]) -> List[Any]:
+        """ Record the job's blobs, and return the ones still to process """
+        done = self.store.get_done_blobs(self.job_id)
+        remaining = [b for b in blobs if done.get(b.name) != b.etag]
+        self.store.add_blobs(self.job_id, [(b.name, b.size, b.etag) for b in remaining])
+        if len(remaining) < len(blobs):
+            log_info(f"RebuildJob {self.job_id}: resuming with {len(blobs) - len(remaining)} of {len(blobs)} blobs already done")
+        return remaining
+
+    def mark_blob_done(self, blob: Any, duration: float) -> None:
+        with self._lock:
+            self._session_bytes += blob.size or 0
+        self.store.set_blob_status(self.job_id, blob.name, BlobStatus_Done, duration)
+
+    def mark_blob_failed(self, blob: Any, duration: float, error: str) -> None:
+        self.store.set_blob_status(self.job_id, blob.name, BlobStatus_Failed, duration, error)
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        self.store.set_job_status(self.job_id, JobStatus_Cancelling)
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def finish(self, error: str|None = None) -> None:
+        if error:
+            status = JobStatus_Failed
+        elif self.is_cancelled():
+            status = JobStatus_Cancelled
+        else:
+            status = JobStatus_Completed
+        self.store.set_job_status(self.job_id, status, error)
+
+    def get_eta_seconds(self, remaining_bytes: int) -> int|None:
+        with self._lock:
+            if not self._session_bytes:
+                return None
+            rate = self._session_bytes / max(time.time() - self._start_time, 0.001)
+        return int(remaining_bytes / rate)
+
+
+class RebuildJobStore:
+    """ Rebuild jobs and their per-blob checkpoints in a local SQLite db, and the jobs
+    running in this process. One rebuild runs at a time per process.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._running: RebuildJob|None = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        self._db = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, index_name TEXT, params TEXT, status TEXT,
+            created_time TEXT, updated_time TEXT, error TEXT)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS sync_watermarks (
+            index_name TEXT, container TEXT, watermark TEXT, updated_time TEXT,
+            PRIMARY KEY (index_name, container))""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS job_blobs (
+            job_id TEXT, blob_name TEXT, size INTEGER, etag TEXT, status TEXT,
+            duration REAL, error TEXT, PRIMARY KEY (job_id, blob_name))""")
+        # No job survives its process, so what was running when the last one exited was interrupted
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ? WHERE status IN (?, ?)",
+                             (JobStatus_Interrupted, JobStatus_Running, JobStatus_Cancelling))
+        log_info(f"RebuildJobStore: opened '{path}'")
+
+    def is_persistent(self) -> bool:
+        """ Whether the jobs, watermarks and timings outlive the process """
+        return self.path != ":memory:"
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def get_running_job(self) -> RebuildJob|None:
+        return self._running
+
+    def start_job(self, index_name: str, params: Dict[str, Any], resume: bool = True) -> RebuildJob|None:
+        """ Start a job - resuming the latest unfinished job of the index with the same params
+        if there is one and resume is set. None if a rebuild is already running.
+        """
+        params_json = json.dumps(params, sort_keys = True, default = str)
+        with self._lock:
+            if self._running is not None:
+                return None
+            row = None
+            if resume:
+                row = self._db.execute(
+                    f"SELECT job_id FROM jobs WHERE index_name = ? AND params = ? AND status IN ({','.join('?' * len(ResumableJobStatuses))}) "
+                    "ORDER BY created_time DESC LIMIT 1",
+                    (index_name, params_json, *ResumableJobStatuses)).fetchone()
+            if row:
+                job = RebuildJob(self, row[0], index_name, params)
+                job.resumed = True
+                self._db.execute("UPDATE jobs SET status = ?, updated_time = ?, error = NULL WHERE job_id = ?",
+                                 (JobStatus_Running, self._now(), job.job_id))
+                log_info(f"RebuildJobStore: resuming job {job.job_id} of index '{index_name}'")
+            else:
+                job = RebuildJob(self, f"RebuildIndex-{uuid.uuid4().hex[:12]}", index_name, params)
+                now = self._now()
+                self._db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                                 (job.job_id, index_name, params_json, JobStatus_Running, now, now))
+                log_info(f"RebuildJobStore: started job {job.job_id} of index '{index_name}'")
+            self._running = job
+            return job
+
+    def end_job(self, job: RebuildJob, error: str|None = None) -> None:
+        job.finish(error)
+        with self._lock:
+            if self._running is job:
+                self._running = None
+
+    def cancel_job(self, job_id: str|None) -> bool:
+        """ Cancel the running job (if it has the given id) - True if there was one to cancel """
+        job = self._running
+        if job is None or (job_id and job.job_id != job_id):
+            return False
+        log_info(f"RebuildJobStore: cancelling job {job.job_id}")
+        job.cancel()
+        return True
+
+    def get_done_blobs(self, job_id: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute("SELECT blob_name, etag FROM job_blobs WHERE job_id = ? AND status = ?",
+                                    (job_id, BlobStatus_Done)).fetchall()
+        return dict(rows)
+
+    def add_blobs(self, job_id: str, blobs: List[tuple]) -> None:
+        """ Replace the job's blobs still to do - failed blobs of a resumed job are retried """
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM job_blobs WHERE job_id = ? AND status != ?", (job_id, BlobStatus_Done))
+            self._db.executemany("INSERT OR REPLACE INTO job_blobs VALUES (?, ?, ?, ?, ?, NULL, NULL)",
+                                 [(job_id, name, size, etag, BlobStatus_Pending) for name, size, etag in blobs])
+            self._db.execute("COMMIT")
+
+    def set_blob_status(self, job_id: str, blob_name: str, status: str, duration: float, error: str|None = None) -> None:
+        with self._lock:
+            self._db.execute("UPDATE job_blobs SET status = ?, duration = ?, error = ? WHERE job_id = ? AND blob_name = ?",
+                             (status, duration, error, job_id, blob_name))
+            self._db.execute("UPDATE jobs SET updated_time = ? WHERE job_id = ?", (self._now(), job_id))
+
+    def set_job_status(self, job_id: str, status: str, error: str|None = None) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, updated_time = ?, error = ? WHERE job_id = ?",
+                             (status, self._now(), error, job_id))
+
+    def get_sync_watermark(self, index_name: str, container: str) -> datetime.datetime|None:
+        """ The last_modified time up to which every blob of the container is in the index """
+        with self._lock:
+            row = self._db.execute("SELECT watermark FROM sync_watermarks WHERE index_name = ? AND container = ?",
+                                   (index_name, container)).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row else None
+
+    def set_sync_watermark(self, index_name: str, container: str, watermark: datetime.datetime) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sync_watermarks VALUES (?, ?, ?, ?)",
+                             (index_name, container, watermark.isoformat(), self._now()))
+        log_info(f"RebuildJobStore: sync watermark of index '{index_name}' is now {watermark.isoformat()}")
+
+    def get_job_status(self, job_id: str|None = None) -> RebuildJobStatus|None:
+        """ The status of a job - the latest one if no job_id """
+        with self._lock:
+            if job_id:
+                job_row = self._db.execute("SELECT job_id, index_name, status, created_time, updated_time, error "
+                                           "FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            else:
+                job_row = self._db.execute("SELECT job_id, index_name, status, created_time, updated_time, error "
+                                           "FROM jobs ORDER BY created_time DESC LIMIT 1").fetchone()
+            if job_row is None:
+                return None
+            counts = {status: (n, size) for status, n, size in self._db.execute(
+                "SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM job_blobs WHERE job_id = ? GROUP BY status",
+                (job_row[0],)).fetchall()}
+
+        num_done, _ = counts.get(BlobStatus_Done, (0, 0))
+        num_failed, _ = counts.get(BlobStatus_Failed, (0, 0))
+        num_remaining, remaining_bytes = counts.get(BlobStatus_Pending, (0, 0))
+        running = self._running
+        eta = running.get_eta_seconds(remaining_bytes) \
+                if running is not None and running.job_id == job_row[0] else None
+        return RebuildJobStatus(
+            job_id = job_row[0],
+            index_name = job_row[1],
+            status = job_row[2],
+            created_time = job_row[3],
+            updated_time = job_row[4],
+            num_blobs = num_done + num_failed + num_remaining,
+            num_done = num_done,
+            num_failed = num_failed,
+            num_remaining = num_remaining,
+            eta_seconds = eta,
+            error = job_row[5],
+        )
+
+
+_rebuild_job_store: RebuildJobStore|None = None
+_rebuild_job_store_lock = threading.Lock()
+
+def get_rebuild_job_store() -> RebuildJobStore:
+    global _rebuild_job_store
+    with _rebuild_job_store_lock:
+        if _rebuild_job_store is None:
+            if not RebuildJobsDbPath:
+                log_warning("RebuildJobStore: COPILOT_REBUILD_JOBS_DB isn't set, rebuilds aren't checkpointed - "
+                            "set it to a path on a persistent volume to resume rebuilds and keep the incremental "
+                            "sync watermark after a restart")
+            try:
+                _rebuild_job_store = RebuildJobStore(get_default_rebuild_jobs_path())
+            except sqlite3.Error as e:
+                # Still track the running job - just nothing survives a restart
+                log_warning(f"RebuildJobStore: can't open '{get_default_rebuild_jobs_path()}', using memory: {e}")
+                _rebuild_job_store = RebuildJobStore(":memory:")
+        return _rebuild_job_store
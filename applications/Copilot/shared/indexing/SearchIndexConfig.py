@@ -24,6 +24,7 @@ FieldName_Uri = "Uri"
 FieldName_IndexUpdateTime = "IndexUpdateTime"
 FieldName_DocLastUpdateTime = "DocLastUpdateTime"
 FieldName_PageNumber = "PageNumber"
+FieldName_LastPageNumber = "LastPageNumber"
 FieldName_ParsePath = "ParsePath"
 FieldName_Vector = "ContentVector"
 FieldName_RequestChunkSize = "RequestedChunkSize"
@@ -35,6 +36,9 @@ FieldName_ContentTokenCount = "ContentTokenCount"
 FieldName_IndexerSource = "IndexerSource"
 FieldName_ProcessingParameters = "ProcessingParameters"
 FieldName_FilterTags = "FilterTags"
+FieldName_ContentHash = "ContentHash"
+FieldName_PageContentHash = "PageContentHash"
+FieldName_ChunkIndex = "ChunkIndex"
 
 IndexFields = [
 
@@ -53,6 +57,8 @@ IndexFields = [
         key = True,
         searchable = False,
         filterable = True,
+        # with IndexUpdateTime, the order for keyset pagination
+        sortable = True,
     ),
     SimpleField(
         name = FieldName_GroupId,
@@ -82,6 +88,7 @@ IndexFields = [
         type = SearchFieldDataType.DateTimeOffset,
         searchable = False,
         filterable = True,
+        sortable = True,
     ),
     SimpleField(
         name = FieldName_DocLastUpdateTime,
@@ -94,6 +101,12 @@ IndexFields = [
         type = SearchFieldDataType.Int32,
         searchable = False,
     ),
+    SimpleField(
+        # Chunks can span pages - PageNumber is the first page, this is the last
+        name = FieldName_LastPageNumber,
+        type = SearchFieldDataType.Int32,
+        searchable = False,
+    ),
     SimpleField(
         name = FieldName_ParsePath,
         type = SearchFieldDataType.String,
@@ -156,6 +169,25 @@ IndexFields = [
         searchable = False,
         filterable = True,
     ),
+    SimpleField(
+        # Hash of Content - chunks with unchanged content keep their vectors on reindex
+        name = FieldName_ContentHash,
+        type = SearchFieldDataType.String,
+        searchable = False,
+    ),
+    SimpleField(
+        # Hash of the extracted text of the pages the chunk covers
+        name = FieldName_PageContentHash,
+        type = SearchFieldDataType.String,
+        searchable = False,
+    ),
+    SimpleField(
+        # Position of a docChunk in its document (the n of its Id) - null for other item types
+        name = FieldName_ChunkIndex,
+        type = SearchFieldDataType.Int32,
+        searchable = False,
+        filterable = True,
+    ),
 ]
 
 
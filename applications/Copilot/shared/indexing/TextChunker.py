@@ -1,11 +1,13 @@
 
-from calendar import c
 import re
+from array import array
+from bisect import bisect_right
+from typing import Iterator, Optional
 from dataclasses_json import dataclass_json
 from marshmallow_dataclass import dataclass
 
 from shared.OpenTelemetry import log_error, log_exception, log_info, log_debug
-from shared.indexing.BlobOps import BlobOps
+from shared.TokenCounter import get_token_encoding
 
 """
     from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -22,14 +24,45 @@ from shared.indexing.BlobOps import BlobOps
 class TextChunk:
     Content: str
     Page: int
+    # Page of the last character of the chunk - only filled in by OffsetTextChunker
+    LastPage: Optional[int] = None
+    # Exact token count - only filled in by TokenTextChunker
+    TokenCount: Optional[int] = None
 
 # TODO:
-# collect multiple page refs if chunk spans multiple pages
 # Line# for txt files?
 # use recursive character splitter internally?
 # Can use nltk to remove stop words
 
+def trim_span_text(page_num, text: str, remove_extra_whitespace: bool) -> str:
+    if not text: return ""
+
+    if remove_extra_whitespace:
+        # Remove extra spaces, but keep \n's and \t's
+        # PDF chunks are about 50% whitespace - this gives better utilization of 
+        #  chunks, but it's possible that this could change the interpretation of text by the LLM
+        trimmed_text = re.sub("[ ][ ]+" , " ", text)
+        if len(text) != len(trimmed_text):
+            diff = len(text) - len(trimmed_text)
+            percent = int(diff * 100 / len(text))
+            log_debug(f"TextChunker trimmed {diff} characters ({percent}%) from page {page_num}")
+    else:
+        trimmed_text = text
+
+    return trimmed_text
+
+
+def validate_chunk_params(chunk_size: int, chunk_overlap: int) -> None:
+    if not chunk_size or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    if not chunk_overlap or chunk_overlap < 1 or chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap must be a positive integer less than chunk_size")
+
+
 class TextChunker:
+    """Original span-list chunker - see OffsetTextChunker for the version used for indexing.
+    Kept as the reference implementation that OffsetTextChunker must match.
+    """
 
     def __init__(self, chunk_size: int, overlap: int, remove_extra_whitespace = True) -> None:
         self.spans = []
@@ -38,21 +71,8 @@ class TextChunker:
         self.remove_extra_whitespace = remove_extra_whitespace
 
     def add_text(self, page_num, text) -> None:
-        if not text: return
-
-        if self.remove_extra_whitespace:
-            # Remove extra spaces, but keep \n's and \t's
-            # PDF chunks are about 50% whitespace - this gives better utilization of 
-            #  chunks, but it's possible that this could change the interpretation of text by the LLM
-            trimmed_text = re.sub("[ ][ ]+" , " ", text)
-            if len(text) != len(trimmed_text):
-                diff = len(text) - len(trimmed_text)
-                percent = int(diff * 100 / len(text))
-                log_debug(f"TextChunker trimmed {diff} characters ({percent}%) from page {page_num}")
-        else:
-            trimmed_text = text
-
-        if len(trimmed_text) < 1:
+        trimmed_text = trim_span_text(page_num, text, self.remove_extra_whitespace)
+        if not trimmed_text:
             return
 
         self.spans.append((page_num, trimmed_text))
@@ -76,11 +96,7 @@ class TextChunker:
         page_num = None
         chunk_size = chunk_size or self.chunk_size
         chunk_overlap = chunk_overlap or self.overlap
-
-        if not chunk_size or chunk_size < 1:
-            raise ValueError("chunk_size must be a positive integer")
-        if not chunk_overlap or chunk_overlap < 1 or chunk_overlap >= chunk_size:
-            raise ValueError("chunk_overlap must be a positive integer less than chunk_size")
+        validate_chunk_params(chunk_size, chunk_overlap)
 
         while len(chunk_text) < chunk_size and len(self.spans) > 0:
 
@@ -110,6 +126,245 @@ class TextChunker:
         return TextChunk(chunk_text, page_num)
         
 
+class OffsetTextChunker:
+    """Chunker producing exactly the same chunks as TextChunker in linear time.
+
+    The span texts are joined into one buffer and chunks are cut with a cursor into it
+      rather than by popping, re-inserting and re-slicing spans. A chunk starting at
+      offset c ends at the first span end past c + chunk_size - overlap (clipped to
+      c + chunk_size), and the next chunk starts at c + chunk_size - overlap. The span
+      (and so page) a cursor position falls in is found with a bisect over the span start
+      offsets, and the span a chunk ends in with a bisect over the span end offsets - 
+      these give the first and last page the chunk covers.
+    """
+
+    def __init__(self, chunk_size: int, overlap: int, remove_extra_whitespace = True) -> None:
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.remove_extra_whitespace = remove_extra_whitespace
+        self._span_texts: list[str] = []
+        self._span_pages: list[int] = []
+        self._span_starts: list[int] = []
+        self._span_ends: list[int] = []
+        self._length = 0
+        self._buffer: str|None = None
+        self._cursor = 0
+
+    def add_text(self, page_num, text) -> None:
+        trimmed_text = trim_span_text(page_num, text, self.remove_extra_whitespace)
+        if not trimmed_text:
+            return
+
+        self._span_texts.append(trimmed_text)
+        self._span_pages.append(page_num)
+        self._span_starts.append(self._length)
+        self._length += len(trimmed_text)
+        self._span_ends.append(self._length)
+        self._buffer = None
+
+    def _get_buffer(self) -> str:
+        if self._buffer is None:
+            self._buffer = ''.join(self._span_texts)
+        return self._buffer
+
+    def __iter__(self) -> Iterator[TextChunk]:
+        return self._iter_chunks()
+
+    def _cut_chunk(self, start: int, chunk_size: int, chunk_overlap: int, first_span: int) -> tuple[int, int, int]:
+        """Return (end, next_start, last_span) for the chunk starting at start.
+        A chunk ends in the first span that ends past where the next chunk starts.
+        """
+        next_start = start + chunk_size - chunk_overlap
+        i_span = bisect_right(self._span_ends, next_start, lo = first_span)
+        if i_span < len(self._span_ends):
+            return min(self._span_ends[i_span], start + chunk_size), next_start, i_span
+        # All the remaining text fits in this chunk
+        return self._length, self._length, len(self._span_ends) - 1
+
+    def _iter_chunks(self) -> Iterator[TextChunk]:
+        if self._cursor >= self._length:
+            return
+        validate_chunk_params(self.chunk_size, self.overlap)
+        buffer = self._get_buffer()
+        pages = self._span_pages
+        span_ends = self._span_ends
+        first_span = bisect_right(self._span_starts, self._cursor) - 1
+
+        while self._cursor < self._length:
+            start = self._cursor
+            # The cursor only moves forward - step on to the span containing it
+            while span_ends[first_span] <= start:
+                first_span += 1
+            end, self._cursor, last_span = self._cut_chunk(start, self.chunk_size, self.overlap, first_span)
+            yield TextChunk(buffer[start:end], pages[first_span], pages[last_span])
+
+        log_debug(f"Returning chunk of {end - start} characters from page {pages[first_span]}")
+
+    def get_next_chunk(self, chunk_size: int = None, chunk_overlap:int = None) -> None | TextChunk:
+
+        if self._cursor >= self._length:
+            return None
+
+        chunk_size = chunk_size or self.chunk_size
+        chunk_overlap = chunk_overlap or self.overlap
+        validate_chunk_params(chunk_size, chunk_overlap)
+
+        start = self._cursor
+        first_span = bisect_right(self._span_starts, start) - 1
+        end, self._cursor, last_span = self._cut_chunk(start, chunk_size, chunk_overlap, first_span)
+        return TextChunk(self._get_buffer()[start:end], self._span_pages[first_span], self._span_pages[last_span])
+
+class TokenTextChunker(OffsetTextChunker):
+    """Chunker that cuts chunks and overlaps by token count rather than character count.
+
+    The whole text is encoded once, and decode_with_offsets maps each token back to its
+      character offset in the text, so chunk text is a slice of the buffer and the chunk's
+      TokenCount comes straight from its token slice - the chunks never need re-encoding.
+    A token can hold part of a multi-byte character, so chunks are only cut before a token
+      that starts a character - a chunk's text is exactly its tokens, and TokenCount exact.
+    Chunks ignore page boundaries, as for chunk_pages_simple_text_overlap.
+    """
+
+    def __init__(self, chunk_size: int, overlap: int, remove_extra_whitespace = True, encoding = None) -> None:
+        super().__init__(chunk_size, overlap, remove_extra_whitespace = remove_extra_whitespace)
+        self.encoding = encoding or get_token_encoding()
+        self._tokens: array|None = None
+        self._token_offsets: array|None = None
+        self._token_cursor = 0
+
+    def _get_token_offsets(self) -> array:
+        if self._token_offsets is None or self._buffer is None:
+            tokens = self.encoding.encode_ordinary(self._get_buffer())
+            # Offsets are in the decoded text - identical to the buffer for any valid str
+            self._buffer, offsets = self.encoding.decode_with_offsets(tokens)
+            self._tokens = array('q', tokens)
+            self._token_offsets = array('q', offsets)
+            log_debug(f"TokenTextChunker encoded {self._length} characters to {len(tokens)} tokens")
+        return self._token_offsets
+
+    def _starts_character(self, token: int) -> bool:
+        """Whether the token at this index starts a character, rather than continuing one split by the previous token"""
+        if token <= 0 or token >= len(self._tokens):
+            return True
+        first_byte = self.encoding.decode_single_token_bytes(self._tokens[token])[0]
+        return not 0x80 <= first_byte < 0xC0
+
+    def _get_chunk_tokens(self, start_token: int, chunk_size: int, chunk_overlap: int) -> tuple[int, int]:
+        """End token of the chunk starting at start_token, and the start token of the next chunk"""
+        n_tokens = len(self._token_offsets)
+        end_token = min(start_token + chunk_size, n_tokens)
+        while end_token > start_token + 1 and not self._starts_character(end_token):
+            end_token -= 1
+        # Only a character of more tokens than the chunk size makes it longer
+        while not self._starts_character(end_token):
+            end_token += 1
+        if end_token >= n_tokens:
+            return n_tokens, n_tokens
+        next_token = end_token - chunk_overlap
+        while not self._starts_character(next_token):
+            next_token -= 1
+        # Always move forward, however the cuts were moved
+        if next_token <= start_token:
+            next_token = start_token + 1
+            while not self._starts_character(next_token):
+                next_token += 1
+        return end_token, next_token
+
+    def _iter_chunks(self) -> Iterator[TextChunk]:
+        while (chunk := self.get_next_chunk()) is not None:
+            yield chunk
+
+    def count_chunks(self) -> int:
+        """Number of chunks still to come - from the token offsets, without cutting them"""
+        if self._length == 0:
+            return 0
+        validate_chunk_params(self.chunk_size, self.overlap)
+        n_tokens = len(self._get_token_offsets())
+        n_chunks = 0
+        token = self._token_cursor
+        while token < n_tokens:
+            _, token = self._get_chunk_tokens(token, self.chunk_size, self.overlap)
+            n_chunks += 1
+        return n_chunks
+
+    def get_next_chunk(self, chunk_size: int = None, chunk_overlap:int = None) -> None | TextChunk:
+
+        if self._length == 0:
+            return None
+        offsets = self._get_token_offsets()
+        n_tokens = len(offsets)
+        if self._token_cursor >= n_tokens:
+            return None
+
+        chunk_size = chunk_size or self.chunk_size
+        chunk_overlap = chunk_overlap or self.overlap
+        validate_chunk_params(chunk_size, chunk_overlap)
+
+        start_token = self._token_cursor
+        end_token, self._token_cursor = self._get_chunk_tokens(start_token, chunk_size, chunk_overlap)
+
+        start = offsets[start_token]
+        end = offsets[end_token] if end_token < n_tokens else len(self._buffer)
+        first_span = bisect_right(self._span_starts, start) - 1
+        last_span = bisect_right(self._span_starts, max(start, end - 1)) - 1
+        return TextChunk(
+            self._buffer[start:end], 
+            self._span_pages[first_span], 
+            self._span_pages[last_span],
+            TokenCount = end_token - start_token)
+
+
+def chunk_pages_simple_text_overlap(
+        pages: list[str],
+        chunk_size: int,
+        chunk_overlap: int,
+        remove_extra_whitespace = True,
+        chunker_class = OffsetTextChunker) -> Iterator[TextChunk]:
+    """Overlapping chunks across all pages with no regard to page boundaries - pages are numbered from 1."""
+    text_chunker = chunker_class(chunk_size, chunk_overlap, remove_extra_whitespace = remove_extra_whitespace)
+    for i, text in enumerate(pages):
+        text_chunker.add_text(i+1, text)
+    yield from text_chunker # custom iterator calls get_next_chunk() until spans exhausted
+
+
+def chunk_pages_page_with_overlap(
+        pages: list[str],
+        chunk_size: int,
+        chunk_overlap: int,
+        remove_extra_whitespace = True,
+        chunker_class = OffsetTextChunker) -> Iterator[TextChunk]:
+    """Chunks covering exactly one page each, with overlap/2 context from the previous
+    and next pages - pages are numbered from 0."""
+    for i, cur_page_text in enumerate(pages):
+        text_chunker = chunker_class(chunk_size, chunk_overlap, remove_extra_whitespace = remove_extra_whitespace)
+        if i > 0:
+            prev_page_text = pages[i-1][-chunk_overlap//2:] 
+            text_chunker.add_text(i-1, prev_page_text)
+
+        text_chunker.add_text(i, cur_page_text)
+
+        if i < len(pages)-1:
+            next_page_text = pages[i+1][:chunk_overlap//2]
+            text_chunker.add_text(i+1, next_page_text)
+
+        yield from text_chunker
+
+
+def chunk_pages_token_overlap(
+        pages: list[str],
+        chunk_size: int,
+        chunk_overlap: int,
+        remove_extra_whitespace = True,
+        encoding = None) -> TokenTextChunker:
+    """Overlapping chunks of chunk_size tokens across all pages - pages are numbered from 1.
+    Returns the chunker, which can also count the chunks before they are iterated.
+    """
+    text_chunker = TokenTextChunker(chunk_size, chunk_overlap, remove_extra_whitespace = remove_extra_whitespace, encoding = encoding)
+    for i, text in enumerate(pages):
+        text_chunker.add_text(i+1, text)
+    return text_chunker
+
+
 class TestTextChunker:
 
     def __init__(self) -> None:
@@ -183,6 +438,7 @@ if __name__ == '__main__':
     from pathlib import Path
     import os
     from shared.indexing.Indexer import PyPdfIndexProcessor
+    from shared.indexing.BlobOps import BlobOps
 
     if False:
         t = TestTextChunker()
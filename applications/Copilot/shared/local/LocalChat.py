@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from shared.TokenCounter import get_num_tokens
+
+# Simulated service latency - time to the first token, then time per output token
+LocalChatLatencyMs = float(os.environ.get("COPILOT_LOCAL_CHAT_LATENCY_MS") or 0)
+LocalChatMsPerToken = float(os.environ.get("COPILOT_LOCAL_CHAT_MS_PER_TOKEN") or 0)
+# A json list of response strings, used in turn
+LocalChatResponsesFile = os.environ.get("COPILOT_LOCAL_CHAT_RESPONSES_FILE")
+
+_call_count_lock = threading.Lock()
+
+
+def load_local_chat_responses(path: Optional[str] = LocalChatResponsesFile) -> List[str]:
+    if not path:
+        return []
+    with open(path, encoding = 'utf-8') as f:
+        responses = json.load(f)
+    if not isinstance(responses, list) or not all(isinstance(r, str) for r in responses):
+        raise ValueError(f"{path} must be a json list of strings")
+    return responses
+
+
+class ScriptedChatModel(BaseChatModel):
+    """ A chat model that needs no service - answers with the scripted responses in turn (or,
+    without a script, a short reply naming the last message) after the configured latency.
+    Token usage is reported like AzureChatOpenAI, counted with the copilot's token counter.
+    """
+
+    model_name: str = "local-chat"
+    responses: List[str] = []
+    latency_ms: float = LocalChatLatencyMs
+    ms_per_token: float = LocalChatMsPerToken
+    temperature: float = 0.0
+    call_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-scripted-chat"
+
+    def _get_response(self, messages: List[BaseMessage]) -> str:
+        with _call_count_lock:
+            i = self.call_count
+            self.call_count += 1
+        if self.responses:
+            return self.responses[i % len(self.responses)]
+        last = messages[-1].content if messages else ""
+        return f"Local response {i + 1} to: {str(last)[:200]}"
+
+    def _get_llm_output(self, messages: List[BaseMessage], response: str) -> Dict[str, Any]:
+        prompt_tokens = sum(get_num_tokens(str(m.content)) for m in messages)
+        completion_tokens = get_num_tokens(response)
+        return {
+            "token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "model_name": self.model_name,
+        }
+
+    def _generate(self,
+                  messages: List[BaseMessage],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any) -> ChatResult:
+        response = self._get_response(messages)
+        time.sleep((self.latency_ms + self.ms_per_token * get_num_tokens(response)) / 1000)
+        return ChatResult(generations = [ChatGeneration(message = AIMessage(content = response))],
+                          llm_output = self._get_llm_output(messages, response))
+
+    def _stream(self,
+                messages: List[BaseMessage],
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        response = self._get_response(messages)
+        time.sleep(self.latency_ms / 1000)
+        words = response.split(" ")
+        for i, word in enumerate(words):
+            text = word if i == len(words) - 1 else word + " "
+            time.sleep(self.ms_per_token * get_num_tokens(text) / 1000)
+            chunk = ChatGenerationChunk(message = AIMessageChunk(content = text))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk = chunk)
+            yield chunk
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        token_usage: Dict[str, int] = {}
+        for output in llm_outputs:
+            for name, n in ((output or {}).get("token_usage") or {}).items():
+                token_usage[name] = token_usage.get(name, 0) + n
+        return {"token_usage": token_usage, "model_name": self.model_name}
+
+    def get_num_tokens(self, text: str) -> int:
+        return get_num_tokens(text)
+
+
+def create_local_chat_model(deployment_name: str) -> ScriptedChatModel:
+    return ScriptedChatModel(model_name = deployment_name, responses = load_local_chat_responses())
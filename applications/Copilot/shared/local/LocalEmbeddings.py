@@ -0,0 +1,55 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Must match vector_search_dimensions of the index ContentVector field
+LocalEmbeddingDimensions = int(os.environ.get("COPILOT_LOCAL_EMBEDDING_DIMS") or 1536)
+
+_TermRegex = re.compile(r"\w+", re.UNICODE)
+
+
+def get_text_terms(text: str) -> List[str]:
+    """ Lower-cased words of text - the terms of the local keyword search and hash embeddings """
+    return _TermRegex.findall(text.lower()) if text else []
+
+
+@lru_cache(maxsize = 100_000)
+def _get_term_bucket(term: str, dims: int) -> tuple[int, float]:
+    # Stable across processes, unlike hash()
+    h = int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size = 8).digest(), 'little')
+    return h % dims, (1.0 if (h >> 63) & 1 else -1.0)
+
+
+class HashEmbeddings(Embeddings):
+    """ Deterministic embeddings that need no service - each word and pair of adjacent words of
+    a text is hashed to a signed dimension (the hashing trick) and the vector is L2-normalized.
+    Texts sharing words get similar vectors, so vector and hybrid search still rank sensibly
+      when benchmarking or load testing offline.
+    """
+
+    def __init__(self, dims: int = LocalEmbeddingDimensions) -> None:
+        self.dims = dims
+
+    def embed_text(self, text: str) -> np.ndarray:
+        terms = get_text_terms(text)
+        features = terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]
+        vector = np.zeros(self.dims, dtype = np.float32)
+        if not features:
+            return vector
+        buckets = [_get_term_bucket(f, self.dims) for f in features]
+        np.add.at(vector, np.fromiter((b[0] for b in buckets), dtype = np.int64, count = len(buckets)),
+                  np.fromiter((b[1] for b in buckets), dtype = np.float32, count = len(buckets)))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    # chunk_size is accepted for compatibility with AzureOpenAIEmbeddings - there are no requests to batch
+    def embed_documents(self, texts: List[str], chunk_size: int|None = None) -> List[List[float]]:
+        return [self.embed_text(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_text(text).tolist()
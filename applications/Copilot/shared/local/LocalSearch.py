@@ -0,0 +1,537 @@
+import copy
+import math
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.search.documents.indexes.models import SearchIndex, SearchFieldDataType
+from azure.search.documents.models import IndexingResult, VectorizedQuery
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from shared.local.LocalEmbeddings import get_text_terms
+from shared.local.ODataFilter import compile_filter, get_canonical_time
+from shared.OpenTelemetry import log_info
+
+LocalSearchEndpoint = "https://local.search.windows.net"
+
+# Reciprocal rank fusion constant the service uses to combine keyword and vector rankings
+HybridRrfK = 60
+# BM25 parameters - the service defaults
+Bm25K1 = 1.2
+Bm25B = 0.75
+
+_ScoreField = "@search.score"
+
+# The service's limit on the size of an index request
+LocalMaxIndexRequestBytes = 16 * 1024 * 1024
+
+
+def _get_indexing_result(key: str, succeeded: bool, status_code: int, error_message: str = None) -> IndexingResult:
+    # The result fields are read-only - only set when deserialized, as from a service response
+    return IndexingResult.deserialize({"key": key, "status": succeeded, "statusCode": status_code, "errorMessage": error_message})
+
+
+class LocalSearchIndex:
+    """ An in-memory search index with the document semantics of Azure AI Search:
+    upload/merge/mergeOrUpload/delete actions, OData filters, order by, skip/top and select,
+      BM25 keyword search over the searchable fields, exact (brute force) kNN over the vector
+      fields with cosine similarity and hybrid search ranked by reciprocal rank fusion.
+    Each vector field is one float32 matrix, so a query is one matrix-vector product.
+    """
+
+    def __init__(self, index: SearchIndex) -> None:
+        self._lock = threading.RLock()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._rows: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._num_rows = 0
+        self._vectors: Dict[str, np.ndarray] = {}
+        # Keyword index - term -> {key: term frequency}, and number of terms of each doc
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, int] = {}
+        self.set_schema(index)
+
+    def set_schema(self, index: SearchIndex) -> None:
+        with self._lock:
+            self.index = index
+            self.key_field = next(f.name for f in index.fields if f.key)
+            self.field_names = [f.name for f in index.fields]
+            self.datetime_fields = set(f.name for f in index.fields if f.type == SearchFieldDataType.DateTimeOffset)
+            self.searchable_fields = [f.name for f in index.fields
+                                      if f.searchable and not f.vector_search_dimensions]
+            self.vector_dims = {f.name: f.vector_search_dimensions for f in index.fields if f.vector_search_dimensions}
+            for name, dims in self.vector_dims.items():
+                if name not in self._vectors:
+                    self._vectors[name] = np.zeros((max(self._num_rows, 1024), dims), dtype = np.float32)
+
+    def count(self) -> int:
+        return len(self.docs)
+
+    def get(self, key: str, selected_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        with self._lock:
+            if key not in self.docs:
+                raise ResourceNotFoundError(message = f"Document '{key}' not found")
+            return self._get_result(key, selected_fields)
+
+    def index_actions(self, actions: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        results = []
+        with self._lock:
+            for action in actions:
+                doc = dict(action)
+                action_type = doc.pop("@search.action", "upload")
+                key = doc.get(self.key_field)
+                if action_type == "delete":
+                    self._remove(key)
+                elif action_type == "merge" and key not in self.docs:
+                    results.append(_get_indexing_result(key, False, 404, "Document not found."))
+                    continue
+                elif action_type in ("merge", "mergeOrUpload") and key in self.docs:
+                    self._put(key, {**self._get_result(key, None, with_score = False), **doc})
+                elif action_type in ("upload", "mergeOrUpload"):
+                    self._put(key, doc)
+                else:
+                    raise HttpResponseError(message = f"Invalid index action '{action_type}'")
+                results.append(_get_indexing_result(key, True, 200 if action_type != "upload" else 201))
+        return results
+
+    def _put(self, key: str, doc: Dict[str, Any]) -> None:
+        stored = {}
+        for name, value in doc.items():
+            if name in self.vector_dims:
+                continue
+            if name in self.datetime_fields and value is not None:
+                value = get_canonical_time(value)
+            stored[name] = value
+        self._remove(key)
+        self.docs[key] = stored
+
+        row = self._free_rows.pop() if self._free_rows else self._num_rows
+        self._num_rows = max(self._num_rows, row + 1)
+        self._rows[key] = row
+        for name, matrix in self._vectors.items():
+            if row >= len(matrix):
+                matrix = np.concatenate([matrix, np.zeros_like(matrix)])
+                self._vectors[name] = matrix
+            vector = doc.get(name)
+            matrix[row] = np.asarray(vector, dtype = np.float32) if vector is not None else 0.0
+
+        terms = [t for f in self.searchable_fields for t in get_text_terms(stored.get(f) or "")]
+        for term, n in Counter(terms).items():
+            self._postings.setdefault(term, {})[key] = n
+        self._doc_terms[key] = len(terms)
+
+    def _remove(self, key: str) -> None:
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        row = self._rows.pop(key)
+        self._free_rows.append(row)
+        for name, matrix in self._vectors.items():
+            matrix[row] = 0.0
+        for term in set(t for f in self.searchable_fields for t in get_text_terms(doc.get(f) or "")):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        del self._doc_terms[key]
+
+    def _get_result(self, key: str, select: Optional[List[str]], score: float = 1.0, with_score: bool = True) -> Dict[str, Any]:
+        doc = self.docs[key]
+        result = {}
+        # Fields never set are returned as null, as by the service
+        for name in select if select is not None else self.field_names:
+            if name in self.vector_dims:
+                result[name] = self._vectors[name][self._rows[key]].tolist()
+            elif name in doc:
+                result[name] = copy.copy(doc[name])
+            else:
+                result[name] = None
+        if with_score:
+            result[_ScoreField] = score
+        return result
+
+    def search(self,
+               search_text: Optional[str] = None,
+               filter: Optional[str] = None,
+               select: Optional[List[str]] = None,
+               order_by: Optional[List[str]] = None,
+               top: Optional[int] = None,
+               skip: Optional[int] = None,
+               vector_queries: Optional[List[VectorizedQuery]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """ The results in order and the total count before skip/top """
+        predicate = compile_filter(filter)
+        if isinstance(select, str):
+            select = [s.strip() for s in select.split(",")]
+        with self._lock:
+            candidates = [k for k, d in self.docs.items() if predicate(d)]
+            rankings = []
+            if search_text and search_text.strip() not in ("", "*"):
+                rankings.append(self._keyword_search(search_text, candidates))
+            for vector_query in vector_queries or []:
+                rankings.append(self._vector_search(vector_query, candidates))
+
+            if not rankings:
+                scored = [(k, 1.0) for k in candidates]
+            elif len(rankings) == 1:
+                scored = rankings[0]
+            else:
+                fused: Dict[str, float] = {}
+                for ranking in rankings:
+                    for rank, (k, _) in enumerate(ranking, 1):
+                        fused[k] = fused.get(k, 0.0) + 1.0 / (HybridRrfK + rank)
+                scored = sorted(fused.items(), key = lambda ks: ks[1], reverse = True)
+
+            if order_by:
+                scored = self._sort(scored, order_by)
+            total_count = len(scored)
+            start = skip or 0
+            page = scored[start:start + top] if top is not None else scored[start:]
+            return [self._get_result(k, select, score) for k, score in page], total_count
+
+    def _keyword_search(self, search_text: str, candidates: List[str]) -> List[Tuple[str, float]]:
+        candidate_set = set(candidates)
+        n_docs = max(len(self.docs), 1)
+        avg_terms = max(sum(self._doc_terms.values()) / n_docs, 1.0)
+        scores: Dict[str, float] = {}
+        for term in set(get_text_terms(search_text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                if key in candidate_set:
+                    norm = Bm25K1 * (1 - Bm25B + Bm25B * self._doc_terms[key] / avg_terms)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (Bm25K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key = lambda ks: ks[1], reverse = True)
+
+    def _vector_search(self, vector_query: VectorizedQuery, candidates: List[str]) -> List[Tuple[str, float]]:
+        field = vector_query.fields or next(iter(self.vector_dims))
+        if field not in self.vector_dims or not isinstance(vector_query, VectorizedQuery):
+            raise HttpResponseError(message = f"Unsupported vector query on '{field}' - only VectorizedQuery on a vector field")
+        if not candidates:
+            return []
+        query = np.asarray(vector_query.vector, dtype = np.float32)
+        query_norm = np.linalg.norm(query)
+        rows = np.fromiter((self._rows[k] for k in candidates), dtype = np.int64, count = len(candidates))
+        vectors = self._vectors[field][rows]
+        norms = np.linalg.norm(vectors, axis = 1) * query_norm
+        similarity = np.divide(vectors @ query, norms, out = np.zeros(len(rows), dtype = np.float32), where = norms > 0)
+        k = min(vector_query.k_nearest_neighbors or 50, len(candidates))
+        top_rows = np.argpartition(-similarity, k - 1)[:k]
+        top_rows = top_rows[np.argsort(-similarity[top_rows], kind = 'stable')]
+        # The service's cosine score: 1 / (1 + cosine distance)
+        return [(candidates[i], float(1.0 / (2.0 - similarity[i]))) for i in top_rows]
+
+    def _sort(self, scored: List[Tuple[str, float]], order_by: List[str]) -> List[Tuple[str, float]]:
+        if isinstance(order_by, str):
+            order_by = order_by.split(",")
+        # Stable sorts from the last order field to the first
+        for clause in reversed(order_by):
+            parts = clause.split()
+            field, descending = parts[0], len(parts) > 1 and parts[1].lower() == "desc"
+            if field == "search.score()":
+                key = lambda ks: ks[1]
+            else:
+                # nulls sort first ascending
+                def key(ks, f = field):
+                    value = self.docs[ks[0]].get(f)
+                    return (value is not None, value if value is not None else 0)
+            scored = sorted(scored, key = key, reverse = descending)
+        return scored
+
+
+_local_search_indexes: Dict[str, LocalSearchIndex] = {}
+_local_search_indexes_lock = threading.Lock()
+
+def get_local_search_index(index_name: str) -> LocalSearchIndex:
+    with _local_search_indexes_lock:
+        index = _local_search_indexes.get(index_name)
+    if index is None:
+        raise ResourceNotFoundError(message = f"Index '{index_name}' not found")
+    return index
+
+
+class LocalSearchResults(list):
+    """ Search results with the parts of SearchItemPaged the callers use """
+
+    def __init__(self, results: List[Dict[str, Any]], count: Optional[int]) -> None:
+        super().__init__(results)
+        self._count = count
+
+    def get_count(self) -> Optional[int]:
+        return self._count
+
+    def by_page(self, continuation_token: Optional[str] = None):
+        return iter([iter(self)])
+
+
+class LocalIndexDocumentsResult:
+    def __init__(self, results: List[IndexingResult]) -> None:
+        self.results = results
+
+
+class LocalDocumentsOperations:
+    """ The documents operations of the generated client SearchClient wraps (SearchClient._client) -
+    IndexPayload sends serialized index batches through documents.index, here as to the service.
+    """
+
+    def __init__(self, index_name: str) -> None:
+        self._index_name = index_name
+
+    def index(self, batch: bytes, error_map: Optional[Dict[int, type]] = None, **kwargs) -> LocalIndexDocumentsResult:
+        if len(batch) > LocalMaxIndexRequestBytes:
+            raise (error_map or {}).get(413, HttpResponseError)(message = f"Request of {len(batch):,} bytes is too large")
+        return LocalIndexDocumentsResult(get_local_search_index(self._index_name).index_actions(orjson.loads(batch)["value"]))
+
+
+class AsyncLocalDocumentsOperations(LocalDocumentsOperations):
+    async def index(self, batch: bytes, error_map: Optional[Dict[int, type]] = None, **kwargs) -> LocalIndexDocumentsResult:
+        return super().index(batch, error_map, **kwargs)
+
+
+class LocalGeneratedClient:
+    def __init__(self, documents: LocalDocumentsOperations) -> None:
+        self.documents = documents
+
+
+class LocalSearchClient:
+    """ SearchClient on a LocalSearchIndex of this process """
+
+    def __init__(self, index_name: str) -> None:
+        self._index_name = index_name
+        self._client = LocalGeneratedClient(LocalDocumentsOperations(index_name))
+
+    def _merge_client_headers(self, headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+        return dict(headers or {})
+
+    def _get_index(self) -> LocalSearchIndex:
+        return get_local_search_index(self._index_name)
+
+    def search(self, search_text: Optional[str] = None, *,
+               filter: Optional[str] = None,
+               select: Optional[List[str]] = None,
+               order_by: Optional[List[str]] = None,
+               top: Optional[int] = None,
+               skip: Optional[int] = None,
+               include_total_count: bool = False,
+               vector_queries: Optional[List[VectorizedQuery]] = None,
+               **kwargs) -> LocalSearchResults:
+        results, count = self._get_index().search(search_text, filter, select, order_by, top, skip, vector_queries)
+        return LocalSearchResults(results, count if include_total_count else None)
+
+    def get_document(self, key: str, selected_fields: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        result = self._get_index().get(key, selected_fields)
+        del result[_ScoreField]
+        return result
+
+    def get_document_count(self, **kwargs) -> int:
+        return self._get_index().count()
+
+    def _index(self, documents: List[Dict[str, Any]], action: str) -> List[IndexingResult]:
+        return self._get_index().index_actions({**d, "@search.action": action} for d in documents)
+
+    def upload_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._index(documents, "upload")
+
+    def merge_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._index(documents, "merge")
+
+    def merge_or_upload_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._index(documents, "mergeOrUpload")
+
+    def delete_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        key_field = self._get_index().key_field
+        return self._index([{key_field: d[key_field]} for d in documents], "delete")
+
+    def index_documents(self, batch, **kwargs) -> List[IndexingResult]:
+        return self._get_index().index_actions(
+            {**a.additional_properties, "@search.action": a.action_type} for a in batch.actions)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "LocalSearchClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class AsyncLocalSearchResults:
+    """ Search results with the parts of the aio AsyncSearchItemPaged the callers use """
+
+    def __init__(self, results: LocalSearchResults) -> None:
+        self._results = results
+
+    def __aiter__(self):
+        async def iterate():
+            for r in self._results:
+                yield r
+        return iterate()
+
+    async def get_count(self) -> Optional[int]:
+        return self._results.get_count()
+
+
+class AsyncLocalSearchClient:
+    """ aio SearchClient on a LocalSearchIndex of this process """
+
+    def __init__(self, index_name: str) -> None:
+        self._sync_client = LocalSearchClient(index_name)
+        self._client = LocalGeneratedClient(AsyncLocalDocumentsOperations(index_name))
+
+    def _merge_client_headers(self, headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+        return dict(headers or {})
+
+    async def search(self, search_text: Optional[str] = None, **kwargs) -> AsyncLocalSearchResults:
+        return AsyncLocalSearchResults(self._sync_client.search(search_text, **kwargs))
+
+    async def get_document(self, key: str, selected_fields: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        return self._sync_client.get_document(key, selected_fields)
+
+    async def get_document_count(self, **kwargs) -> int:
+        return self._sync_client.get_document_count()
+
+    async def upload_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._sync_client.upload_documents(documents)
+
+    async def merge_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._sync_client.merge_documents(documents)
+
+    async def merge_or_upload_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._sync_client.merge_or_upload_documents(documents)
+
+    async def delete_documents(self, documents: List[Dict[str, Any]], **kwargs) -> List[IndexingResult]:
+        return self._sync_client.delete_documents(documents)
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalSearchIndexClient:
+    """ SearchIndexClient for the LocalSearchIndexes of this process """
+
+    def create_index(self, index: SearchIndex, **kwargs) -> SearchIndex:
+        with _local_search_indexes_lock:
+            if index.name in _local_search_indexes:
+                raise HttpResponseError(message = f"Index '{index.name}' already exists")
+            _local_search_indexes[index.name] = LocalSearchIndex(index)
+        log_info(f"LocalSearchIndexClient: created index '{index.name}'")
+        return index
+
+    def create_or_update_index(self, index: SearchIndex, **kwargs) -> SearchIndex:
+        with _local_search_indexes_lock:
+            existing = _local_search_indexes.get(index.name)
+            if existing is None:
+                _local_search_indexes[index.name] = LocalSearchIndex(index)
+                log_info(f"LocalSearchIndexClient: created index '{index.name}'")
+                return index
+        existing.set_schema(index)
+        return index
+
+    def get_index(self, name: str, **kwargs) -> SearchIndex:
+        return get_local_search_index(name).index
+
+    def list_index_names(self, **kwargs) -> List[str]:
+        with _local_search_indexes_lock:
+            return list(_local_search_indexes.keys())
+
+    def list_indexes(self, **kwargs) -> List[SearchIndex]:
+        with _local_search_indexes_lock:
+            return [i.index for i in _local_search_indexes.values()]
+
+    def delete_index(self, index: str|SearchIndex, **kwargs) -> None:
+        name = index if isinstance(index, str) else index.name
+        with _local_search_indexes_lock:
+            _local_search_indexes.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+
+class LocalVectorStore(VectorStore):
+    """ The langchain AzureSearch vector store over a LocalSearchIndex - the same search types
+    and result documents, with .client the LocalSearchClient.
+    Creates the index if it doesn't exist, as AzureSearch does.
+    """
+
+    def __init__(self,
+                 index_name: str,
+                 fields: List[Any],
+                 embedding_function: Callable[[str], List[float]],
+                 content_field: str,
+                 vector_field: str,
+                 search_type: str = "hybrid") -> None:
+        index_client = LocalSearchIndexClient()
+        if index_name not in index_client.list_index_names():
+            index_client.create_index(SearchIndex(name = index_name, fields = fields))
+        self.client = LocalSearchClient(index_name)
+        self.embedding_function = embedding_function
+        self.content_field = content_field
+        self.vector_field = vector_field
+        self.search_type = search_type
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        key_field = get_local_search_index(self.client._index_name).key_field
+        docs = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            docs.append({key_field: str(uuid.uuid4()), **metadata,
+                         self.content_field: text, self.vector_field: self.embedding_function(text)})
+        self.client.upload_documents(docs)
+        return [d[key_field] for d in docs]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "LocalVectorStore":
+        vector_store = cls(embedding_function = embedding.embed_query, **kwargs)
+        vector_store.add_texts(texts, metadatas)
+        return vector_store
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        search_type = kwargs.get("search_type", self.search_type)
+        if search_type == "similarity":
+            docs_and_scores = self.vector_search_with_score(query, k = k, filters = kwargs.get("filters"))
+        elif search_type in ("hybrid", "semantic_hybrid"):
+            # No semantic ranker locally
+            docs_and_scores = self.hybrid_search_with_score(query, k = k, filters = kwargs.get("filters"))
+        else:
+            raise ValueError(f"search_type of {search_type} not allowed.")
+        return [doc for doc, _ in docs_and_scores]
+
+    def vector_search_with_score(self, query: str, k: int = 4, filters: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return self._search_with_score("", query, k, filters)
+
+    def hybrid_search_with_score(self, query: str, k: int = 4, filters: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return self._search_with_score(query, query, k, filters)
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        score_threshold = kwargs.pop("score_threshold", None)
+        result = self.vector_search_with_score(query, k = k, filters = kwargs.get("filters"))
+        return result if score_threshold is None else [r for r in result if r[1] >= score_threshold]
+
+    def _search_with_score(self, search_text: str, query: str, k: int, filters: Optional[str]) -> List[Tuple[Document, float]]:
+        results = self.client.search(
+            search_text = search_text,
+            vector_queries = [VectorizedQuery(vector = self.embedding_function(query),
+                                              k_nearest_neighbors = k, fields = self.vector_field)],
+            filter = filters,
+            # As ProjectedAzureSearch - the vectors aren't returned
+            select = [n for n in get_local_search_index(self.client._index_name).field_names if n != self.vector_field],
+            top = k,
+        )
+        return [
+            (Document(page_content = result.pop(self.content_field),
+                      metadata = {n: v for n, v in result.items() if n != self.vector_field}),
+             float(result[_ScoreField]))
+            for result in results
+        ]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: score
@@ -0,0 +1,187 @@
+import re
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import dateutil.parser
+from azure.core.exceptions import HttpResponseError
+
+# The subset of the Azure AI Search OData filter syntax the copilot builds - see get_search_filter,
+#  AzureAiIndexOps.get_find_index_docs_filter and the RAG search filters:
+#   comparisons (eq ne gt ge lt le) with strings, numbers, booleans, null and datetimes,
+#   and/or/not, parentheses, bare boolean fields, search.in(field, 'values'[, 'delimiters'])
+#   and Collection/any(v: ...) / Collection/all(v: ...)
+
+_TokenRegex = re.compile(r"""
+    \s*(?:
+      (?P<string>'(?:[^']|'')*')
+    | (?P<datetime>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:\d{2})?)
+    | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<name>[A-Za-z_][\w.]*(?:/[A-Za-z_]\w*)?)
+    | (?P<punct>[(),:])
+    )""", re.VERBOSE)
+
+def _ordered(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    # null and values of another type are never greater or less than anything
+    def ordered(a, b):
+        try:
+            return a is not None and b is not None and compare(a, b)
+        except TypeError:
+            return False
+    return ordered
+
+_Comparisons: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "gt": _ordered(lambda a, b: a > b),
+    "ge": _ordered(lambda a, b: a >= b),
+    "lt": _ordered(lambda a, b: a < b),
+    "le": _ordered(lambda a, b: a <= b),
+}
+
+_Literals = {"null": None, "true": True, "false": False}
+
+# A compiled filter - takes the document and the lambda variables in scope
+DocPredicate = Callable[[Dict[str, Any], Dict[str, Any]], bool]
+
+
+def get_canonical_time(value: datetime|str) -> str:
+    """ The form datetimes are stored and compared in - fixed width UTC, so they sort as strings """
+    if isinstance(value, str):
+        value = dateutil.parser.isoparse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo = timezone.utc)
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _invalid_filter(filter: str, reason: str) -> HttpResponseError:
+    # The service rejects invalid filters with a 400
+    return HttpResponseError(message = f"Invalid expression: {reason} in filter '{filter}'")
+
+
+class _Parser:
+
+    def __init__(self, filter: str) -> None:
+        self.filter = filter
+        self.tokens: List[tuple[str, Any]] = []
+        pos = 0
+        filter = filter.rstrip()
+        while pos < len(filter):
+            m = _TokenRegex.match(filter, pos)
+            if not m or m.end() == pos:
+                raise _invalid_filter(self.filter, f"unexpected character at {pos}")
+            kind = m.lastgroup
+            text = m.group(kind)
+            if kind == "string":
+                self.tokens.append(("value", text[1:-1].replace("''", "'")))
+            elif kind == "datetime":
+                self.tokens.append(("value", get_canonical_time(text)))
+            elif kind == "number":
+                self.tokens.append(("value", float(text) if re.search(r"[.eE]", text) else int(text)))
+            elif kind == "name" and text in _Literals:
+                self.tokens.append(("value", _Literals[text]))
+            else:
+                self.tokens.append((kind, text))
+            pos = m.end()
+        self.pos = 0
+
+    def peek(self, kind: str = None, text: str = None) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        k, t = self.tokens[self.pos]
+        return (kind is None or k == kind) and (text is None or t == text)
+
+    def next(self, kind: str = None, text: str = None) -> Any:
+        if not self.peek(kind, text):
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else "end of filter"
+            raise _invalid_filter(self.filter, f"expected {text or kind}, found '{found}'")
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def parse(self) -> DocPredicate:
+        predicate = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise _invalid_filter(self.filter, f"unexpected '{self.tokens[self.pos][1]}'")
+        return predicate
+
+    def parse_or(self) -> DocPredicate:
+        terms = [self.parse_and()]
+        while self.peek("name", "or"):
+            self.next()
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else lambda d, v: any(t(d, v) for t in terms)
+
+    def parse_and(self) -> DocPredicate:
+        terms = [self.parse_unary()]
+        while self.peek("name", "and"):
+            self.next()
+            terms.append(self.parse_unary())
+        return terms[0] if len(terms) == 1 else lambda d, v: all(t(d, v) for t in terms)
+
+    def parse_unary(self) -> DocPredicate:
+        if self.peek("name", "not"):
+            self.next()
+            term = self.parse_unary()
+            return lambda d, v: not term(d, v)
+        if self.peek("punct", "("):
+            self.next()
+            term = self.parse_or()
+            self.next("punct", ")")
+            return term
+        if self.peek("value"):
+            value = self.next()
+            return lambda d, v: value is True
+        if self.peek("name", "search.in"):
+            return self.parse_search_in()
+
+        name = self.next("name")
+        if "/" in name:
+            return self.parse_collection(name)
+        get = self.get_accessor(name)
+        if self.peek("name") and self.tokens[self.pos][1] in _Comparisons:
+            compare = _Comparisons[self.next()]
+            value = self.next("value")
+            return lambda d, v: compare(get(d, v), value)
+        # A bare boolean field
+        return lambda d, v: get(d, v) is True
+
+    def parse_search_in(self) -> DocPredicate:
+        self.next()
+        self.next("punct", "(")
+        get = self.get_accessor(self.next("name"))
+        self.next("punct", ",")
+        values = self.next("value")
+        delimiters = " ,"
+        if self.peek("punct", ","):
+            self.next()
+            delimiters = self.next("value")
+        self.next("punct", ")")
+        value_set = set(s for s in re.split(f"[{re.escape(delimiters)}]", values) if s)
+        return lambda d, v: get(d, v) in value_set
+
+    def parse_collection(self, name: str) -> DocPredicate:
+        field, op = name.split("/")
+        if op not in ("any", "all"):
+            raise _invalid_filter(self.filter, f"unsupported collection operator '{op}'")
+        get = self.get_accessor(field)
+        self.next("punct", "(")
+        if self.peek("punct", ")"):
+            self.next()
+            return lambda d, v: bool(get(d, v))
+        var = self.next("name")
+        self.next("punct", ":")
+        term = self.parse_or()
+        self.next("punct", ")")
+        match = any if op == "any" else all
+        return lambda d, v: match(term(d, {**v, var: x}) for x in (get(d, v) or []))
+
+    def get_accessor(self, name: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+        return lambda d, v: v[name] if name in v else d.get(name)
+
+
+def compile_filter(filter: str|None) -> Callable[[Dict[str, Any]], bool]:
+    """ A predicate for the documents an OData filter matches - raises HttpResponseError
+    for filters that aren't valid (or use syntax the local backend doesn't support) """
+    if not filter or not filter.strip():
+        return lambda d: True
+    predicate = _Parser(filter).parse()
+    return lambda d: predicate(d, {})